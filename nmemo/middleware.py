@@ -5,9 +5,18 @@ Railsのように標準出力にHTTPリクエスト情報を表示
 from django.utils import timezone
 import sys
 
+from pages.infrastructure.unit_of_work import unit_of_work
+
 
 class RequestLoggingMiddleware:
-    """HTTPリクエスト情報を標準出力に表示するミドルウェア"""
+    """HTTPリクエスト情報を標準出力に表示するミドルウェア
+    
+    ファイルを送る本文（multipart・分割アップロードのチャンク）は読み込まない。
+    ここで読み込むと本文全体がメモリに載り、ビューのアップロードハンドラーやチャンクの
+    .part ファイルへの書き込みがストリームで受け取れなくなる。
+    """
+    
+    STREAMED_CONTENT_TYPES = ('multipart/form-data', 'application/octet-stream')
     
     def __init__(self, get_response):
         self.get_response = get_response
@@ -27,8 +36,10 @@ class RequestLoggingMiddleware:
             for key, value in request.GET.items():
                 print(f"  {key}: {value}")
         
+        streamed = request.content_type in self.STREAMED_CONTENT_TYPES
+        
         # POSTパラメーター
-        if request.POST:
+        if not streamed and request.POST:
             print("POST Parameters:")
             for key, value in request.POST.items():
                 # 長すぎる場合は省略
@@ -40,7 +51,7 @@ class RequestLoggingMiddleware:
         # リクエストボディ（JSON等）
         # 注意: request.bodyにアクセスすると、他のミドルウェアがbodyを読み込んだ後は例外が発生する
         # そのため、try-exceptで囲んで、エラー時は無視する
-        if request.content_type:
+        if request.content_type and not streamed:
             content_type = request.content_type
             try:
                 if hasattr(request, 'body') and request.body:
@@ -76,3 +87,16 @@ class RequestLoggingMiddleware:
         
         return response
 
+
+class UnitOfWorkMiddleware:
+    """リクエストの間に登録されたページの変更を、応答を返す前にまとめて書き込むミドルウェア
+    
+    サービスは変更をリポジトリに登録するだけにし、書き込み（flush）はここで1回だけ行う。
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with unit_of_work():
+            return self.get_response(request)
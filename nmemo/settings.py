@@ -58,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'nmemo.middleware.UnitOfWorkMiddleware',  # ページの変更をリクエストの終わりにまとめて書き込む
 ]
 
 # ルート URL 設定モジュール
@@ -140,6 +141,60 @@ if os.path.exists(BOX_PATH):
 else:
     MEDIA_ROOT = BASE_DIR / 'media'
 
+# ページごとのメディアフォルダの配置
+# 'hierarchical'（既定）: uploads/{order}_page_{id}_{タイトル}/ をページ階層どおりに入れ子にする
+# 'id': uploads/pages/{id}/ に固定する（タイトル変更・並び替え・移動でフォルダのリネームやURLの書き換えが発生しない）
+#       人が読める階層構造は `python manage.py export_media_tree <出力先>` で別途書き出す
+PAGE_MEDIA_LAYOUT = os.getenv('PAGE_MEDIA_LAYOUT', 'hierarchical')
+
+# アップロードされたファイルを内容のハッシュで1回だけ保存する（uploads/blobs/、同じ画像を複数のページに貼っても1ファイル）
+# 参照数はメディア参照表で数え、最後に参照していたページから外れた時点で削除する
+MEDIA_DEDUP = os.getenv('MEDIA_DEDUP', 'False') == 'True'
+# アップロードされてからこの秒数の間は、どのページからも参照されていなくても削除しない（保存前の編集中の参照を守る）
+MEDIA_DEDUP_GRACE_SECONDS = int(os.getenv('MEDIA_DEDUP_GRACE_SECONDS', str(24 * 60 * 60)))
+
+# 分割・再開可能なアップロード（/api/uploads/）でクライアントに勧めるチャンクのサイズと、1回に受け付ける上限
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', str(32 * 1024 * 1024)))
+# この時間以上更新されていない分割アップロードは `python manage.py cleanup_temp_files` で中止する
+UPLOAD_SESSION_EXPIRY_HOURS = int(os.getenv('UPLOAD_SESSION_EXPIRY_HOURS', '24'))
+
+# /media/uploads/ の配信（pages.views.serve_media。Range・ETag に対応）
+# ブラウザにキャッシュさせる秒数（blob は内容が変わらないため常に1年）
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', str(24 * 60 * 60)))
+# 'x-accel-redirect'（nginx）/ 'x-sendfile'（Apache の mod_xsendfile など）を指定すると、ファイルの送信を前段のサーバーに任せる
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')
+# X-Accel-Redirect で使う nginx の internal な location（MEDIA_ROOT を指すようにする）
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# ページのHTML版（画像を埋め込んだ単体のHTML）の書き出し方法
+# 'queue'（既定）: 保存時は待ち行列（HtmlExportTask）に登録するだけにし、バックグラウンドのワーカーが書き出す
+#                  同じページへの連続した保存は1回の書き出しにまとまる
+# 'sync': 保存のたびにその場で書き出す
+HTML_EXPORT_MODE = os.getenv('HTML_EXPORT_MODE', 'queue')
+# 待ち行列を処理するワーカーをどこで動かすか
+# 'auto'（既定）: `python manage.py process_html_exports --loop` が動いている間はそれに任せ、
+#                 動いていなければサーバープロセス内のスレッドで処理する
+# 'True': 常にサーバープロセス内のスレッドで処理する（runserver など1プロセスで動かす場合のみ）
+# 'False': サーバープロセスでは処理しない（process_html_exports を必ず別に動かす）
+# 複数のプロセスでサーバーを動かす場合は、SQLite への書き込みの競合（database is locked）を避けるため
+# process_html_exports --loop を1つだけ動かすこと
+HTML_EXPORT_IN_PROCESS_WORKER = os.getenv('HTML_EXPORT_IN_PROCESS_WORKER', 'auto')
+# process_html_exports --loop が動いていることを記録するファイル（'auto' の判断に使う）
+HTML_EXPORT_WORKER_HEARTBEAT_FILE = os.getenv(
+    'HTML_EXPORT_WORKER_HEARTBEAT_FILE', str(BASE_DIR / '.html_export_worker')
+)
+# 未処理の要求がこの件数以上ある場合は、登録せずにその場で書き出す（書き出しが追いつかない間は保存側を待たせる）
+HTML_EXPORT_QUEUE_MAX_PENDING = int(os.getenv('HTML_EXPORT_QUEUE_MAX_PENDING', '200'))
+# 書き出しに失敗した場合の再試行回数と、初回の再試行までの秒数（以降は倍々に延ばす）
+HTML_EXPORT_MAX_ATTEMPTS = int(os.getenv('HTML_EXPORT_MAX_ATTEMPTS', '5'))
+HTML_EXPORT_RETRY_DELAY = float(os.getenv('HTML_EXPORT_RETRY_DELAY', '5'))
+# HTML書き出し時に画像を base64 にした結果のキャッシュ（プロセス内で共有、古いものから追い出す）
+HTML_EXPORT_IMAGE_CACHE_MAX_BYTES = int(os.getenv('HTML_EXPORT_IMAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# 追い出したエントリをディスクに退避する場合の退避先と上限（既定は退避しない）
+HTML_EXPORT_IMAGE_CACHE_SPILL_DIR = os.getenv('HTML_EXPORT_IMAGE_CACHE_SPILL_DIR') or None
+HTML_EXPORT_IMAGE_CACHE_MAX_SPILL_BYTES = int(os.getenv('HTML_EXPORT_IMAGE_CACHE_MAX_SPILL_BYTES', str(512 * 1024 * 1024)))
+
 # 既定の主キー型
 # ドキュメント: https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -158,6 +213,9 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
+        'pages_console': {
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.db.backends': {
@@ -165,5 +223,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        # pages アプリのログ（PAGES_LOG_LEVEL=DEBUG でフォルダ検索などの詳細も出力する）
+        'pages': {
+            'handlers': ['pages_console'],
+            'level': os.getenv('PAGES_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
     },
 }
@@ -0,0 +1,178 @@
+"""分割・再開可能なアップロード"""
+
+import os
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO, Optional
+from django.conf import settings
+from django.utils import timezone
+
+from ...domain.repositories import PageRepositoryInterface, UploadSessionRepositoryInterface
+from ...domain.upload_session import UploadSessionEntity
+from ...infrastructure.repositories import PageRepository, UploadSessionRepository
+from .media_blob_store import MediaBlobStore
+from .media_service import MediaService
+from .upload_name_allocator import UploadNameAllocator
+
+
+class UploadOffsetMismatch(Exception):
+    """チャンクの開始位置がサーバーの受信済みの位置と一致しない"""
+
+    def __init__(self, offset: int):
+        super().__init__(f'受信済みの位置は {offset} バイトです')
+        self.offset = offset
+
+
+class UploadSessionGone(Exception):
+    """セッションの一時ファイルが失われた（保存先のページが削除された場合など）"""
+
+
+class ChunkedUploadService:
+    """
+    大きなファイルを分割して受け取り、途中で切断されても続きから再開できるようにするサービス
+
+    1. create: セッションを作成し、保存先フォルダに空の一時ファイル（.{upload_id}.part）を作る
+    2. append: offset から始まるチャンクを一時ファイルにそのまま書き込む（リクエスト本文を読みながら書くため、
+       ファイル全体を一時領域に溜めてからコピーし直すことはない）。切断された場合も書き込めた分だけ位置を進める
+    3. 最後のチャンクを受け取ったら一時ファイルを保存するファイル名に置き換える
+       （MEDIA_DEDUP が有効なら blob として取り込む）
+
+    保存先は temp_uploads/（ページ作成前）またはページのフォルダで、チャンクのたびにページIDから求め直すため、
+    アップロード中にページのフォルダが移動・リネームされても続けられる。
+    """
+
+    TEMP_FOLDER = 'temp_uploads'
+    PART_SUFFIX = '.part'
+    COPY_BUFFER_SIZE = 256 * 1024
+
+    def __init__(
+        self,
+        session_repository: Optional[UploadSessionRepositoryInterface] = None,
+        repository: Optional[PageRepositoryInterface] = None,
+        media_service: Optional[MediaService] = None,
+        blob_store: Optional[MediaBlobStore] = None
+    ):
+        self.session_repository = session_repository or UploadSessionRepository()
+        self.repository = repository or PageRepository()
+        self.media_service = media_service or MediaService(self.repository)
+        self.blob_store = blob_store or MediaBlobStore(self.repository)
+        self.name_allocator = UploadNameAllocator()
+        self.uploads_dir = Path(settings.MEDIA_ROOT) / 'uploads'
+
+    @property
+    def chunk_size(self) -> int:
+        """クライアントに勧めるチャンクのサイズ"""
+        return getattr(settings, 'UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+    @property
+    def max_chunk_size(self) -> int:
+        """1回のリクエストで受け付けるチャンクの上限"""
+        return getattr(settings, 'UPLOAD_CHUNK_MAX_BYTES', 32 * 1024 * 1024)
+
+    def get_folder_path(self, page_id: Optional[int]) -> str:
+        """保存先フォルダの uploads/ からの相対パス（"/" 区切り）"""
+        if page_id is None:
+            return self.TEMP_FOLDER
+        return str(self.media_service.get_page_folder_path_by_id(page_id)).replace('\\', '/')
+
+    def get_part_path(self, session: UploadSessionEntity) -> Path:
+        """セッションの一時ファイルの絶対パス"""
+        return self.uploads_dir / self.get_folder_path(session.page_id) / f'.{session.upload_id}{self.PART_SUFFIX}'
+
+    def create(self, kind: str, page_id: Optional[int], filename: str, original_name: str, size: int) -> UploadSessionEntity:
+        """セッションを作成し、保存先フォルダに空の一時ファイルを作る"""
+        session = self.session_repository.create(UploadSessionEntity(
+            upload_id='', kind=kind, page_id=page_id, filename=filename, original_name=original_name, size=size
+        ))
+        part_path = self.get_part_path(session)
+        try:
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            part_path.touch()
+        except OSError:
+            self.session_repository.delete(session.upload_id)
+            raise
+        return session
+
+    def find(self, upload_id: str) -> Optional[UploadSessionEntity]:
+        return self.session_repository.find(upload_id)
+
+    def append(self, session: UploadSessionEntity, offset: int, stream: BinaryIO, length: int) -> UploadSessionEntity:
+        """offset から length バイトのチャンクを一時ファイルに書き込み、更新後のセッションを返す
+
+        最後のチャンクであればファイルを組み立てる（戻り値の completed_path が設定される）。
+        """
+        if session.is_complete:
+            raise UploadOffsetMismatch(session.size)
+        if offset != session.offset:
+            raise UploadOffsetMismatch(session.offset)
+        if length < 0 or offset + length > session.size:
+            raise ValueError('チャンクがファイルサイズを超えています')
+        if length > self.max_chunk_size:
+            raise ValueError(f'チャンクは{self.max_chunk_size // (1024 * 1024)}MB以下にしてください')
+
+        part_path = self.get_part_path(session)
+        if not part_path.is_file():
+            self.session_repository.delete(session.upload_id)
+            raise UploadSessionGone(f'アップロード中のファイルが見つかりません: {part_path.name}')
+
+        written = 0
+        try:
+            with open(part_path, 'r+b') as f:
+                f.seek(offset)
+                while written < length:
+                    data = stream.read(min(self.COPY_BUFFER_SIZE, length - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+                # 以前の試行で書きかけた部分が残らないよう、受信済みの位置で切り詰める
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            # 切断された場合も、書き込めた分は次のチャンクで続きから送れるように記録し、元の例外をそのまま投げる
+            if written:
+                self.session_repository.advance(session.upload_id, offset, offset + written)
+            raise
+        
+        if written and not self.session_repository.advance(session.upload_id, offset, offset + written):
+            raise UploadOffsetMismatch(self.session_repository.find(session.upload_id).offset)
+
+        session.offset = offset + written
+        if session.offset == session.size:
+            session.completed_path = self._assemble(session, part_path)
+            self.session_repository.complete(session.upload_id, session.completed_path)
+        return session
+
+    def abort(self, session: UploadSessionEntity) -> None:
+        """セッションを中止し、一時ファイルを削除する"""
+        if not session.is_complete:
+            self.get_part_path(session).unlink(missing_ok=True)
+        self.session_repository.delete(session.upload_id)
+
+    def expire_stale(self, max_age: timedelta, dry_run: bool = False) -> int:
+        """max_age 以上更新されていないセッションを削除し（未完了なら一時ファイルも削除する）、件数を返す"""
+        stale_sessions = self.session_repository.find_updated_before(timezone.now() - max_age)
+        if not dry_run:
+            for session in stale_sessions:
+                try:
+                    self.abort(session)
+                except OSError as e:
+                    print(f"Warning: Failed to remove upload {session.upload_id}: {e}")
+        return len(stale_sessions)
+
+    def _assemble(self, session: UploadSessionEntity, part_path: Path) -> str:
+        """受信し終えた一時ファイルを保存するファイルにし、MEDIA_ROOT からの相対パスを返す"""
+        ext = os.path.splitext(session.filename)[1]
+        if self.blob_store.enabled:
+            return self.blob_store.adopt(part_path, ext)
+
+        folder_path = self.get_folder_path(session.page_id)
+        # 同じ名前のファイルがあれば番号を付けた名前を原子的に確保し、一時ファイルで置き換える
+        saved_path = self.name_allocator.reserve(part_path.parent, session.filename)
+        try:
+            os.replace(part_path, saved_path)
+        except OSError:
+            saved_path.unlink(missing_ok=True)
+            raise
+        return f'uploads/{folder_path}/{saved_path.name}'
@@ -0,0 +1,51 @@
+"""コンテンツ内のメディアURL書き換え"""
+
+import re
+from typing import Dict, Optional
+
+from ...domain.page_aggregate import ContentScanner, ContentReference
+
+
+class ContentUrlRewriter:
+    """
+    フォルダが移動・リネームされたページのメディアURLを書き換える
+
+    対象ページ（ページID -> 新しいフォルダの相対パス）をまとめた1つの正規表現を作り、
+    ContentScanner で抽出したURL属性（src/href）ごとに照合して、全ページ分のURLを書き換える。
+    http://host/media/... の形式は /media/ 以降だけを書き換える。
+
+    対象のURL形式:
+    - /media/uploads/page_{id}/filename（古い形式）
+    - /media/uploads/{任意のパス}/{order}_page_{id}_{タイトル}/filename（現在の形式）
+
+    1つのURLに対象ページのフォルダが複数含まれる場合（親子がともに移動した場合など）は、
+    最も深いフォルダを基準に置き換える（そのフォルダの新しいパスが祖先の新しいパスを含むため）。
+    """
+
+    def __init__(self, folder_paths: Dict[int, str]):
+        self.folder_paths = {int(page_id): path for page_id, path in folder_paths.items()}
+        self.pattern = None
+        if self.folder_paths:
+            ids = '|'.join(str(page_id) for page_id in sorted(self.folder_paths, reverse=True))
+            self.pattern = re.compile(
+                rf'/media/uploads/'
+                rf'(?:page_(?P<legacy>{ids})/'
+                rf'|(?:[^/"\'<>]+/)*\d+_page_(?P<current>{ids})_[^/"\'<>]+/)'
+                rf'(?P<rest>.+)',
+                re.IGNORECASE
+            )
+
+    def _replace(self, reference: ContentReference) -> Optional[str]:
+        if reference.media_url is None:
+            return None
+        match = self.pattern.match(reference.media_url)
+        if match is None:
+            return None
+        page_id = int(match.group('legacy') or match.group('current'))
+        return reference.with_media_url(f'/media/uploads/{self.folder_paths[page_id]}/{match.group("rest")}')
+
+    def rewrite(self, content: str) -> str:
+        """コンテンツ内の対象URLを書き換えた結果を返す（対象がなければそのまま返す）"""
+        if not content or self.pattern is None:
+            return content
+        return ContentScanner.scan(content).rewrite(content, self._replace)
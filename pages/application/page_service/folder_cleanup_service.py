@@ -1,15 +1,19 @@
 """フォルダクリーンアップを担当するサービス"""
 
+import logging
 import os
 import re
 import shutil
 import traceback
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional
+from ...domain.page_aggregate import PageEntity
 from ...domain.repositories import PageRepositoryInterface
 from .media_service import MediaService
 from .folder_move_service import FolderMoveService
 
+logger = logging.getLogger(__name__)
+
 
 class FolderCleanupService:
     """フォルダクリーンアップを担当するサービス"""
@@ -24,7 +28,7 @@ class FolderCleanupService:
         self.media_service = media_service
         self.move_service = move_service  # FolderMoveServiceを使用
     
-    def cleanup_old_folder(self, old_title: str, entity: 'PageEntity', entity_cache: Optional[Dict[int, 'PageEntity']] = None) -> None:
+    def cleanup_old_folder(self, old_title: str, entity: 'PageEntity') -> None:
         """タイトル変更時に古いフォルダをクリーンアップ"""
         try:
             # 古いフォルダ名を計算
@@ -33,18 +37,11 @@ class FolderCleanupService:
             
             # 新しいフォルダパスを取得
             if entity.parent_id:
-                # キャッシュから親エンティティを取得、なければDBから取得
-                parent_entity = None
-                if entity_cache:
-                    parent_entity = entity_cache.get(entity.parent_id)
-                
-                if parent_entity is None:
-                    parent_entity = self.repository.find_by_id(entity.parent_id)
-                    if parent_entity and entity_cache is not None:
-                        entity_cache[entity.parent_id] = parent_entity
+                # 親エンティティを取得（同一リクエスト内の再取得はアイデンティティマップで解決される）
+                parent_entity = self.repository.find_by_id(entity.parent_id)
                 
                 if parent_entity:
-                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity)
                     
                     if not parent_folder.exists() or not parent_folder.is_dir():
                         print(f"ERROR: Parent folder does not exist for page {entity.id}")
@@ -64,18 +61,11 @@ class FolderCleanupService:
             # 古いフォルダパスを計算
             old_folder = None
             if entity.parent_id:
-                # キャッシュから親エンティティを取得（既に取得済みの可能性がある）
-                parent_entity = None
-                if entity_cache:
-                    parent_entity = entity_cache.get(entity.parent_id)
-                
-                if parent_entity is None:
-                    parent_entity = self.repository.find_by_id(entity.parent_id)
-                    if parent_entity and entity_cache is not None:
-                        entity_cache[entity.parent_id] = parent_entity
+                # 親エンティティを取得（既に取得済みならアイデンティティマップから返される）
+                parent_entity = self.repository.find_by_id(entity.parent_id)
                 
                 if parent_entity:
-                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity)
                     
                     if not parent_folder.exists() or not parent_folder.is_dir():
                         print(f"ERROR: Parent folder does not exist for old folder calculation")
@@ -134,7 +124,7 @@ class FolderCleanupService:
         except Exception as e:
             print(f"Warning: Failed to cleanup orphaned old folders: {e}")
     
-    def cleanup_misplaced_folders_after_save(self, entity: 'PageEntity', entity_cache: Optional[Dict[int, 'PageEntity']] = None) -> None:
+    def cleanup_misplaced_folders_after_save(self, entity: 'PageEntity') -> None:
         """保存後に親階層に誤って作成されたフォルダを削除"""
         try:
             new_safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
@@ -142,18 +132,11 @@ class FolderCleanupService:
             
             # 正しい新しいフォルダのパスを取得
             if entity.parent_id:
-                # キャッシュから親エンティティを取得、なければDBから取得
-                parent_entity = None
-                if entity_cache:
-                    parent_entity = entity_cache.get(entity.parent_id)
-                
-                if parent_entity is None:
-                    parent_entity = self.repository.find_by_id(entity.parent_id)
-                    if parent_entity and entity_cache is not None:
-                        entity_cache[entity.parent_id] = parent_entity
+                # 親エンティティを取得（同一リクエスト内の再取得はアイデンティティマップで解決される）
+                parent_entity = self.repository.find_by_id(entity.parent_id)
                 
                 if parent_entity:
-                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity)
                     correct_new_folder_path = parent_folder / new_folder_name
                 else:
                     print(f"ERROR: Parent entity not found for page {entity.id}")
@@ -190,18 +173,11 @@ class FolderCleanupService:
             
             # 親フォルダの直下を明示的にチェック
             if entity.parent_id:
-                # キャッシュから親エンティティを取得（既に取得済みの可能性がある）
-                parent_entity = None
-                if entity_cache:
-                    parent_entity = entity_cache.get(entity.parent_id)
-                
-                if parent_entity is None:
-                    parent_entity = self.repository.find_by_id(entity.parent_id)
-                    if parent_entity and entity_cache is not None:
-                        entity_cache[entity.parent_id] = parent_entity
+                # 親エンティティを取得（既に取得済みならアイデンティティマップから返される）
+                parent_entity = self.repository.find_by_id(entity.parent_id)
                 
                 if parent_entity:
-                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity)
                     
                     if parent_folder.exists() and parent_folder.is_dir():
                         misplaced_in_parent = parent_folder / new_folder_name
@@ -229,7 +205,8 @@ class FolderCleanupService:
                             else:
                                 print(f"Folder in parent is correct location, not removing")
             
-            # 再帰的に検索
+            # 対応表に記録された所在が正しい場所と異なる場合はそのフォルダを、
+            # 登録がない場合のみ uploads/ を再帰的に検索する
             misplaced_folders = []
             
             def find_misplaced_folders(base_dir: Path, depth: int = 0):
@@ -250,7 +227,12 @@ class FolderCleanupService:
                 except Exception as e:
                     print(f"Warning: Error searching for misplaced folders: {e}")
             
-            find_misplaced_folders(self.media_service.uploads_dir)
+            recorded_folder = self.media_service._find_recorded_page_folder(entity.id)
+            if recorded_folder is None:
+                logger.debug("Folder of page %s is not in the manifest, searching uploads/ for misplaced folders", entity.id)
+                find_misplaced_folders(self.media_service.uploads_dir)
+            elif recorded_folder.name == new_folder_name and recorded_folder.resolve() != correct_new_folder_resolved:
+                misplaced_folders.append(recorded_folder)
             
             # 誤配置されたフォルダを削除
             for folder in misplaced_folders:
@@ -277,7 +259,7 @@ class FolderCleanupService:
             print(f"Warning: Failed to cleanup misplaced folders after save: {e}")
             traceback.print_exc()
     
-    def cleanup_orphaned_folders_in_parent(self, parent_id: Optional[int], entity_cache: Optional[Dict[int, 'PageEntity']] = None) -> None:
+    def cleanup_orphaned_folders_in_parent(self, parent_id: Optional[int]) -> None:
         """親フォルダ内のDBに存在しない孤立フォルダを削除する"""
         try:
             # 全ページを取得する代わりに、親フォルダ内のページIDだけを取得
@@ -288,40 +270,31 @@ class FolderCleanupService:
                 # 親自身も含める（親エンティティの実体は不要なので、IDだけ追加）
                 existing_page_ids.add(parent_id)
             else:
-                # ルートページをentity_cacheから取得、なければ取得
-                if entity_cache:
-                    root_page_ids = {eid for eid, e in entity_cache.items() if e.parent_id is None}
-                    if root_page_ids:
-                        existing_page_ids = root_page_ids
-                    else:
-                        root_pages = self.repository.find_all_root_pages()
-                        existing_page_ids = {page.id for page in root_pages}
+                # ルートページをすべて取得（読み込み済みのページはアイデンティティマップの実体が返る）
+                existing_page_ids = {page.id for page in self.repository.find_all_root_pages()}
             
             parent_folder = None
             if parent_id:
-                # キャッシュから親エンティティを取得、なければDBから取得
-                parent_entity = None
-                if entity_cache:
-                    parent_entity = entity_cache.get(parent_id)
-                
-                if parent_entity is None:
-                    print(f"Warning: Parent {parent_id} not in cache in cleanup_orphaned_folders_in_parent, fetching from DB")
-                    parent_entity = self.repository.find_by_id(parent_id)
-                    if parent_entity and entity_cache is not None:
-                        entity_cache[parent_id] = parent_entity
-                else:
-                    print(f"Debug: Parent {parent_id} found in cache in cleanup_orphaned_folders_in_parent")
+                # 親エンティティを取得（同一リクエスト内の再取得はアイデンティティマップで解決される）
+                parent_entity = self.repository.find_by_id(parent_id)
                 
                 if parent_entity:
-                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity)
                     if not parent_folder.exists() or not parent_folder.is_dir():
-                        parent_folder = self.media_service._find_existing_parent_folder(parent_entity, entity_cache)
+                        parent_folder = self.media_service._find_existing_parent_folder(parent_entity)
             else:
                 parent_folder = self.media_service.uploads_dir
             
             if not parent_folder or not parent_folder.exists() or not parent_folder.is_dir():
                 return
             
+            # 子ページのフォルダがすべて対応表でこの親フォルダの直下に記録されていれば、フォルダの一覧は取得しない
+            # （ページ削除時のフォルダは対応表から特定して削除するため、孤立フォルダは残らない）
+            child_page_ids = existing_page_ids - {parent_id} if parent_id else existing_page_ids
+            if self.media_service._find_recorded_child_folders(parent_folder, child_page_ids) is not None:
+                return
+            logger.debug("Child folders of %s are not all in the manifest, scanning for orphaned folders", parent_folder)
+            
             folders_to_check = list(parent_folder.iterdir())
             
             for folder_path in folders_to_check:
@@ -1,14 +1,18 @@
 """フォルダ移動・リネーム操作を担当するサービス"""
 
+import logging
 import os
 import re
 import shutil
 import traceback
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional
+from ...domain.page_aggregate import PageEntity
 from ...domain.repositories import PageRepositoryInterface
 from .media_service import MediaService
 
+logger = logging.getLogger(__name__)
+
 
 class FolderMoveService:
     """フォルダ移動・リネーム操作を担当するサービス"""
@@ -63,6 +67,9 @@ class FolderMoveService:
                                 pass
                     except Exception as e:
                         print(f"✗ Warning: Failed to move subdirectory {item.name}: {e}")
+            
+            # フォルダ対応表を新しい場所に合わせる（配下のページのフォルダも含む）
+            self.media_service._record_folder_moved(old_folder, new_folder)
         except Exception as e:
             print(f"✗ Warning: Failed to move folder contents: {e}")
             traceback.print_exc()
@@ -108,7 +115,7 @@ class FolderMoveService:
         except Exception as e:
             print(f"Warning: Failed to remove empty folders: {e}")
     
-    def rename_folder_on_order_change(self, entity: 'PageEntity', old_order: int, entity_cache: Optional[Dict[int, PageEntity]] = None) -> tuple:
+    def rename_folder_on_order_change(self, entity: 'PageEntity', old_order: int) -> tuple:
         """order変更時にフォルダをリネームする"""
         try:
             safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
@@ -119,28 +126,21 @@ class FolderMoveService:
             new_folder_path_str = None
             
             if entity.parent_id:
-                # キャッシュから親エンティティを取得、なければDBから取得
-                parent_entity = None
-                if entity_cache:
-                    parent_entity = entity_cache.get(entity.parent_id)
-                
-                if parent_entity is None:
-                    parent_entity = self.repository.find_by_id(entity.parent_id)
-                    if parent_entity and entity_cache is not None:
-                        entity_cache[entity.parent_id] = parent_entity
+                # 親エンティティを取得（同一リクエスト内の再取得はアイデンティティマップで解決される）
+                parent_entity = self.repository.find_by_id(entity.parent_id)
                 
                 if parent_entity:
-                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                    parent_folder = self.media_service._get_page_folder_absolute_path(parent_entity)
                     
                     if not parent_folder.exists() or not parent_folder.is_dir():
-                        existing_parent_folder = self.media_service._find_existing_parent_folder(parent_entity, entity_cache)
+                        existing_parent_folder = self.media_service._find_existing_parent_folder(parent_entity)
                         if existing_parent_folder:
                             parent_folder = existing_parent_folder
                         else:
                             print(f"ERROR: Parent folder does not exist for page {entity.id}")
                             return None, None
                     
-                    parent_folder_path = self.media_service.get_page_folder_path(parent_entity, entity_cache)
+                    parent_folder_path = self.media_service.get_page_folder_path(parent_entity)
                     old_folder_path_str = str(parent_folder_path / old_folder_name).replace('\\', '/')
                     new_folder_path_str = str(parent_folder_path / new_folder_name).replace('\\', '/')
                     
@@ -161,7 +161,7 @@ class FolderMoveService:
                 new_folder_resolved = new_folder.resolve()
                 
                 if old_folder_resolved != new_folder_resolved:
-                    existing_folder = self.media_service._find_existing_page_folder(entity, entity_cache)
+                    existing_folder = self.media_service._find_existing_page_folder(entity)
                     if existing_folder:
                         existing_resolved = existing_folder.resolve()
                         if existing_resolved == old_folder_resolved:
@@ -189,7 +189,7 @@ class FolderMoveService:
                         
                         return old_folder_path_str, new_folder_path_str
             else:
-                existing_folder = self.media_service._find_existing_page_folder(entity, entity_cache)
+                existing_folder = self.media_service._find_existing_page_folder(entity)
                 if existing_folder:
                     existing_resolved = existing_folder.resolve()
                     new_folder_resolved = new_folder.resolve()
@@ -211,38 +211,34 @@ class FolderMoveService:
             traceback.print_exc()
             return None, None
     
-    def move_folder_to_new_parent(self, entity: 'PageEntity', old_parent_id: Optional[int], entity_cache: Optional[Dict[int, PageEntity]] = None) -> None:
+    def move_folder_to_new_parent(self, entity: 'PageEntity', old_parent_id: Optional[int]) -> None:
         """親が変わった場合にフォルダを古い親から新しい親に移動する"""
         try:
             safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
             folder_name = f'{entity.order}_page_{entity.id}_{safe_title}'
             
+            # 移動前のフォルダは対応表から特定し、登録がない場合のみ古い親フォルダを走査する
             old_parent_folder = None
-            old_folder = None
-            if old_parent_id:
-                # キャッシュから古い親エンティティを取得、なければDBから取得
-                old_parent_entity = None
-                if entity_cache:
-                    old_parent_entity = entity_cache.get(old_parent_id)
-                
-                if old_parent_entity is None:
-                    old_parent_entity = self.repository.find_by_id(old_parent_id)
-                    if old_parent_entity and entity_cache is not None:
-                        entity_cache[old_parent_id] = old_parent_entity
+            old_folder = self.media_service._find_recorded_page_folder(entity.id)
+            if old_folder is None and old_parent_id:
+                # 古い親エンティティを取得（同一リクエスト内の再取得はアイデンティティマップで解決される）
+                old_parent_entity = self.repository.find_by_id(old_parent_id)
                 
                 if old_parent_entity:
-                    old_parent_folder = self.media_service._get_page_folder_absolute_path(old_parent_entity, entity_cache)
+                    old_parent_folder = self.media_service._get_page_folder_absolute_path(old_parent_entity)
                     if not old_parent_folder.exists() or not old_parent_folder.is_dir():
-                        old_parent_folder = self.media_service._find_existing_parent_folder(old_parent_entity, entity_cache)
+                        old_parent_folder = self.media_service._find_existing_parent_folder(old_parent_entity)
                 
                 if old_parent_folder and old_parent_folder.exists() and old_parent_folder.is_dir():
+                    logger.debug("Folder of page %s is not in the manifest, scanning %s", entity.id, old_parent_folder)
                     for item in old_parent_folder.iterdir():
                         if item.is_dir() and f'_page_{entity.id}_' in item.name and safe_title in item.name:
                             old_folder = item
                             break
                 else:
                     print(f"Warning: Old parent folder not found for page {entity.id}")
-            else:
+            elif old_folder is None:
+                logger.debug("Folder of page %s is not in the manifest, scanning uploads root", entity.id)
                 for item in self.media_service.uploads_dir.iterdir():
                     if item.is_dir() and f'_page_{entity.id}_' in item.name and safe_title in item.name:
                         old_folder = item
@@ -250,20 +246,13 @@ class FolderMoveService:
             
             new_parent_folder = None
             if entity.parent_id:
-                # キャッシュから新しい親エンティティを取得、なければDBから取得
-                new_parent_entity = None
-                if entity_cache:
-                    new_parent_entity = entity_cache.get(entity.parent_id)
-                
-                if new_parent_entity is None:
-                    new_parent_entity = self.repository.find_by_id(entity.parent_id)
-                    if new_parent_entity and entity_cache is not None:
-                        entity_cache[entity.parent_id] = new_parent_entity
+                # 新しい親エンティティを取得（同一リクエスト内の再取得はアイデンティティマップで解決される）
+                new_parent_entity = self.repository.find_by_id(entity.parent_id)
                 
                 if new_parent_entity:
-                    new_parent_folder = self.media_service._get_page_folder_absolute_path(new_parent_entity, entity_cache)
+                    new_parent_folder = self.media_service._get_page_folder_absolute_path(new_parent_entity)
                     if not new_parent_folder.exists() or not new_parent_folder.is_dir():
-                        new_parent_folder = self.media_service._find_existing_parent_folder(new_parent_entity, entity_cache)
+                        new_parent_folder = self.media_service._find_existing_parent_folder(new_parent_entity)
                     if not new_parent_folder or not new_parent_folder.exists():
                         print(f"Warning: New parent folder not found for page {entity.id}, parent_id={entity.parent_id}")
                         return
@@ -286,7 +275,7 @@ class FolderMoveService:
                     self.remove_empty_folders(old_folder)
             else:
                 print(f"Warning: Old folder not found for page {entity.id} (old_parent_id={old_parent_id})")
-                existing_folder = self.media_service._find_existing_page_folder(entity, entity_cache)
+                existing_folder = self.media_service._find_existing_page_folder(entity)
                 if existing_folder:
                     existing_resolved = existing_folder.resolve()
                     new_folder_resolved = new_folder.resolve()
@@ -0,0 +1,189 @@
+"""HTML書き出しの待ち行列（write-behind）"""
+
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from ...domain.repositories import HtmlExportQueueRepositoryInterface
+from ...infrastructure.repositories import HtmlExportQueueRepository, PageRepository
+from ...infrastructure.unit_of_work import run_after_flush
+
+logger = logging.getLogger(__name__)
+
+
+class HtmlExportQueue:
+    """
+    ページのHTML版の書き出しを保存処理から切り離す待ち行列
+
+    保存時は request() で要求を登録するだけにし、画像のbase64埋め込みとファイルの
+    書き込みはワーカー（process_pending）が最新のページ内容で行う。
+    要求はページIDごとに1件にまとまるため、自動保存が続いても書き出しは1回で済む。
+
+    - 未処理の要求が HTML_EXPORT_QUEUE_MAX_PENDING 件以上ある場合は登録しない（呼び出し側がその場で書き出す）
+    - 失敗した要求は HTML_EXPORT_RETRY_DELAY 秒から倍々に間隔をあけて、HTML_EXPORT_MAX_ATTEMPTS 回まで再試行する
+    - ワーカーをどこで動かすかは HTML_EXPORT_IN_PROCESS_WORKER で決める（'auto' の場合は、
+      process_html_exports --loop が動いている間はサーバープロセス内のワーカーを使わない）
+    """
+
+    MODE_QUEUE = 'queue'
+    MODE_SYNC = 'sync'
+
+    WORKER_AUTO = 'auto'
+
+    BATCH_SIZE = 20
+    # 処理中のままこの秒数を過ぎた要求は、ワーカーが異常終了したものとみなして取り直す
+    CLAIM_TIMEOUT = 300
+    # サーバープロセス内のワーカーが、起こされなくても再試行の時刻を確認しに行く間隔（秒）
+    POLL_INTERVAL = 5
+    # 常駐ワーカーの生存確認のファイルがこの回数分の間隔より古ければ、止まったものとみなす
+    HEARTBEAT_MISSES = 3
+
+    _worker_lock = threading.Lock()
+    _worker_thread: Optional[threading.Thread] = None
+    _wake_event = threading.Event()
+
+    def __init__(self, queue_repository: Optional[HtmlExportQueueRepositoryInterface] = None):
+        self.queue_repository = queue_repository or HtmlExportQueueRepository()
+
+    @property
+    def enabled(self) -> bool:
+        """待ち行列を使う設定か"""
+        return getattr(settings, 'HTML_EXPORT_MODE', self.MODE_QUEUE) == self.MODE_QUEUE
+
+    def request(self, page_id: int) -> bool:
+        """
+        ページのHTML書き出しを要求する
+
+        登録した場合は True を返す。待ち行列を使わない設定の場合や、未処理の要求が
+        上限に達している場合は False を返すので、呼び出し側でその場で書き出す。
+        """
+        if not self.enabled:
+            return False
+
+        max_pending = getattr(settings, 'HTML_EXPORT_QUEUE_MAX_PENDING', 200)
+        if self.queue_repository.count_pending() >= max_pending:
+            logger.debug("HTML export queue is full (%s), exporting page %s synchronously", max_pending, page_id)
+            return False
+
+        # ページの変更がリクエストの終わりにまとめて書き込まれるため、登録はその後に行う（書き込み前の内容を書き出さない）
+        run_after_flush(lambda: self._enqueue(page_id))
+        return True
+
+    def _enqueue(self, page_id: int) -> None:
+        self.queue_repository.enqueue(page_id)
+        if self.use_in_process_worker():
+            # トランザクションのコミット後にワーカーを起こす（未コミットの内容を書き出さない）
+            transaction.on_commit(self.wake_worker)
+
+    @classmethod
+    def use_in_process_worker(cls) -> bool:
+        """サーバープロセス内のワーカーを使うか"""
+        mode = getattr(settings, 'HTML_EXPORT_IN_PROCESS_WORKER', cls.WORKER_AUTO)
+        if mode == cls.WORKER_AUTO:
+            return not cls.external_worker_alive()
+        return mode in (True, 'True')
+
+    @staticmethod
+    def _heartbeat_path() -> Path:
+        return Path(settings.HTML_EXPORT_WORKER_HEARTBEAT_FILE)
+
+    @classmethod
+    def touch_heartbeat(cls, interval: float) -> None:
+        """常駐ワーカー（process_html_exports --loop）が動いていることを記録する"""
+        cls._heartbeat_path().write_text(str(interval), encoding='utf-8')
+
+    @classmethod
+    def clear_heartbeat(cls) -> None:
+        """常駐ワーカーの終了を記録する"""
+        cls._heartbeat_path().unlink(missing_ok=True)
+
+    @classmethod
+    def external_worker_alive(cls) -> bool:
+        """常駐ワーカー（process_html_exports --loop）が動いているか"""
+        path = cls._heartbeat_path()
+        try:
+            interval = float(path.read_text(encoding='utf-8') or cls.POLL_INTERVAL)
+            age = time.time() - path.stat().st_mtime
+        except (OSError, ValueError):
+            return False
+        return age < max(interval, cls.POLL_INTERVAL) * cls.HEARTBEAT_MISSES
+
+    def process_pending(self, limit: Optional[int] = None) -> int:
+        """
+        実行時刻を過ぎた要求を処理する
+
+        limit を省略した場合は、処理できる要求がなくなるまで繰り返す。処理した要求数を返す。
+        """
+        # 循環インポートを避けるため、ここでインポートする
+        from .html_generator import HtmlGenerator
+        from .media_service import MediaService
+
+        processed = 0
+        while limit is None or processed < limit:
+            batch_size = self.BATCH_SIZE if limit is None else min(self.BATCH_SIZE, limit - processed)
+            tasks = self.queue_repository.claim_due(batch_size, self.CLAIM_TIMEOUT)
+            if not tasks:
+                break
+
+            # バッチごとにリポジトリを作り直し、要求時点ではなく最新のページ内容を書き出す
+            repository = PageRepository()
+            html_generator = HtmlGenerator(media_service=MediaService(repository))
+            entities = {entity.id: entity for entity in repository.find_by_ids([task[0] for task in tasks])}
+
+            for page_id, requested_at, attempts in tasks:
+                entity = entities.get(page_id)
+                try:
+                    if entity is not None:
+                        html_generator.write_page_html(entity)
+                    # 削除済みのページの要求は破棄する
+                    self.queue_repository.complete(page_id, requested_at)
+                except Exception as e:
+                    print(f"Warning: Failed to export HTML for page {page_id}: {e}")
+                    traceback.print_exc()
+                    self.queue_repository.fail(page_id, requested_at, str(e), self._next_retry_at(attempts + 1))
+                processed += 1
+        return processed
+
+    def _next_retry_at(self, attempts: int):
+        """次の再試行の時刻（上限を超えた場合は None）"""
+        if attempts >= getattr(settings, 'HTML_EXPORT_MAX_ATTEMPTS', 5):
+            return None
+        delay = getattr(settings, 'HTML_EXPORT_RETRY_DELAY', 5) * (2 ** (attempts - 1))
+        return timezone.now() + timedelta(seconds=delay)
+
+    @classmethod
+    def wake_worker(cls) -> None:
+        """サーバープロセス内のワーカーを起こす（動いていなければ開始する）"""
+        with cls._worker_lock:
+            if cls._worker_thread is None or not cls._worker_thread.is_alive():
+                cls._worker_thread = threading.Thread(
+                    target=cls._run_worker, name='html-export-worker', daemon=True
+                )
+                cls._worker_thread.start()
+        cls._wake_event.set()
+
+    @classmethod
+    def _run_worker(cls) -> None:
+        """サーバープロセス内のワーカーのループ"""
+        queue = cls()
+        while True:
+            cls._wake_event.wait(timeout=cls.POLL_INTERVAL)
+            cls._wake_event.clear()
+            if not cls.use_in_process_worker():
+                # 常駐ワーカーが動き始めたら、処理を任せて終了する（次に起こされたときに改めて判断する）
+                with cls._worker_lock:
+                    cls._worker_thread = None
+                return
+            close_old_connections()
+            try:
+                queue.process_pending()
+            except Exception as e:
+                print(f"Warning: HTML export worker error: {e}")
+                traceback.print_exc()
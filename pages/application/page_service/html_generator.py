@@ -1,14 +1,23 @@
 """HTML生成サービス"""
 
 import base64
+import hashlib
+import logging
+import os
 import re
+import tempfile
 import traceback
 from pathlib import Path
 from django.conf import settings
 from .media_service import MediaService
-from ...domain.page_aggregate import PageEntity
-from ...infrastructure.repositories import PageRepository
-from typing import Optional, Dict
+from .html_export_queue import HtmlExportQueue
+from .image_data_uri_cache import ImageDataUriCache
+from ...domain.page_aggregate import PageEntity, MediaReferenceExtractor, ContentScanner, ContentReference
+from ...domain.repositories import HtmlDigestRepositoryInterface
+from ...infrastructure.repositories import PageRepository, HtmlDigestRepository
+from typing import Optional, Iterator
+
+logger = logging.getLogger(__name__)
 
 
 class HtmlGenerator:
@@ -23,27 +32,108 @@ class HtmlGenerator:
         '.svg': 'image/svg+xml'
     }
     
-    def __init__(self, media_service=None):
+    # IDレイアウトではタイトルが変わってもファイル名が変わらないよう固定名で保存する
+    ID_LAYOUT_HTML_FILENAME = 'index.html'
+    
+    # ストリーミング時に画像を読み込んで base64 にする単位（3の倍数にして、分割してエンコードしても結果が変わらないようにする）
+    STREAM_CHUNK_SIZE = 3 * 64 * 1024
+    # ドキュメントの本文部分を差し込む位置の目印（ストリーミング時に前後に分割する）
+    _CONTENT_PLACEHOLDER = '\x00content\x00'
+    
+    def __init__(
+        self,
+        media_service=None,
+        export_queue: Optional[HtmlExportQueue] = None,
+        digest_repository: Optional[HtmlDigestRepositoryInterface] = None,
+        image_cache: Optional[ImageDataUriCache] = None
+    ):
         self.media_root = Path(settings.MEDIA_ROOT)
         self.media_service = media_service
+        self.export_queue = export_queue or HtmlExportQueue()
+        self.digest_repository = digest_repository or HtmlDigestRepository()
+        self.image_cache = image_cache or ImageDataUriCache.shared()
     
     def generate_html_content(self, entity: PageEntity) -> str:
         """画像を埋め込んだHTMLコンテンツを生成する"""
         content = entity.content
         
         # コンテンツ内の画像を検出して base64 に埋め込み
-        pattern = r'<img([^>]*)src=["\']([^"\']+)["\']([^>]*)>'
-        embedded_content = re.sub(pattern, self._replace_image_with_base64, content)
+        embedded_content = ContentScanner.scan(content).rewrite(content, self._replace_image_with_base64)
         
         # HTML ドキュメントを構築
         return self._build_html_document(entity, embedded_content)
     
-    def save_html_to_folder(self, entity: PageEntity, entity_cache: Optional[Dict[int, PageEntity]] = None) -> None:
+    def generate_linked_html_content(self, entity: PageEntity, media_url_prefix: str) -> str:
+        """画像を埋め込まず、メディアへのURLを media_url_prefix からの相対パスに置き換えたHTMLを生成する
+        
+        ZIPや静的サイトのように、メディアファイルをHTMLと一緒に配置する書き出しで使う
+        （例: media_url_prefix='../../media/' なら /media/uploads/a.png -> ../../media/uploads/a.png）。
+        """
+        def replace(reference: ContentReference) -> Optional[str]:
+            if reference.media_url is None:
+                return None
+            return media_url_prefix + reference.media_url[len('/media/'):]
+        
+        linked_content = ContentScanner.scan(entity.content).rewrite(entity.content, replace)
+        return self._build_html_document(entity, linked_content)
+    
+    def iter_html_content(self, entity: PageEntity) -> Iterator[str]:
+        """generate_html_content と同じHTMLを、少しずつ生成して返す
+        
+        画像はファイルから STREAM_CHUNK_SIZE ずつ読み込んで base64 にするため、
+        画像の数・サイズによらずメモリ使用量が一定に保たれる（キャッシュ済みの画像はそれを使う）。
+        """
+        head, tail = self._build_html_document(entity, self._CONTENT_PLACEHOLDER).split(self._CONTENT_PLACEHOLDER, 1)
+        yield head
+        
+        content = entity.content
+        position = 0
+        for reference in ContentScanner.scan(content).references:
+            file_path = self._get_embeddable_image_path(reference)
+            if file_path is None:
+                continue
+            yield content[position:reference.start]
+            yield from self._iter_embedded_image(file_path, content[reference.start:reference.end])
+            position = reference.end
+        if position < len(content):
+            yield content[position:]
+        
+        yield tail
+    
+    def _iter_embedded_image(self, file_path: Path, original_value: str) -> Iterator[str]:
+        """画像の src 属性の値を base64 埋め込み形式で少しずつ返す（読み込めなければ元の値を返す）"""
+        try:
+            cached = self.image_cache.peek(ImageDataUriCache.make_key(file_path))
+            if cached is not None:
+                yield cached
+                return
+            f = open(file_path, 'rb')
+        except OSError as e:
+            print(f"Warning: Failed to embed image {file_path}: {e}")
+            yield original_value
+            return
+        
+        with f:
+            mime_type = self.MIME_TYPES.get(file_path.suffix.lower(), 'image/png')
+            yield f'data:{mime_type};base64,'
+            try:
+                while True:
+                    chunk = f.read(self.STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield base64.b64encode(chunk).decode('ascii')
+            except OSError as e:
+                # 送信済みの部分は取り消せないため、ログに残して画像を途中で閉じる
+                print(f"Warning: Failed to read image {file_path} while streaming: {e}")
+    
+    def save_html_to_folder(self, entity: PageEntity) -> None:
         """ページのHTML版を画像フォルダに保存する
         
+        フォルダの作成・特定はその場で行い、HTMLの生成と書き込みは書き出し待ち行列に登録する
+        （HTML_EXPORT_MODE=sync の場合や待ち行列が上限に達している場合はその場で書き込む）。
+        
         Args:
             entity: 保存するページエンティティ
-            entity_cache: エンティティキャッシュ（親エンティティの取得を最適化するため）
         """
         
         # media_serviceが渡されている場合はそれを使用、なければ新規作成
@@ -54,32 +144,25 @@ class HtmlGenerator:
             repository = PageRepository()
             media_service = MediaService(repository)
         
+        if media_service.uses_id_layout:
+            # IDレイアウトではフォルダが親・タイトル・orderに依存しないため、そのまま作成して書き込む
+            page_folder = media_service._get_page_folder_absolute_path(entity)
+            page_folder.mkdir(parents=True, exist_ok=True)
+            self._request_html_write(entity, page_folder / self.ID_LAYOUT_HTML_FILENAME)
+            return
+        
         page_folder = None  # 初期化を追加
         
-        # 親エンティティを事前に取得してキャッシュに追加（_find_existing_page_folderでも使用されるため）
+        # 親エンティティを事前に取得（_find_existing_page_folderでの再取得はアイデンティティマップで解決される）
         parent_entity = None
         if entity.parent_id and media_service.repository:
-            if entity_cache:
-                parent_entity = entity_cache.get(entity.parent_id)
-            
-            if parent_entity is None:
-                # キャッシュにない場合のみDBから取得
-                print(f"Warning: Parent {entity.parent_id} not in cache in save_html_to_folder (entity={entity.id}), fetching from DB")
-                parent_entity = media_service.repository.find_by_id(entity.parent_id)
-                if parent_entity and entity_cache is not None:
-                    entity_cache[entity.parent_id] = parent_entity
-            else:
-                print(f"Debug: Parent {entity.parent_id} found in cache in save_html_to_folder (entity={entity.id})")
+            parent_entity = media_service.repository.find_by_id(entity.parent_id)
         
         # まず、既存のフォルダを検索（orderが変更された場合に対応）
-        # 親エンティティは上で既にキャッシュに追加されているので、_find_existing_page_folderでもキャッシュから取得される
         existing_page_folder = None
         if media_service.repository:
-            existing_page_folder = media_service._find_existing_page_folder(entity, entity_cache)
-            if existing_page_folder:
-                print(f"Found existing page folder: {existing_page_folder}")
-            else:
-                print(f"No existing page folder found")
+            existing_page_folder = media_service._find_existing_page_folder(entity)
+            logger.debug("Existing folder of page %s: %s", entity.id, existing_page_folder)
         
         # 親フォルダを先に明示的に作成してから、子フォルダを作成
         if entity.parent_id:
@@ -89,23 +172,19 @@ class HtmlGenerator:
             else:
                 # 上で取得済みの親エンティティを使用
                 if parent_entity:
-                    # _get_page_folder_absolute_pathを使う（entity_cacheを渡す）
-                    parent_folder = media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                    parent_folder = media_service._get_page_folder_absolute_path(parent_entity)
                     
                     # 親フォルダが存在しない場合は、既存のフォルダを検索
                     if not parent_folder.exists() or not parent_folder.is_dir():
-                        existing_parent_folder = media_service._find_existing_parent_folder(parent_entity, entity_cache)
+                        existing_parent_folder = media_service._find_existing_parent_folder(parent_entity)
                         if existing_parent_folder:
                             parent_folder = existing_parent_folder
                         else:
                             raise ValueError(f'親ページ（ID: {entity.parent_id}）のフォルダが存在しません。親ページを先に保存してください。')
-                    else:
-                        print(f"Parent folder exists: {parent_folder}")
                     
                     # 既存のフォルダがある場合はそれを使用、なければ新しいフォルダを作成
                     if existing_page_folder and existing_page_folder.exists():
                         page_folder = existing_page_folder
-                        print(f"Using existing page folder: {page_folder}")
                     else:
                         # 親フォルダが存在する場合のみ、子フォルダを作成
                         safe_title = re.sub(r'[<>:"/\\|?*]', '_', entity.title)
@@ -135,16 +214,18 @@ class HtmlGenerator:
         if not page_folder.exists() or not page_folder.is_dir():
             raise ValueError(f'ページフォルダが存在しません: {page_folder}')
         
+        # フォルダの所在を対応表に記録（以降の検索でディレクトリを走査しない）
+        media_service._record_page_folder(entity.id, page_folder)
+        
         # 親フォルダが作成された場合、親ページのHTMLファイルも作成する
         if entity.parent_id and media_service.repository:
-            # 上で取得済みの親エンティティを使用（キャッシュから再取得する必要なし）
+            # 上で取得済みの親エンティティを使用
             if parent_entity:
-                # _get_page_folder_absolute_pathを使う（entity_cacheを渡す）
-                parent_folder = media_service._get_page_folder_absolute_path(parent_entity, entity_cache)
+                parent_folder = media_service._get_page_folder_absolute_path(parent_entity)
                 
                 # 親フォルダが存在しない場合は、既存のフォルダを検索
                 if not parent_folder.exists() or not parent_folder.is_dir():
-                    existing_folder = media_service._find_existing_parent_folder(parent_entity, entity_cache)
+                    existing_folder = media_service._find_existing_parent_folder(parent_entity)
                     if existing_folder:
                         parent_folder = existing_folder
                 
@@ -154,60 +235,141 @@ class HtmlGenerator:
                     parent_html_file = parent_folder / f'{parent_safe_title}.html'
                     if not parent_html_file.exists():
                         # 親ページのHTMLファイルを作成
-                        parent_html_content = self.generate_html_content(parent_entity)
                         try:
-                            with open(parent_html_file, 'w', encoding='utf-8') as f:
-                                f.write(parent_html_content)
+                            self._request_html_write(parent_entity, parent_html_file)
                         except Exception as e:
                             print(f"Warning: Failed to save parent HTML to {parent_html_file}: {e}")
         
-        # HTML コンテンツを生成
-        html_content = self.generate_html_content(entity)
-        
         # ファイル名をサニタイズ
         safe_title = re.sub(r'[<>:"/\\|?*]', '_', entity.title)
         html_filename = f'{safe_title}.html'
-        html_path = page_folder / html_filename
+        self._request_html_write(entity, page_folder / html_filename)
+    
+    def write_page_html(self, entity: PageEntity) -> None:
+        """既存のページフォルダにHTMLを書き込む（書き出し待ち行列のワーカーから呼ばれる）
+        
+        フォルダは save_html_to_folder で作成済みの前提で、書き込み時点のフォルダ
+        （要求後に並び替え・移動されていれば移動先）を特定する。
+        """
+        media_service = self.media_service or MediaService(PageRepository())
+        
+        if media_service.uses_id_layout:
+            page_folder = media_service._get_page_folder_absolute_path(entity)
+            page_folder.mkdir(parents=True, exist_ok=True)
+            self._write_html_file(entity, page_folder / self.ID_LAYOUT_HTML_FILENAME)
+            return
+        
+        page_folder = media_service._find_existing_page_folder(entity)
+        if page_folder is None or not page_folder.is_dir():
+            raise ValueError(f'ページフォルダが存在しません（ID: {entity.id}）')
+        
+        safe_title = re.sub(r'[<>:"/\\|?*]', '_', entity.title)
+        self._write_html_file(entity, page_folder / f'{safe_title}.html')
+    
+    def _request_html_write(self, entity: PageEntity, html_path: Path) -> None:
+        """HTMLの書き込みを待ち行列に登録する（登録しない設定・状況ではその場で書き込む）"""
+        if self.export_queue.request(entity.id):
+            logger.debug("HTML export queued for page %s (%s)", entity.id, html_path.name)
+            return
+        self._write_html_file(entity, html_path)
+    
+    def _write_html_file(self, entity: PageEntity, html_path: Path) -> None:
+        """ページのHTMLを生成してファイルに書き込む
+        
+        前回書き込んだ内容と同じ（ダイジェストとサイズが一致し、ファイルが残っている）場合は書き込まない。
+        書き込みは一時ファイルに書いてから os.replace で置き換えるため、途中までの内容が見えることはない。
+        """
+        html_bytes = self.generate_html_content(entity).encode('utf-8')
+        digest = hashlib.sha256(html_bytes).hexdigest()
+        page_folder = html_path.parent
+        
+        try:
+            relative_path = html_path.relative_to(self.media_root).as_posix()
+        except ValueError:
+            relative_path = None
+        
+        if relative_path and self._is_unchanged(relative_path, html_path, digest, len(html_bytes)):
+            logger.debug("HTML unchanged, skipped writing %s", html_path)
+            return
         
         try:
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            self._replace_file_atomically(html_path, html_bytes)
             print(f"✓ HTML file saved to {html_path} (folder: {page_folder.name})")  # 成功ログを追加
         except Exception as e:
             error_msg = f"Warning: Failed to save HTML to {html_path}: {e}"
             print(error_msg)
             traceback.print_exc()  # スタックトレースを出力
             raise  # 例外を再発生させて、呼び出し元で処理できるようにする
-    
-    def _replace_image_with_base64(self, match: re.Match) -> str:
-        """画像タグをbase64埋め込み形式に変換する"""
-        before_src = match.group(1)
-        img_url = match.group(2)
-        after_src = match.group(3)
         
-        # ローカルのメディアURLであれば base64 へ変換
-        if img_url.startswith('/media/'):
-            relative_path = img_url.replace('/media/', '')
-            file_path = self.media_root / relative_path
-            
-            if file_path.exists() and file_path.is_file():
-                try:
-                    with open(file_path, 'rb') as f:
-                        image_data = f.read()
-                        image_base64 = base64.b64encode(image_data).decode('utf-8')
-                        
-                        # 拡張子から MIME タイプを判定
-                        ext = file_path.suffix.lower()
-                        mime_type = self.MIME_TYPES.get(ext, 'image/png')
-                        
-                        # data URL を生成
-                        data_url = f'data:{mime_type};base64,{image_base64}'
-                        return f'<img{before_src}src="{data_url}"{after_src}>'
-                except Exception as e:
-                    print(f"Warning: Failed to embed image {file_path}: {e}")
+        if relative_path:
+            self.digest_repository.save_digest(relative_path, digest, len(html_bytes))
+    
+    def _is_unchanged(self, relative_path: str, html_path: Path, digest: str, size: int) -> bool:
+        """記録済みのダイジェスト・サイズと、書き出し先のファイルが今回の内容と一致するか"""
+        if self.digest_repository.get_digest(relative_path) != (digest, size):
+            return False
+        try:
+            # ファイルが削除・置き換えされていないことをサイズで確認する（内容は読まない）
+            return html_path.stat().st_size == size
+        except OSError:
+            return False
+    
+    @staticmethod
+    def _replace_file_atomically(target: Path, data: bytes) -> None:
+        """同じフォルダの一時ファイルに書き込んでから、os.replace で置き換える"""
+        fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                mode = target.stat().st_mode & 0o777
+            except OSError:
+                mode = 0o644
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+    
+    def _get_embeddable_image_path(self, reference: ContentReference) -> Optional[Path]:
+        """img タグの src が MEDIA_ROOT 配下の既存ファイルを指していればその絶対パス（それ以外は None）"""
+        if reference.tag != 'img' or reference.attr != 'src' or not reference.url.startswith('/media/'):
+            return None
+        media_path = MediaReferenceExtractor.to_media_path(reference.url)
+        if media_path is None:
+            return None
+        media_root = self.media_root.resolve()
+        file_path = (media_root / media_path).resolve()
+        if not file_path.is_relative_to(media_root) or not file_path.is_file():
+            return None
+        return file_path
+    
+    def _replace_image_with_base64(self, reference: ContentReference) -> Optional[str]:
+        """ローカル画像の src を base64 埋め込み形式（data URL）に変換する（対象外・失敗時は None）"""
+        file_path = self._get_embeddable_image_path(reference)
+        if file_path is None:
+            return None
+        try:
+            # 同じ画像（パス・サイズ・更新日時が同じ）のエンコード結果はキャッシュを使う
+            return self.image_cache.get_or_create(
+                ImageDataUriCache.make_key(file_path),
+                lambda: self._encode_data_url(file_path)
+            )
+        except Exception as e:
+            print(f"Warning: Failed to embed image {file_path}: {e}")
+            return None
+    
+    def _encode_data_url(self, file_path: Path) -> str:
+        """画像ファイルを読み込んで data URL を生成する"""
+        with open(file_path, 'rb') as f:
+            image_base64 = base64.b64encode(f.read()).decode('utf-8')
         
-        # ローカル画像でない、または処理失敗時はそのまま返す
-        return match.group(0)
+        # 拡張子から MIME タイプを判定
+        mime_type = self.MIME_TYPES.get(file_path.suffix.lower(), 'image/png')
+        return f'data:{mime_type};base64,{image_base64}'
     
     def _build_html_document(self, entity: PageEntity, content: str) -> str:
         """完全なHTMLドキュメントを構築する"""
@@ -0,0 +1,177 @@
+"""画像の data URI（base64）のキャッシュ"""
+
+import atexit
+import hashlib
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from django.conf import settings
+
+
+CacheKey = Tuple[str, int, int]
+
+
+class ImageDataUriCache:
+    """
+    画像ファイルを base64 にした data URI の LRU キャッシュ
+
+    キーは (ファイルパス, サイズ, 更新日時[ns]) のため、画像が置き換えられると
+    自動的に別のエントリになる（古いエントリはLRUで追い出される）。
+    メモリ上の合計サイズが max_bytes を超えると古いものから追い出し、spill_dir が
+    指定されていれば追い出したエントリをディスクに退避して、次の参照時にメモリへ戻す。
+
+    HTMLの書き出しはプロセス内で何度も行われる（自動保存・並び替え・待ち行列のワーカー）ため、
+    shared() で取得するプロセス共通のインスタンスを使う。
+    """
+
+    SPILL_SUFFIX = '.datauri'
+
+    _shared: Optional['ImageDataUriCache'] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_bytes: int, spill_dir: Optional[str] = None, max_spill_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self._entries: 'OrderedDict[CacheKey, str]' = OrderedDict()
+        self._size = 0
+        self._spilled: 'OrderedDict[CacheKey, int]' = OrderedDict()
+        self._spill_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self.evictions = 0
+
+        self.spill_dir: Optional[Path] = None
+        if spill_dir and max_spill_bytes > 0:
+            # プロセスごとのディレクトリに退避し、終了時に削除する
+            Path(spill_dir).mkdir(parents=True, exist_ok=True)
+            self.spill_dir = Path(tempfile.mkdtemp(prefix='datauri-', dir=spill_dir))
+            atexit.register(shutil.rmtree, self.spill_dir, True)
+
+    @classmethod
+    def shared(cls) -> 'ImageDataUriCache':
+        """プロセス共通のキャッシュを取得する（設定は初回に読み込む）"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(
+                    max_bytes=getattr(settings, 'HTML_EXPORT_IMAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+                    spill_dir=getattr(settings, 'HTML_EXPORT_IMAGE_CACHE_SPILL_DIR', None),
+                    max_spill_bytes=getattr(settings, 'HTML_EXPORT_IMAGE_CACHE_MAX_SPILL_BYTES', 0),
+                )
+            return cls._shared
+
+    @staticmethod
+    def make_key(file_path: Path) -> CacheKey:
+        """ファイルの stat からキャッシュのキーを作る（ファイルがなければ OSError）"""
+        stat = file_path.stat()
+        return (str(file_path), stat.st_size, stat.st_mtime_ns)
+
+    def get_or_create(self, key: CacheKey, create: Callable[[], str]) -> str:
+        """キャッシュにあればそれを返し、なければ create() の結果を登録して返す"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            value = self._load_spilled(key)
+            if value is not None:
+                self.spill_hits += 1
+                self._put(key, value)
+                return value
+            self.misses += 1
+
+        # エンコードはロックの外で行う（同じ画像を同時にエンコードした場合は後から登録した方が残る）
+        value = create()
+        with self._lock:
+            self._put(key, value)
+        return value
+
+    def peek(self, key: CacheKey) -> Optional[str]:
+        """メモリ上にあれば返す（ない場合に読み込み・登録はしない）"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット・ミスの回数と、現在のエントリ数・サイズ"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'spill_hits': self.spill_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'spilled_entries': len(self._spilled),
+                'spilled_bytes': self._spill_size,
+            }
+
+    def clear(self) -> None:
+        """すべてのエントリと回数を消す"""
+        with self._lock:
+            for key in list(self._spilled):
+                self._remove_spilled(key)
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = self.spill_hits = self.evictions = 0
+
+    def _put(self, key: CacheKey, value: str) -> None:
+        """エントリを登録し、上限を超えた分を古いものから追い出す（ロック内で呼ぶ）"""
+        if len(value) > self.max_bytes:
+            # 上限を超える画像はキャッシュしない
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = value
+        self._size += len(value)
+
+        while self._size > self.max_bytes:
+            old_key, old_value = self._entries.popitem(last=False)
+            self._size -= len(old_value)
+            self.evictions += 1
+            self._spill(old_key, old_value)
+
+    def _spill_path(self, key: CacheKey) -> Path:
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return self.spill_dir / f'{name}{self.SPILL_SUFFIX}'
+
+    def _spill(self, key: CacheKey, value: str) -> None:
+        """追い出したエントリをディスクに退避する（退避先がなければ捨てる）"""
+        if self.spill_dir is None or len(value) > self.max_spill_bytes:
+            return
+        try:
+            self._spill_path(key).write_text(value, encoding='ascii')
+        except OSError as e:
+            print(f"Warning: Failed to spill image cache entry: {e}")
+            return
+        self._spilled[key] = len(value)
+        self._spill_size += len(value)
+        while self._spill_size > self.max_spill_bytes:
+            self._remove_spilled(next(iter(self._spilled)))
+
+    def _load_spilled(self, key: CacheKey) -> Optional[str]:
+        """退避したエントリを読み込み、退避先からは削除する"""
+        if key not in self._spilled:
+            return None
+        try:
+            value = self._spill_path(key).read_text(encoding='ascii')
+        except OSError:
+            value = None
+        self._remove_spilled(key)
+        return value
+
+    def _remove_spilled(self, key: CacheKey) -> None:
+        self._spill_size -= self._spilled.pop(key)
+        try:
+            self._spill_path(key).unlink()
+        except OSError:
+            pass
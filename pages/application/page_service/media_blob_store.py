@@ -0,0 +1,166 @@
+"""アップロードされたメディアの内容アドレス方式の保存（重複排除）"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+from django.conf import settings
+
+from ...domain.repositories import PageRepositoryInterface
+
+logger = logging.getLogger(__name__)
+
+
+class MediaBlobStore:
+    """
+    アップロードされたファイルを内容のハッシュ（SHA-256）をファイル名にして1回だけ保存する
+
+    保存先: uploads/blobs/{ハッシュの先頭2文字}/{ハッシュ}{拡張子}
+    同じ内容のファイルを何度アップロードしても同じURLを返すため、
+    複数のページに貼り付けた同じ画像はディスク（と Box の同期）上では1つになる。
+
+    参照数はメディア参照表（PageMedia）で数える。最後に参照していたページから外れた・
+    ページごと削除された時点で release() で削除する。アップロード直後でまだどのページにも
+    保存されていない blob を消さないよう、最後にアップロードされてから MEDIA_DEDUP_GRACE_SECONDS
+    の間は削除しない（その後も参照されなかったものは `python manage.py gc_media_blobs` で削除する）。
+    """
+
+    BLOB_DIR = 'blobs'
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, repository: Optional[PageRepositoryInterface] = None):
+        self.repository = repository
+        self.media_root = Path(settings.MEDIA_ROOT)
+        self.blob_root = self.media_root / 'uploads' / self.BLOB_DIR
+        self.grace_seconds = getattr(settings, 'MEDIA_DEDUP_GRACE_SECONDS', 24 * 60 * 60)
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'MEDIA_DEDUP', False)
+
+    def save(self, uploaded_file, ext: str) -> str:
+        """アップロードされたファイルを保存し、MEDIA_ROOT からの相対パスを返す
+
+        ファイルは一時ファイルに書き込みながらハッシュを計算する（読み直さない）。
+        同じ内容の blob が既にあれば一時ファイルを捨て、既存の blob の更新日時だけを更新する。
+        受け取り用フォルダ（MediaStagingUploadHandler）で受け取ったファイルは、受け取り時に計算した
+        ハッシュを使い、そのまま blob の位置に移動する（書き直さない）。
+        """
+        self.blob_root.mkdir(parents=True, exist_ok=True)
+        staged_digest = getattr(uploaded_file, 'digest', None)
+        if staged_digest is not None:
+            return self._store(Path(uploaded_file.temporary_file_path()), staged_digest.hexdigest(), ext)
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.blob_root, prefix='.upload-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in uploaded_file.chunks(self.CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._store(Path(temp_path), digest.hexdigest(), ext)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def adopt(self, file_path: Path, ext: str) -> str:
+        """既存のファイル（分割アップロードで組み立てたものなど）を blob として取り込み、MEDIA_ROOT からの相対パスを返す
+
+        ファイルは blob に移動する（同じ内容の blob が既にあれば削除する）。
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        self.blob_root.mkdir(parents=True, exist_ok=True)
+        return self._store(Path(file_path), digest.hexdigest(), ext)
+
+    def _store(self, source: Path, hex_digest: str, ext: str) -> str:
+        """ハッシュ済みのファイルを blob の位置に移動する（同じ内容の blob が既にあれば source を削除する）"""
+        relative_path = f'uploads/{self.BLOB_DIR}/{hex_digest[:2]}/{hex_digest}{ext.lower()}'
+        blob_path = self.media_root / relative_path
+        if blob_path.is_file():
+            source.unlink()
+            # 猶予期間の起点を更新する（保存前のページから参照されている間に削除されないようにする）
+            os.utime(blob_path)
+            logger.debug("Deduplicated upload: %s", relative_path)
+        else:
+            blob_path.parent.mkdir(exist_ok=True)
+            os.chmod(source, 0o644)
+            # 同じ内容の同時アップロードでは後から置き換えた側が残る（内容は同じ）
+            os.replace(source, blob_path)
+        return relative_path
+
+    def is_blob_path(self, media_path: str) -> bool:
+        """MEDIA_ROOT からの相対パスが blob を指しているか"""
+        return media_path.startswith(f'uploads/{self.BLOB_DIR}/')
+
+    def release(self, media_paths: Iterable[str]) -> int:
+        """どのページからも参照されなくなった blob を削除し、削除した件数を返す
+
+        参照表が更新された後（ページの保存・削除の後）に呼ぶこと。
+        """
+        blob_paths = [path for path in set(media_paths) if self.is_blob_path(path)]
+        if not blob_paths or self.repository is None:
+            return 0
+        deleted = 0
+        for media_path in blob_paths:
+            if self.repository.find_page_ids_referencing_media(media_path):
+                continue
+            if self._delete_if_expired(self.media_root / media_path, time.time()):
+                deleted += 1
+        return deleted
+
+    def collect_garbage(self, dry_run: bool = False) -> List[str]:
+        """どのページからも参照されず、猶予期間を過ぎた blob を削除し、そのパスの一覧を返す"""
+        if not self.blob_root.is_dir() or self.repository is None:
+            return []
+        referenced = self.repository.find_media_paths_with_prefix(f'uploads/{self.BLOB_DIR}/')
+        now = time.time()
+        collected = []
+        for blob_path in sorted(self.blob_root.glob('*/*')):
+            media_path = blob_path.relative_to(self.media_root).as_posix()
+            if media_path in referenced:
+                continue
+            if dry_run:
+                if self._is_expired(blob_path, now):
+                    collected.append(media_path)
+            elif self._delete_if_expired(blob_path, now):
+                collected.append(media_path)
+
+        # 書き込み途中で中断されたアップロードの一時ファイル
+        if not dry_run:
+            for temp_path in self.blob_root.glob('.upload-*.tmp'):
+                if self._is_expired(temp_path, now):
+                    temp_path.unlink(missing_ok=True)
+        return collected
+
+    def _is_expired(self, blob_path: Path, now: float) -> bool:
+        """最後にアップロードされてから猶予期間を過ぎているか"""
+        try:
+            return blob_path.is_file() and now - blob_path.stat().st_mtime >= self.grace_seconds
+        except OSError:
+            return False
+
+    def _delete_if_expired(self, blob_path: Path, now: float) -> bool:
+        """猶予期間を過ぎていれば blob を削除する"""
+        if not self._is_expired(blob_path, now):
+            return False
+        try:
+            blob_path.unlink()
+            print(f"✗ DELETED blob: {blob_path}")
+        except OSError as e:
+            print(f"✗ Warning: Failed to delete blob {blob_path}: {e}")
+            return False
+        try:
+            blob_path.parent.rmdir()
+        except OSError:
+            pass
+        return True
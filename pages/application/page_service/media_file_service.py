@@ -1,5 +1,6 @@
 """メディアファイル操作サービス"""
 
+import logging
 import os
 import re
 import shutil
@@ -7,10 +8,14 @@ import urllib.parse
 from pathlib import Path
 from typing import List, Optional, Dict
 from django.conf import settings
-from ...domain.page_aggregate import PageEntity
-from ...domain.repositories import PageRepositoryInterface
+from ...domain.page_aggregate import PageEntity, MediaReferenceExtractor, ContentScanner, ContentReference
+from ...domain.repositories import PageRepositoryInterface, TempUploadRepositoryInterface
+from ...infrastructure.repositories import TempUploadRepository
 from .media_path_service import MediaPathService
 from .media_url_extractor import MediaUrlExtractor
+from .media_blob_store import MediaBlobStore
+
+logger = logging.getLogger(__name__)
 
 
 class MediaFileService:
@@ -20,20 +25,22 @@ class MediaFileService:
         self,
         repository: Optional[PageRepositoryInterface] = None,
         path_service: Optional[MediaPathService] = None,
-        url_extractor: Optional[MediaUrlExtractor] = None
+        url_extractor: Optional[MediaUrlExtractor] = None,
+        temp_upload_repository: Optional[TempUploadRepositoryInterface] = None
     ):
         self.repository = repository
         self.media_root = Path(settings.MEDIA_ROOT)
         self.uploads_dir = self.media_root / 'uploads'
         self.path_service = path_service or MediaPathService(repository)
         self.url_extractor = url_extractor or MediaUrlExtractor()
+        self.blob_store = MediaBlobStore(repository)
+        self.temp_upload_repository = temp_upload_repository or TempUploadRepository()
     
     def move_temp_images_to_page_folder(
         self,
         page_id: int,
         content: str,
-        entity: Optional[PageEntity] = None,
-        entity_cache: Optional[Dict[int, PageEntity]] = None
+        entity: Optional[PageEntity] = None
     ) -> str:
         """一時フォルダの画像・動画をページ専用フォルダへ移動し、URL を更新する"""
         if not content:
@@ -44,30 +51,26 @@ class MediaFileService:
         
         if entity is None and self.repository:
             entity = self.repository.find_by_id(page_id)
-            if entity and entity_cache is not None:
-                entity_cache[page_id] = entity
         
-        if entity:
-            page_folder_relative = self.path_service.get_page_folder_path(entity, entity_cache)
+        if self.path_service.uses_id_layout:
+            page_folder_relative = self.path_service.get_id_folder_path(page_id)
+        elif entity:
+            page_folder_relative = self.path_service.get_page_folder_path(entity)
         else:
             page_folder_relative = Path(f'page_{page_id}')
         
-        # 親エンティティを取得（キャッシュから取得、なければDBから取得）
         parent_entity = None
-        if entity and entity.parent_id and self.repository:
-            if entity_cache:
-                parent_entity = entity_cache.get(entity.parent_id)
-            
-            if parent_entity is None:
-                parent_entity = self.repository.find_by_id(entity.parent_id)
-                if parent_entity and entity_cache is not None:
-                    entity_cache[entity.parent_id] = parent_entity
-            
+        if self.path_service.uses_id_layout:
+            # IDレイアウトでは親フォルダに依存しないため、ページフォルダをそのまま作成する
+            (self.uploads_dir / page_folder_relative).mkdir(parents=True, exist_ok=True)
+        elif entity and entity.parent_id and self.repository:
+            # 親エンティティを取得（同一リクエスト内の再取得はアイデンティティマップで解決される）
+            parent_entity = self.repository.find_by_id(entity.parent_id)
             if parent_entity:
-                parent_folder = self.path_service.get_page_folder_absolute_path(parent_entity, entity_cache)
+                parent_folder = self.path_service.get_page_folder_absolute_path(parent_entity)
                 
                 if not parent_folder.exists() or not parent_folder.is_dir():
-                    existing_folder = self.path_service.find_existing_parent_folder(parent_entity, entity_cache)
+                    existing_folder = self.path_service.find_existing_parent_folder(parent_entity)
                     if existing_folder:
                         parent_folder = existing_folder
                     else:
@@ -81,10 +84,7 @@ class MediaFileService:
                         try:
                             # 循環インポートを避けるため、関数内でインポート
                             from .html_generator import HtmlGenerator
-                            html_generator = HtmlGenerator()
-                            parent_html_content = html_generator.generate_html_content(parent_entity)
-                            with open(parent_html_file, 'w', encoding='utf-8') as f:
-                                f.write(parent_html_content)
+                            HtmlGenerator()._request_html_write(parent_entity, parent_html_file)
                         except Exception as e:
                             print(f"Warning: Failed to save parent HTML to {parent_html_file}: {e}")
             else:
@@ -100,22 +100,33 @@ class MediaFileService:
                         page_folder.mkdir(parents=False, exist_ok=True)
                     except FileNotFoundError as e:
                         raise ValueError(f'フォルダの作成に失敗しました: {page_folder}. エラー: {e}')
+                    self.path_service.record_page_folder(entity.id, page_folder)
         
         # content 内の temp_uploads を参照する画像・動画URLを抽出
-        pattern = r'(/media/uploads/temp_uploads/[^"\'>\s]+)'
-        matches = re.findall(pattern, content)
+        temp_prefix = '/media/uploads/temp_uploads/'
+        temp_references = [
+            reference for reference in ContentScanner.scan(content).temp_upload_references()
+            if reference.media_url.startswith(temp_prefix)
+        ]
         
-        updated_content = content
         folder_path_str = str(page_folder_relative).replace('\\', '/')
         
         # page_folderの絶対パスを取得
-        if entity:
-            page_folder = self.path_service.get_page_folder_absolute_path(entity, entity_cache)
+        if entity and not self.path_service.uses_id_layout:
+            page_folder = self.path_service.get_page_folder_absolute_path(entity)
         else:
             page_folder = self.uploads_dir / page_folder_relative
         
-        for old_url in matches:
-            filename = old_url.split('/')[-1]
+        # 移動したファイルの 一時URL（クエリ・フラグメントなし） -> 新しいURL
+        moved_urls: Dict[str, str] = {}
+        for reference in temp_references:
+            old_url = reference.media_url.split('?')[0].split('#')[0]
+            if old_url in moved_urls:
+                continue
+            url_filename = old_url.split('/')[-1]
+            filename = urllib.parse.unquote(url_filename)
+            if not filename or '/' in filename or filename in ('.', '..'):
+                continue
             old_path = temp_folder / filename
             new_path = page_folder / filename
             
@@ -125,11 +136,22 @@ class MediaFileService:
                         raise ValueError(f'ページフォルダが存在しません: {page_folder}')
                     
                     shutil.move(str(old_path), str(new_path))
-                    new_url = f'/media/uploads/{folder_path_str}/{filename}'
-                    updated_content = updated_content.replace(old_url, new_url)
+                    moved_urls[old_url] = f'/media/uploads/{folder_path_str}/{url_filename}'
                 except Exception as e:
                     print(f"Warning: Failed to move image {old_path}: {e}")
         
+        def replace(reference: ContentReference) -> Optional[str]:
+            old_url = reference.media_url.split('?')[0].split('#')[0] if reference.media_url else None
+            if old_url not in moved_urls:
+                return None
+            return reference.with_media_url(moved_urls[old_url] + reference.media_url[len(old_url):])
+        
+        updated_content = ContentScanner.scan(content).rewrite(content, replace) if moved_urls else content
+        
+        # ページに移動したファイルは一時アップロードの登録から外す（掃除の対象にしない）
+        if moved_urls:
+            self.temp_upload_repository.delete([MediaReferenceExtractor.to_media_path(url) for url in moved_urls])
+        
         self._cleanup_empty_temp_folder(temp_folder)
         
         return updated_content
@@ -144,7 +166,14 @@ class MediaFileService:
         if not removed_media:
             return
         
+        removed_blobs = []
         for media_url in removed_media:
+            # blob は他のページと共有されうるため、参照表で参照数を確認してから削除する
+            media_path = MediaReferenceExtractor.to_media_path(media_url)
+            if media_path and self.blob_store.is_blob_path(media_path):
+                removed_blobs.append(media_path)
+                continue
+            
             if media_url.startswith('/media/'):
                 relative_path = media_url.replace('/media/', '')
                 relative_path = relative_path.split('?')[0].split('#')[0]
@@ -166,11 +195,20 @@ class MediaFileService:
                     if filename in referenced_filenames:
                         continue
                     
+                    # 他のページがまだ参照しているファイルは削除しない（メディア参照表の索引検索）
+                    if self.repository:
+                        media_path = MediaReferenceExtractor.to_media_path(media_url)
+                        referencing_ids = self.repository.find_page_ids_referencing_media(media_path) if media_path else []
+                        if any(pid != page_id for pid in referencing_ids):
+                            continue
+                    
                     try:
                         os.remove(file_path)
                         print(f"✗ DELETED: {file_path}")
                     except Exception as e:
                         print(f"✗ Warning: Failed to delete media {file_path}: {e}")
+        
+        self.blob_store.release(removed_blobs)
     
     def delete_orphaned_media(self, page_id: int, content: str) -> None:
         """ページフォルダ内のうちコンテンツで参照されない画像・動画を削除する"""
@@ -238,7 +276,8 @@ class MediaFileService:
         folder_files = set()
         try:
             for file_path in page_folder.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() != '.html':
+                # HTMLと分割アップロード中の一時ファイル（.part）は対象外
+                if file_path.is_file() and file_path.suffix.lower() not in ('.html', '.part'):
                     folder_files.add(file_path.name)
         except Exception as e:
             print(f"Warning: Failed to list files in {page_folder}: {e}")
@@ -280,42 +319,53 @@ class MediaFileService:
         if deleted_count > 0:
             print(f"✓ Deleted {deleted_count} orphaned file(s) from {page_folder}")
     
-    def delete_page_media_folders(self, page_ids: List[int], entities_map: Optional[Dict[int, PageEntity]] = None) -> None:
-        """指定ページID群の画像フォルダを削除する"""
+    def release_media_blobs(self, media_paths) -> int:
+        """どのページからも参照されなくなった blob を削除する（参照表の更新後に呼ぶ）"""
+        return self.blob_store.release(media_paths)
+    
+    def delete_page_media_folders(
+        self,
+        page_ids: List[int],
+        entities_map: Optional[Dict[int, PageEntity]] = None,
+        folder_paths: Optional[Dict[int, str]] = None
+    ) -> None:
+        """指定ページID群の画像フォルダを削除する
+        
+        エンティティが分かる場合はフォルダ対応表（IDレイアウトでは固定パス）から直接フォルダを特定し、
+        uploads/ 全体の走査は見つからない場合のフォールバックとしてのみ行う。
+        ページの削除後に呼ぶ場合は対応表の行も消えているため、削除前に読み込んだ対応表を folder_paths に渡す。
+        """
+        removed_ids = set()
         for page_id in page_ids:
-            page_folder = None
+            entity = entities_map.get(page_id) if entities_map else None
             
-            # まず、最も確実な方法としてパターンマッチングで検索
-            # _page_{page_id}_パターンは一意なので、これで確実に見つかる
-            print(f"Searching for folder with page_id={page_id}...")
-            for item in self.uploads_dir.rglob(f'*_page_{page_id}_*'):
-                if item.is_dir():
-                    page_folder = item
-                    print(f"Found folder by pattern matching: {page_folder}")
-                    break
+            # 階層レイアウトでは、祖先のフォルダを削除した時点で子孫のフォルダも削除されている
+            if entity and not self.path_service.uses_id_layout and self._has_removed_ancestor(entity, entities_map, removed_ids):
+                removed_ids.add(page_id)
+                continue
             
-            # パターンマッチングで見つからない場合、エンティティマップを使用
-            if not page_folder and entities_map and page_id in entities_map:
-                entity = entities_map[page_id]
-                print(f"Trying to find folder using entity info for page_id={page_id}...")
-                # まず既存フォルダを検索（orderが変更された場合に対応）
-                page_folder = self.path_service.find_existing_page_folder(entity, entities_map)
-                if not page_folder:
-                    # 既存フォルダが見つからない場合は、通常のパスを計算
-                    page_folder = self.path_service.get_page_folder_absolute_path(entity, entities_map)
-                    print(f"Calculated folder path: {page_folder}")
+            page_folder = None
+            if entity:
+                page_folder = self.path_service.find_existing_page_folder(entity, folder_paths)
+            elif self.path_service.uses_id_layout:
+                page_folder = self.uploads_dir / self.path_service.get_id_folder_path(page_id)
+            elif folder_paths and page_id in folder_paths:
+                page_folder = self.uploads_dir / folder_paths[page_id]
             
-            # まだ見つからない場合、従来の方法で検索
-            if not page_folder:
-                print(f"Trying fallback method for page_id={page_id}...")
-                page_folder_relative = self.path_service.get_page_folder_path_by_id(page_id, entities_map)
-                page_folder = self.uploads_dir / page_folder_relative
-                print(f"Fallback folder path: {page_folder}")
+            # 見つからない場合は、パターンマッチングで検索（_page_{page_id}_パターンは一意）
+            if not page_folder and not self.path_service.uses_id_layout:
+                logger.debug("Folder of page %s is not in the manifest, searching by pattern", page_id)
+                for item in self.uploads_dir.rglob(f'*_page_{page_id}_*'):
+                    if item.is_dir():
+                        page_folder = item
+                        logger.debug("Found folder by pattern matching: %s", page_folder)
+                        break
             
             # フォルダの存在確認と削除
             if page_folder and page_folder.exists() and page_folder.is_dir():
                 try:
                     shutil.rmtree(page_folder)
+                    removed_ids.add(page_id)
                     print(f"✓ Deleted folder: {page_folder}")
                 except Exception as e:
                     print(f"Warning: Failed to delete image folder for page {page_id} ({page_folder}): {e}")
@@ -323,15 +373,17 @@ class MediaFileService:
                     traceback.print_exc()
             else:
                 print(f"Warning: Folder not found for page {page_id}")
-                # デバッグ情報: 実際に存在するフォルダをリスト
-                print(f"Debug: Searching for any folder containing '_page_{page_id}_'...")
-                found_any = False
-                for item in self.uploads_dir.rglob('*'):
-                    if item.is_dir() and f'_page_{page_id}_' in item.name:
-                        print(f"Debug: Found potential folder (but not used): {item}")
-                        found_any = True
-                if not found_any:
-                    print(f"Debug: No folder containing '_page_{page_id}_' was found anywhere")
+    
+    @staticmethod
+    def _has_removed_ancestor(entity: PageEntity, entities_map: Dict[int, PageEntity], removed_ids: set) -> bool:
+        """削除済みフォルダを持つ祖先がいるかを判定する"""
+        parent_id = entity.parent_id
+        while parent_id:
+            if parent_id in removed_ids:
+                return True
+            parent = entities_map.get(parent_id)
+            parent_id = parent.parent_id if parent else None
+        return False
     
     def _cleanup_empty_temp_folder(self, temp_folder: Path) -> None:
         """空になった一時フォルダを削除する"""
@@ -1,115 +1,231 @@
 """メディアパス管理サービス"""
 
+import logging
 import re
 from pathlib import Path
 from typing import Optional, Dict
 from django.conf import settings
 from ...domain.page_aggregate import PageEntity
-from ...domain.repositories import PageRepositoryInterface
+from ...domain.repositories import PageRepositoryInterface, FolderManifestRepositoryInterface
+from ...infrastructure.repositories import FolderManifestRepository
+
+logger = logging.getLogger(__name__)
 
 
 class MediaPathService:
-    """メディアファイルのパス管理を担当するサービス"""
+    """メディアファイルのパス管理を担当するサービス
+    
+    フォルダの配置は settings.PAGE_MEDIA_LAYOUT で切り替える。
+    - 'hierarchical'（既定）: uploads/{order}_page_{id}_{タイトル}/... をページ階層どおりに入れ子にする
+    - 'id': uploads/pages/{id}/ に固定する。タイトル変更・並び替え・移動でフォルダもURLも変わらない
+      （人が読める階層構造は export_media_tree コマンドで別途書き出す）
+    """
+    
+    LAYOUT_HIERARCHICAL = 'hierarchical'
+    LAYOUT_ID = 'id'
+    ID_LAYOUT_DIR = 'pages'
     
-    def __init__(self, repository: Optional[PageRepositoryInterface] = None):
+    def __init__(
+        self,
+        repository: Optional[PageRepositoryInterface] = None,
+        manifest: Optional[FolderManifestRepositoryInterface] = None
+    ):
         self.media_root = Path(settings.MEDIA_ROOT)
         self.uploads_dir = self.media_root / 'uploads'
         self.repository = repository
+        self.manifest = manifest or FolderManifestRepository()
+        self.layout = getattr(settings, 'PAGE_MEDIA_LAYOUT', self.LAYOUT_HIERARCHICAL)
+    
+    @property
+    def uses_id_layout(self) -> bool:
+        """ページIDで固定されたフォルダ配置を使うか"""
+        return self.layout == self.LAYOUT_ID
+    
+    def get_id_folder_path(self, page_id: int) -> Path:
+        """IDレイアウトでのページフォルダの相対パス（タイトル・order・親に依存しない）"""
+        return Path(self.ID_LAYOUT_DIR) / str(page_id)
+    
+    def _to_relative(self, folder: Path) -> Optional[str]:
+        """uploads/ からの相対パス（"/" 区切り）に変換する"""
+        try:
+            return folder.relative_to(self.uploads_dir).as_posix()
+        except ValueError:
+            return None
+    
+    def record_page_folder(self, page_id: int, folder: Path) -> None:
+        """ページのフォルダの所在を対応表に記録する"""
+        relative_path = self._to_relative(folder)
+        if page_id and relative_path:
+            self.manifest.save_path(page_id, relative_path)
+    
+    def record_folder_moved(self, old_folder: Path, new_folder: Path) -> None:
+        """フォルダのリネーム・移動を対応表に反映する（配下のページのフォルダも含む）"""
+        old_path = self._to_relative(old_folder)
+        new_path = self._to_relative(new_folder)
+        if old_path and new_path:
+            self.manifest.move_prefix(old_path, new_path)
+    
+    def find_page_folder_paths_in_subtree(self, page_id: int) -> Dict[int, str]:
+        """指定ページとその子孫のフォルダの相対パスを対応表から取得する（削除で対応表の行が消える前に読む）"""
+        return self.manifest.get_paths_in_subtree(page_id)
+    
+    def find_recorded_page_folder(self, page_id: int) -> Optional[Path]:
+        """対応表に記録されたページのフォルダを取得する（ディレクトリの走査なし）
+        
+        親・タイトルの一致は確認しないため、移動・リネームの前の所在の特定に使う。
+        """
+        relative_path = self.manifest.get_path(page_id)
+        if not relative_path or f'_page_{page_id}_' not in relative_path.split('/')[-1]:
+            return None
+        folder = self.uploads_dir / relative_path
+        return folder if folder.is_dir() else None
+    
+    def find_recorded_child_folders(self, parent_folder: Path, page_ids) -> Optional[Dict[int, Path]]:
+        """指定ページのフォルダのうち、対応表で parent_folder の直下に記録されているものを取得する
+        
+        1つでも直下に記録されていないページがある場合は None（対応表だけでは判断できない）を返す。
+        """
+        parent_path = '' if parent_folder == self.uploads_dir else self._to_relative(parent_folder)
+        if parent_path is None:
+            return None
+        prefix = f'{parent_path}/' if parent_path else ''
+        recorded = self.manifest.get_paths(list(page_ids))
+        folders = {}
+        for page_id in page_ids:
+            relative_path = recorded.get(page_id)
+            if not relative_path or not relative_path.startswith(prefix) or '/' in relative_path[len(prefix):]:
+                return None
+            folders[page_id] = self.uploads_dir / relative_path
+        return folders
+    
+    def _find_folder_in_manifest(self, entity: PageEntity, folder_paths: Optional[Dict[int, str]] = None) -> Optional[Path]:
+        """対応表からページのフォルダを取得する（ディレクトリの走査なし）
+        
+        走査時と同じ条件（フォルダ名にページIDと現在のタイトルを含み、
+        現在の親のフォルダ直下にある）を満たし、実在する場合のみ返す。
+        folder_paths を渡した場合は、対応表を読まずにその中から探す。
+        """
+        if folder_paths is not None:
+            relative_path = folder_paths.get(entity.id)
+        else:
+            relative_path = self.manifest.get_path(entity.id)
+        if not relative_path:
+            return None
+        
+        parts = relative_path.split('/')
+        safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
+        if f'_page_{entity.id}_' not in parts[-1] or safe_title not in parts[-1]:
+            return None
+        if entity.parent_id:
+            if len(parts) < 2 or f'_page_{entity.parent_id}_' not in parts[-2]:
+                return None
+        elif len(parts) != 1:
+            return None
+        
+        folder = self.uploads_dir / relative_path
+        return folder if folder.is_dir() else None
+    
+    def _get_parent_entity(self, entity: PageEntity) -> Optional[PageEntity]:
+        """親エンティティを取得する
+        
+        リポジトリに読み込まれていない場合は、祖先パスを使って祖先チェーン全体を1回で読み込む
+        （アイデンティティマップに入るため、以降の階層をたどる処理ではDBアクセスが発生しない）。
+        """
+        parent_entity = self.repository.get_loaded(entity.parent_id)
+        if parent_entity is not None:
+            return parent_entity
+        
+        ancestors = self.repository.find_ancestors(entity.parent_id, include_self=True)
+        return next((a for a in ancestors if a.id == entity.parent_id), None)
     
     def get_page_folder_name(self, entity: PageEntity) -> str:
         """ページのフォルダ名のみを取得する（親パスを含まない）"""
         safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
         return f'{entity.order}_page_{entity.id}_{safe_title}'
     
-    def get_page_folder_path(self, entity: PageEntity, entity_cache: Optional[Dict[int, PageEntity]] = None) -> Path:
-        """ページのフォルダパスを階層構造で取得する（相対パス）"""
+    def get_page_folder_path(self, entity: PageEntity) -> Path:
+        """ページのフォルダパスを取得する（相対パス）"""
+        if self.uses_id_layout:
+            return self.get_id_folder_path(entity.id)
+        return self.get_hierarchical_folder_path(entity)
+    
+    def get_hierarchical_folder_path(self, entity: PageEntity) -> Path:
+        """ページのフォルダパスを階層構造で取得する（相対パス。レイアウト設定に関係なく階層名を返す）"""
         safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
         folder_name = f'{entity.order}_page_{entity.id}_{safe_title}'
         
         if entity.parent_id and self.repository:
-            # キャッシュから親エンティティを取得、なければDBから取得
-            parent_entity = None
-            if entity_cache:
-                parent_entity = entity_cache.get(entity.parent_id)
-            
-            if parent_entity is None:
-                parent_entity = self.repository.find_by_id(entity.parent_id)
-                if parent_entity and entity_cache is not None:
-                    entity_cache[entity.parent_id] = parent_entity
+            parent_entity = self._get_parent_entity(entity)
             
             if parent_entity:
-                parent_path = self.get_page_folder_path(parent_entity, entity_cache)
+                parent_path = self.get_hierarchical_folder_path(parent_entity)
                 return parent_path / folder_name
         
         return Path(folder_name)
     
-    def get_page_folder_path_by_id(self, page_id: int, entity_cache: Optional[Dict[int, PageEntity]] = None) -> Path:
+    def get_page_folder_path_by_id(self, page_id: int) -> Path:
         """ページIDからフォルダパスを取得する"""
+        if self.uses_id_layout:
+            return self.get_id_folder_path(page_id)
+        
         if not self.repository:
             return Path(f'page_{page_id}')
         
-        # キャッシュから取得、なければDBから取得
-        entity = None
-        if entity_cache:
-            entity = entity_cache.get(page_id)
-        
-        if entity is None:
-            entity = self.repository.find_by_id(page_id)
-            if entity and entity_cache is not None:
-                entity_cache[page_id] = entity
-        
+        entity = self.repository.find_by_id(page_id)
         if entity:
-            return self.get_page_folder_path(entity, entity_cache)
+            return self.get_page_folder_path(entity)
         
         return Path(f'page_{page_id}')
     
-    def get_page_folder_absolute_path(self, entity: PageEntity, entity_cache: Optional[Dict[int, PageEntity]] = None) -> Path:
+    def get_page_folder_absolute_path(self, entity: PageEntity) -> Path:
         """ページのフォルダの絶対パスを取得する"""
+        if self.uses_id_layout:
+            return self.uploads_dir / self.get_id_folder_path(entity.id)
+        
         safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
         folder_name = f'{entity.order}_page_{entity.id}_{safe_title}'
         
         if entity.parent_id and self.repository:
-            # キャッシュから親エンティティを取得、なければDBから取得
-            parent_entity = None
-            if entity_cache:
-                parent_entity = entity_cache.get(entity.parent_id)
-            
-            if parent_entity is None:
-                print(f"Warning: Parent {entity.parent_id} not in cache in get_page_folder_absolute_path (entity={entity.id}), fetching from DB")
-                parent_entity = self.repository.find_by_id(entity.parent_id)
-                if parent_entity and entity_cache is not None:
-                    entity_cache[entity.parent_id] = parent_entity
-            else:
-                print(f"Debug: Parent {entity.parent_id} found in cache in get_page_folder_absolute_path (entity={entity.id})")
+            parent_entity = self._get_parent_entity(entity)
             
             if parent_entity:
-                parent_folder = self.get_page_folder_absolute_path(parent_entity, entity_cache)
+                parent_folder = self.get_page_folder_absolute_path(parent_entity)
                 return parent_folder / folder_name
         else:
             # ルートページの場合（デバッグログを追加）
             if entity.id:
-                print(f"Debug: Entity {entity.id} is a root page in get_page_folder_absolute_path")
+                logger.debug("Entity %s is a root page in get_page_folder_absolute_path", entity.id)
         
         return self.uploads_dir / folder_name
     
-    def find_existing_parent_folder(self, parent_entity: PageEntity, entity_cache: Optional[Dict[int, PageEntity]] = None) -> Optional[Path]:
-        """既存の親フォルダを検索する（orderが変更された場合に対応）"""
+    def find_existing_parent_folder(self, parent_entity: PageEntity) -> Optional[Path]:
+        """既存の親フォルダを検索する（orderが変更された場合に対応）
+        
+        通常は対応表を1回読むだけで解決し、見つからない場合のみディレクトリを走査して対応表を修復する。
+        """
+        if self.uses_id_layout:
+            folder = self.get_page_folder_absolute_path(parent_entity)
+            return folder if folder.is_dir() else None
+        
+        folder = self._find_folder_in_manifest(parent_entity)
+        if folder:
+            return folder
+        
+        logger.debug("Folder of page %s is not in the manifest, scanning directories", parent_entity.id)
+        folder = self._scan_parent_folder(parent_entity)
+        if folder:
+            self.record_page_folder(parent_entity.id, folder)
+        return folder
+    
+    def _scan_parent_folder(self, parent_entity: PageEntity) -> Optional[Path]:
+        """ディレクトリを走査して親フォルダを検索する（対応表の修復用）"""
         safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', parent_entity.title)
         
         if parent_entity.parent_id and self.repository:
-            # キャッシュから親エンティティを取得、なければDBから取得
-            grandparent_entity = None
-            if entity_cache:
-                grandparent_entity = entity_cache.get(parent_entity.parent_id)
-            
-            if grandparent_entity is None:
-                print(f"Warning: Grandparent {parent_entity.parent_id} not in cache in find_existing_parent_folder, fetching from DB")
-                grandparent_entity = self.repository.find_by_id(parent_entity.parent_id)
-                if grandparent_entity and entity_cache is not None:
-                    entity_cache[parent_entity.parent_id] = grandparent_entity
+            grandparent_entity = self._get_parent_entity(parent_entity)
             
             if grandparent_entity:
-                grandparent_folder = self.find_existing_parent_folder(grandparent_entity, entity_cache)
+                grandparent_folder = self.find_existing_parent_folder(grandparent_entity)
                 if grandparent_folder and grandparent_folder.exists():
                     for item in grandparent_folder.iterdir():
                         if item.is_dir() and f'_page_{parent_entity.id}_' in item.name and safe_title in item.name:
@@ -121,26 +237,41 @@ class MediaPathService:
         
         return None
     
-    def find_existing_page_folder(self, entity: PageEntity, entity_cache: Optional[Dict[int, PageEntity]] = None) -> Optional[Path]:
-        """既存のページフォルダを検索する（orderが変更された場合に対応）"""
+    def find_existing_page_folder(
+        self,
+        entity: PageEntity,
+        folder_paths: Optional[Dict[int, str]] = None
+    ) -> Optional[Path]:
+        """既存のページフォルダを検索する（orderが変更された場合に対応）
+        
+        通常は対応表を1回読むだけで解決し、見つからない場合のみディレクトリを走査して対応表を修復する。
+        folder_paths には事前に読み込んだ対応表（find_page_folder_paths_in_subtree）を渡せる。
+        """
+        if self.uses_id_layout:
+            folder = self.get_page_folder_absolute_path(entity)
+            return folder if folder.is_dir() else None
+        
+        folder = self._find_folder_in_manifest(entity, folder_paths)
+        if folder:
+            return folder
+        
+        logger.debug("Folder of page %s is not in the manifest, scanning directories", entity.id)
+        folder = self._scan_page_folder(entity)
+        if folder:
+            self.record_page_folder(entity.id, folder)
+        return folder
+    
+    def _scan_page_folder(self, entity: PageEntity) -> Optional[Path]:
+        """ディレクトリを走査してページフォルダを検索する（対応表の修復用）"""
         safe_title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', entity.title)
         
         if entity.parent_id and self.repository:
-            # キャッシュから親エンティティを取得、なければDBから取得
-            parent_entity = None
-            if entity_cache:
-                parent_entity = entity_cache.get(entity.parent_id)
-            
-            if parent_entity is None:
-                print(f"Warning: Parent {entity.parent_id} not in cache in find_existing_page_folder, fetching from DB")
-                parent_entity = self.repository.find_by_id(entity.parent_id)
-                if parent_entity and entity_cache is not None:
-                    entity_cache[entity.parent_id] = parent_entity
+            parent_entity = self._get_parent_entity(entity)
             
             if parent_entity:
-                parent_folder = self.get_page_folder_absolute_path(parent_entity, entity_cache)
+                parent_folder = self.get_page_folder_absolute_path(parent_entity)
                 if not parent_folder.exists() or not parent_folder.is_dir():
-                    parent_folder = self.find_existing_parent_folder(parent_entity, entity_cache)
+                    parent_folder = self.find_existing_parent_folder(parent_entity)
                 
                 if parent_folder and parent_folder.exists() and parent_folder.is_dir():
                     for item in parent_folder.iterdir():
@@ -1,7 +1,7 @@
 """メディアファイル操作サービス（後方互換性のためのラッパー）"""
 
-from typing import Optional, Dict, List
-from ...domain.repositories import PageRepositoryInterface
+from typing import Optional
+from ...domain.repositories import PageRepositoryInterface, FolderManifestRepositoryInterface
 from ...domain.page_aggregate import PageEntity
 from .media_path_service import MediaPathService
 from .media_url_extractor import MediaUrlExtractor
@@ -12,8 +12,12 @@ import shutil
 class MediaService:
     """メディアファイル操作サービス（後方互換性のためのラッパー）"""
     
-    def __init__(self, repository: Optional[PageRepositoryInterface] = None):
-        self.path_service = MediaPathService(repository)
+    def __init__(
+        self,
+        repository: Optional[PageRepositoryInterface] = None,
+        manifest: Optional[FolderManifestRepositoryInterface] = None
+    ):
+        self.path_service = MediaPathService(repository, manifest)
         self.url_extractor = MediaUrlExtractor()
         self.file_service = MediaFileService(repository, self.path_service, self.url_extractor)
         
@@ -22,32 +26,51 @@ class MediaService:
         self.uploads_dir = self.path_service.uploads_dir
         self.repository = repository
     
+    @property
+    def uses_id_layout(self) -> bool:
+        return self.path_service.uses_id_layout
+    
     # パス関連メソッドの委譲
     def get_page_folder_name(self, entity):
         return self.path_service.get_page_folder_name(entity)
     
-    def get_page_folder_path(self, entity, entity_cache: Optional[Dict[int, PageEntity]] = None):
-        return self.path_service.get_page_folder_path(entity, entity_cache)
+    def get_page_folder_path(self, entity):
+        return self.path_service.get_page_folder_path(entity)
+    
+    def get_page_folder_path_by_id(self, page_id: int):
+        return self.path_service.get_page_folder_path_by_id(page_id)
+    
+    def _get_page_folder_absolute_path(self, entity):
+        return self.path_service.get_page_folder_absolute_path(entity)
+    
+    def _find_existing_parent_folder(self, parent_entity):
+        return self.path_service.find_existing_parent_folder(parent_entity)
     
-    def get_page_folder_path_by_id(self, page_id: int, entity_cache: Optional[Dict[int, PageEntity]] = None):
-        return self.path_service.get_page_folder_path_by_id(page_id, entity_cache)
+    def _find_existing_page_folder(self, entity):
+        return self.path_service.find_existing_page_folder(entity)
     
-    def _get_page_folder_absolute_path(self, entity, entity_cache: Optional[Dict[int, PageEntity]] = None):
-        return self.path_service.get_page_folder_absolute_path(entity, entity_cache)
+    def find_page_folder_paths_in_subtree(self, page_id: int):
+        return self.path_service.find_page_folder_paths_in_subtree(page_id)
     
-    def _find_existing_parent_folder(self, parent_entity, entity_cache: Optional[Dict[int, PageEntity]] = None):
-        return self.path_service.find_existing_parent_folder(parent_entity, entity_cache)
+    def _find_recorded_page_folder(self, page_id: int):
+        return self.path_service.find_recorded_page_folder(page_id)
     
-    def _find_existing_page_folder(self, entity, entity_cache: Optional[Dict[int, PageEntity]] = None):
-        return self.path_service.find_existing_page_folder(entity, entity_cache)
+    def _find_recorded_child_folders(self, parent_folder, page_ids):
+        return self.path_service.find_recorded_child_folders(parent_folder, page_ids)
+    
+    def _record_page_folder(self, page_id: int, folder):
+        return self.path_service.record_page_folder(page_id, folder)
+    
+    def _record_folder_moved(self, old_folder, new_folder):
+        return self.path_service.record_folder_moved(old_folder, new_folder)
     
     # URL抽出メソッドの委譲
     def extract_media_urls(self, content: str):
         return self.url_extractor.extract_media_urls(content)
     
     # ファイル操作メソッドの委譲
-    def move_temp_images_to_page_folder(self, page_id: int, content: str, entity=None, entity_cache: Optional[Dict[int, PageEntity]] = None):
-        return self.file_service.move_temp_images_to_page_folder(page_id, content, entity, entity_cache)
+    def move_temp_images_to_page_folder(self, page_id: int, content: str, entity=None):
+        return self.file_service.move_temp_images_to_page_folder(page_id, content, entity)
     
     def delete_removed_media(self, page_id: int, old_content: str, new_content: str):
         return self.file_service.delete_removed_media(page_id, old_content, new_content)
@@ -55,5 +78,8 @@ class MediaService:
     def delete_orphaned_media(self, page_id: int, content: str):
         return self.file_service.delete_orphaned_media(page_id, content)
     
-    def delete_page_media_folders(self, page_ids, entities_map=None):
-        return self.file_service.delete_page_media_folders(page_ids, entities_map)
\ No newline at end of file
+    def delete_page_media_folders(self, page_ids, entities_map=None, folder_paths=None):
+        return self.file_service.delete_page_media_folders(page_ids, entities_map, folder_paths)
+    
+    def release_media_blobs(self, media_paths):
+        return self.file_service.release_media_blobs(media_paths)
\ No newline at end of file
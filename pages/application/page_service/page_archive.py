@@ -0,0 +1,176 @@
+"""ページのサブツリーのZIPエクスポート"""
+
+import io
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque, Iterator, List, Optional, Tuple
+from django.conf import settings
+
+from ...domain.page_aggregate import PageEntity
+from ...domain.repositories import PageRepositoryInterface
+from .html_generator import HtmlGenerator
+from .media_service import MediaService
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """ZipFile の書き込み先（書き込まれたバイト列を溜めておき、drain() で取り出す）
+
+    シークできないため、ZipFile はエントリごとにデータディスクリプタを使って書き込む
+    （アーカイブ全体を一時ファイルに書く必要がない）。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> List[bytes]:
+        """溜まっているバイト列を取り出す"""
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+class PageArchiveService:
+    """
+    ページとその子孫をZIPとして少しずつ生成するサービス
+
+    ZIPの構成:
+    - {order}_page_{id}_{タイトル}/{タイトル}.html がページ階層どおりに入れ子になる
+    - 参照されているメディアは media/{MEDIA_ROOT からの相対パス} に1回だけ格納し、
+      HTMLからは相対パスでリンクする（base64で埋め込まない）
+
+    メディアファイルはスレッドプールで先読みし、書き込みと並行して読み込む。
+    """
+
+    MEDIA_DIR = 'media'
+    # 先読みするファイル数
+    READ_AHEAD = 8
+    # これより大きいファイルは先読みせず、書き込み時に CHUNK_SIZE ずつ読み込む
+    READ_AHEAD_MAX_BYTES = 8 * 1024 * 1024
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(
+        self,
+        repository: PageRepositoryInterface,
+        media_service: Optional[MediaService] = None,
+        html_generator: Optional[HtmlGenerator] = None,
+        max_workers: int = 4
+    ):
+        self.repository = repository
+        self.media_service = media_service or MediaService(repository)
+        self.html_generator = html_generator or HtmlGenerator(media_service=self.media_service)
+        self.max_workers = max_workers
+        self.media_root = Path(settings.MEDIA_ROOT)
+
+    def stream_subtree_zip(self, page_id: int) -> Optional[Tuple[str, Iterator[bytes]]]:
+        """ページとその子孫のZIPを少しずつ生成する（ルートページのタイトルとZIPの断片のイテレータを返す）"""
+        root = self.repository.find_with_all_descendants(page_id)
+        if root is None:
+            return None
+
+        media_paths = sorted(self.repository.find_media_paths_in_subtree(page_id))
+        return root.title, self._iter_zip(root, media_paths)
+
+    def _iter_zip(self, root: PageEntity, media_paths: List[str]) -> Iterator[bytes]:
+        """ZIPを書き込みながら、書き込まれた分を順に返す"""
+        buffer = _ZipStreamBuffer()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='page-archive') as pool:
+            with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for arcname, html in self._iter_page_documents(root, ()):
+                    archive.writestr(arcname, html)
+                    yield from buffer.drain()
+
+                for media_path, file_path, data in self._iter_media_files(pool, media_paths):
+                    info = zipfile.ZipInfo(
+                        f'{self.MEDIA_DIR}/{media_path}',
+                        date_time=time.localtime(file_path.stat().st_mtime)[:6]
+                    )
+                    # 画像・動画は圧縮済みのことが多いため、圧縮せずに格納する
+                    info.compress_type = zipfile.ZIP_STORED
+                    with archive.open(info, 'w', force_zip64=True) as dest:
+                        for chunk in data:
+                            dest.write(chunk)
+                            yield from buffer.drain()
+                    yield from buffer.drain()
+            # 中央ディレクトリ（ZipFile を閉じたときに書き込まれる）
+            yield from buffer.drain()
+
+    def _iter_page_documents(self, entity: PageEntity, parent_parts: Tuple[str, ...]) -> Iterator[Tuple[str, str]]:
+        """ページと子孫の (ZIP内のパス, HTML) を階層順に返す"""
+        parts = parent_parts + (self.media_service.path_service.get_page_folder_name(entity),)
+        media_url_prefix = '../' * len(parts) + f'{self.MEDIA_DIR}/'
+        safe_title = re.sub(r'[<>:"/\\|?*]', '_', entity.title)
+
+        html = self.html_generator.generate_linked_html_content(entity, media_url_prefix)
+        yield '/'.join(parts + (f'{safe_title}.html',)), html
+
+        for child in entity.children:
+            yield from self._iter_page_documents(child, parts)
+
+    def _iter_media_files(self, pool: ThreadPoolExecutor, media_paths: List[str]) -> Iterator[Tuple[str, Path, Iterator[bytes]]]:
+        """メディアファイルを先読みしながら (相対パス, 絶対パス, 内容の断片) を順に返す（存在しないファイルは飛ばす）"""
+        pending: Deque[Tuple[str, Path, Future]] = deque()
+        remaining = iter(media_paths)
+
+        def submit_next() -> None:
+            for media_path in remaining:
+                file_path = self._resolve_media_path(media_path)
+                if file_path is not None:
+                    # ZIP内のパスは正規化後のパスから作る（".." などを含めない）
+                    relative_path = file_path.relative_to(self.media_root.resolve()).as_posix()
+                    pending.append((relative_path, file_path, pool.submit(self._read_ahead, file_path)))
+                    return
+
+        for _ in range(self.READ_AHEAD):
+            submit_next()
+
+        while pending:
+            media_path, file_path, future = pending.popleft()
+            submit_next()
+            try:
+                data = future.result()
+            except OSError as e:
+                print(f"Warning: Failed to read media file {file_path} for archive: {e}")
+                continue
+            if data is None:
+                # 先読みしない大きなファイル
+                yield media_path, file_path, self._iter_file_chunks(file_path)
+            else:
+                yield media_path, file_path, iter((data,))
+
+    def _resolve_media_path(self, media_path: str) -> Optional[Path]:
+        """MEDIA_ROOT 配下の既存ファイルの絶対パス（配下でない・存在しない場合は None）"""
+        file_path = (self.media_root / media_path).resolve()
+        if not file_path.is_relative_to(self.media_root.resolve()) or not file_path.is_file():
+            return None
+        return file_path
+
+    def _read_ahead(self, file_path: Path) -> Optional[bytes]:
+        """ファイルを読み込む（READ_AHEAD_MAX_BYTES を超える場合は読み込まずに None）"""
+        if file_path.stat().st_size > self.READ_AHEAD_MAX_BYTES:
+            return None
+        return file_path.read_bytes()
+
+    def _iter_file_chunks(self, file_path: Path) -> Iterator[bytes]:
+        """ファイルを CHUNK_SIZE ずつ読み込む"""
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
@@ -65,3 +65,7 @@ class PageCommandService:
     def reorder_page(self, page_id: int, target_page_id: int, position: str) -> Optional[PageDTO]:
         """ページの並び替え：ターゲットの前後に挿入"""
         return self.reorder_service.reorder_page(page_id, target_page_id, position)
+    
+    def rebalance_page_order(self, parent_id: Optional[int]) -> int:
+        """兄弟ページのorderを等間隔に振り直す"""
+        return self.reorder_service.rebalance_siblings(parent_id)
@@ -1,7 +1,7 @@
 """ページ作成サービス"""
 
-from typing import Optional, Dict
-from ...domain.page_aggregate import PageAggregate, PageEntity
+from typing import Optional
+from ...domain.page_aggregate import PageAggregate, PageEntity, PageOrdering
 from ...domain.repositories import PageRepositoryInterface
 from ..dto import CreatePageDTO, PageDTO
 from .dto_converter import DtoConverter
@@ -30,32 +30,21 @@ class PageCreateService:
             title=dto.title,
             content=dto.content,
             parent_id=dto.parent_id,
-            order=max_order + 10
+            order=PageOrdering.next_order(max_order)
         )
         
         entity = DtoConverter.aggregate_to_entity(aggregate)
         saved_entity = self.repository.save(entity)
         
-        # entity_cacheを作成して親エンティティをキャッシュ
-        entity_cache: Dict[int, PageEntity] = {}
-        entity_cache[saved_entity.id] = saved_entity
-        
-        if saved_entity.parent_id:
-            parent_entity = self.repository.find_by_id(saved_entity.parent_id)
-            if parent_entity:
-                entity_cache[saved_entity.parent_id] = parent_entity
-        
         saved_entity.content = self.media_service.move_temp_images_to_page_folder(
             saved_entity.id,
             saved_entity.content,
-            entity=saved_entity,
-            entity_cache=entity_cache
+            entity=saved_entity
         )
         if saved_entity.content != dto.content:
             saved_entity = self.repository.save(saved_entity)
-            entity_cache[saved_entity.id] = saved_entity
         
-        self.html_generator.save_html_to_folder(saved_entity, entity_cache)
+        self.html_generator.save_html_to_folder(saved_entity)
         
         return DtoConverter.entity_to_dto(saved_entity)
     
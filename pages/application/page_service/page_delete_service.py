@@ -1,6 +1,5 @@
 """ページ削除サービス"""
 
-from ...domain.page_aggregate import PageAggregate
 from ...domain.repositories import PageRepositoryInterface
 from .media_service import MediaService
 
@@ -18,22 +17,17 @@ class PageDeleteService:
     
     def delete_page(self, page_id: int) -> bool:
         """ページとその子孫、関連画像を削除する"""
-        entity = self.repository.find_with_all_descendants(page_id)
-        if entity is None:
-            return False
-        
-        aggregate = PageAggregate.from_entity_tree(entity)
-        page_ids_to_delete = aggregate.collect_all_page_ids()
+        # 削除するページが参照しているメディア（参照表が消える前に取得し、削除後に共有 blob の参照数を確認する）
+        media_paths = self.repository.find_media_paths_in_subtree(page_id)
+        # フォルダ対応表の行もページと同時に削除されるため、フォルダの所在を先に読み込んでおく
+        folder_paths = self.media_service.find_page_folder_paths_in_subtree(page_id)
         
-        # 削除前にエンティティ情報を保持（エンティティマップを作成）
-        entities_map = {}
-        def collect_entities(e):
-            entities_map[e.id] = e
-            for child in e.children:
-                collect_entities(child)
-        collect_entities(entity)
+        # 削除と同時に、メディアフォルダ削除に必要なエンティティ情報を受け取る
+        page_ids_to_delete, entities_map = self.repository.delete_with_descendants(page_id)
+        if not page_ids_to_delete:
+            return False
         
-        self.repository.delete(page_id)
-        self.media_service.delete_page_media_folders(page_ids_to_delete, entities_map)
+        self.media_service.delete_page_media_folders(page_ids_to_delete, entities_map, folder_paths)
+        self.media_service.release_media_blobs(media_paths)
         
         return True
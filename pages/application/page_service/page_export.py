@@ -1,6 +1,6 @@
 """ページエクスポート操作"""
 
-from typing import Optional
+from typing import Optional, Iterator, Tuple
 from ...domain.page_aggregate import PageAggregate, PageEntity
 from ...domain.repositories import PageRepositoryInterface
 from .html_generator import HtmlGenerator
@@ -24,3 +24,11 @@ class PageExportService:
             return None
         
         return self.html_generator.generate_html_content(entity)
+    
+    def stream_page_as_html(self, page_id: int) -> Optional[Tuple[str, Iterator[str]]]:
+        """ページを画像埋め込み済み単一HTMLとして少しずつ生成する（タイトルとHTMLの断片のイテレータを返す）"""
+        entity = self.repository.find_by_id(page_id)
+        if entity is None:
+            return None
+        
+        return entity.title, self.html_generator.iter_html_content(entity)
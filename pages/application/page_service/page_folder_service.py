@@ -1,6 +1,7 @@
 """ページフォルダ管理サービス（ファサード）"""
 
-from typing import Optional, Dict
+from typing import Optional
+from ...domain.page_aggregate import PageEntity
 from ...domain.repositories import PageRepositoryInterface
 from .media_service import MediaService
 from .folder_move_service import FolderMoveService
@@ -8,7 +9,11 @@ from .folder_cleanup_service import FolderCleanupService
 
 
 class PageFolderService:
-    """ページフォルダの管理を担当するサービス（ファサード）"""
+    """ページフォルダの管理を担当するサービス（ファサード）
+    
+    IDレイアウト（settings.PAGE_MEDIA_LAYOUT = 'id'）ではフォルダ名がタイトル・order・親に
+    依存しないため、リネーム・移動・クリーンアップはいずれも何もしない。
+    """
     
     def __init__(
         self,
@@ -25,9 +30,11 @@ class PageFolderService:
         )
     
     # クリーンアップメソッドの委譲
-    def cleanup_old_folder(self, old_title: str, entity: 'PageEntity', entity_cache: Optional[Dict[int, 'PageEntity']] = None) -> None:
+    def cleanup_old_folder(self, old_title: str, entity: 'PageEntity') -> None:
         """タイトル変更時に古いフォルダをクリーンアップ"""
-        return self.cleanup_service.cleanup_old_folder(old_title, entity, entity_cache)
+        if self.media_service.uses_id_layout:
+            return None
+        return self.cleanup_service.cleanup_old_folder(old_title, entity)
     
     def cleanup_orphaned_old_folders(
         self, page_id: int, old_folder_name: str, exclude_folder: 'Path'
@@ -37,13 +44,17 @@ class PageFolderService:
             page_id, old_folder_name, exclude_folder
         )
     
-    def cleanup_misplaced_folders_after_save(self, entity: 'PageEntity', entity_cache: Optional[Dict[int, 'PageEntity']] = None) -> None:
+    def cleanup_misplaced_folders_after_save(self, entity: 'PageEntity') -> None:
         """保存後に親階層に誤って作成されたフォルダを削除"""
-        return self.cleanup_service.cleanup_misplaced_folders_after_save(entity, entity_cache)
+        if self.media_service.uses_id_layout:
+            return None
+        return self.cleanup_service.cleanup_misplaced_folders_after_save(entity)
     
-    def cleanup_orphaned_folders_in_parent(self, parent_id: Optional[int], entity_cache: Optional[Dict[int, PageEntity]] = None) -> None:
+    def cleanup_orphaned_folders_in_parent(self, parent_id: Optional[int]) -> None:
         """親フォルダ内のDBに存在しない孤立フォルダを削除する"""
-        return self.cleanup_service.cleanup_orphaned_folders_in_parent(parent_id, entity_cache)
+        if self.media_service.uses_id_layout:
+            return None
+        return self.cleanup_service.cleanup_orphaned_folders_in_parent(parent_id)
     
     # 移動・リネームメソッドの委譲
     def move_folder_contents(
@@ -61,16 +72,19 @@ class PageFolderService:
         return self.move_service.remove_empty_folders(folder)
     
     def rename_folder_on_order_change(
-        self, entity: 'PageEntity', old_order: int, entity_cache: Optional[Dict[int, PageEntity]] = None
+        self, entity: 'PageEntity', old_order: int
     ) -> tuple:
         """order変更時にフォルダをリネームする"""
-        return self.move_service.rename_folder_on_order_change(entity, old_order, entity_cache)
+        if self.media_service.uses_id_layout:
+            return None, None
+        return self.move_service.rename_folder_on_order_change(entity, old_order)
     
     def move_folder_to_new_parent(
         self, 
         entity: 'PageEntity', 
-        old_parent_id: Optional[int],
-        entity_cache: Optional[Dict[int, PageEntity]] = None
+        old_parent_id: Optional[int]
     ) -> None:
         """親が変わった場合にフォルダを古い親から新しい親に移動する"""
-        return self.move_service.move_folder_to_new_parent(entity, old_parent_id, entity_cache)
+        if self.media_service.uses_id_layout:
+            return None
+        return self.move_service.move_folder_to_new_parent(entity, old_parent_id)
@@ -3,7 +3,7 @@
 import traceback
 from typing import Optional
 from datetime import datetime
-from ...domain.page_aggregate import PageAggregate, PageDomainService
+from ...domain.page_aggregate import PageAggregate, PageDomainService, PageOrdering
 from ...domain.repositories import PageRepositoryInterface
 from ..dto import PageDTO
 from .dto_converter import DtoConverter
@@ -43,15 +43,16 @@ class PageMoveService:
         parent_changed = entity.parent_id != new_parent_id
         
         if parent_changed:
-            all_pages = self.repository.find_all_pages()
-            if not PageDomainService.validate_hierarchy(new_parent_id, page_id, all_pages):
+            # 全ページではなく、新しい親の祖先チェーンだけで循環参照を検証する
+            parent_chain = self.repository.find_ancestors(new_parent_id, include_self=True) if new_parent_id else []
+            if not PageDomainService.validate_hierarchy(new_parent_id, page_id, parent_chain):
                 raise ValueError('循環参照を防ぐため、この操作は許可されません')
         
         aggregate = PageAggregate.from_entity_tree(entity)
         aggregate.parent_id = new_parent_id
         
         max_order = self._calculate_max_order(new_parent_id, exclude_page_id=page_id)
-        aggregate.order = max_order + 10
+        aggregate.order = PageOrdering.next_order(max_order)
         aggregate.updated_at = datetime.now()
         
         entity = DtoConverter.aggregate_to_entity(aggregate)
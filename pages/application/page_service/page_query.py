@@ -23,22 +23,32 @@ class PageQueryService:
         entities = self.repository.find_all_root_pages()
         return [DtoConverter.entity_to_dto(entity) for entity in entities]
     
-    def get_page_tree(self) -> dict:
-        """すべてのページをツリー構造として取得する"""
-        all_pages = self.repository.find_all_pages()
+    def get_page_tree(self, include_content: bool = True) -> dict:
+        """すべてのページをツリー構造として取得する
+        
+        Args:
+            include_content: Falseの場合はcontentを一切読み込まず、
+                           ツリー表示に必要な項目だけを返す（サイドバー用）
+        """
+        if include_content:
+            all_pages = self.repository.find_all_pages()
+        else:
+            all_pages = self.repository.find_all_tree_nodes()
         root_pages = self.domain_service.build_page_tree(all_pages)
         
         def entity_to_tree_dict(entity: PageEntity) -> dict:
-            return {
+            tree_dict = {
                 'id': entity.id,
                 'title': entity.title,
-                'content': entity.content,
                 'icon': entity.icon,
                 'parent_id': entity.parent_id,
                 'created_at': entity.created_at.isoformat(),
                 'updated_at': entity.updated_at.isoformat(),
                 'children': [entity_to_tree_dict(child) for child in entity.children]
             }
+            if include_content:
+                tree_dict['content'] = entity.content
+            return tree_dict
         
         return {
             'pages': [entity_to_tree_dict(page) for page in root_pages]
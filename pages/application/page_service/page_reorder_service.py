@@ -1,10 +1,10 @@
 """ページ並び替えサービス"""
 
 import traceback
-from typing import Optional, Set, Dict, List
+from typing import Optional, Set, List
 from datetime import datetime
 from django.db import transaction
-from ...domain.page_aggregate import PageAggregate
+from ...domain.page_aggregate import PageAggregate, PageOrdering
 from ...domain.repositories import PageRepositoryInterface
 from ...domain.page_aggregate import PageEntity
 from ..dto import PageDTO
@@ -33,15 +33,14 @@ class PageReorderService:
     
     @transaction.atomic
     def reorder_page(self, page_id: int, target_page_id: int, position: str) -> Optional[PageDTO]:
-        """ページの並び替え：ターゲットの前後に挿入（親が異なる場合は親も変更）"""
-        # 初期のエンティティキャッシュを初期化
-        entity_cache: Dict[int, PageEntity] = {}
+        """ページの並び替え：ターゲットの前後に挿入（親が異なる場合は親も変更）
         
+        取得済みのページはリポジトリのアイデンティティマップから返されるため、同じページを
+        何度 find_by_id しても問い合わせは1回で済む。URL書き換えによる変更はリクエストの終わりに書き込まれる。
+        """
         # 1と2を一括取得（リポジトリインターフェース経由）
         entities = self.repository.find_by_ids([page_id, target_page_id])
         entities_dict = {e.id: e for e in entities}
-        # 初期エンティティをキャッシュに追加
-        entity_cache.update(entities_dict)
         
         entity = entities_dict.get(page_id)
         if entity is None:
@@ -55,111 +54,102 @@ class PageReorderService:
         old_parent_id = entity.parent_id
         parent_changed = entity.parent_id != new_parent_id
         
-        # 親ページを事前に取得してキャッシュに追加（後で複数回使用されるため）
-        if target_entity.parent_id and target_entity.parent_id not in entity_cache:
-            print(f"Debug: Fetching parent {target_entity.parent_id} in reorder_page (not in cache)")
-            parent_entity = self.repository.find_by_id(target_entity.parent_id)
-            if parent_entity:
-                entity_cache[target_entity.parent_id] = parent_entity
-                print(f"Debug: Parent {target_entity.parent_id} cached in reorder_page")
-        elif target_entity.parent_id:
-            print(f"Debug: Parent {target_entity.parent_id} already in cache in reorder_page")
-        
         all_pages = None
         if parent_changed:
             from ...domain.page_aggregate import PageDomainService
-            all_pages = self.repository.find_all_pages()
-            if not PageDomainService.validate_hierarchy(new_parent_id, page_id, all_pages):
+            # 全ページではなく、新しい親の祖先チェーンだけで循環参照を検証する
+            parent_chain = self.repository.find_ancestors(new_parent_id, include_self=True) if new_parent_id else []
+            if not PageDomainService.validate_hierarchy(new_parent_id, page_id, parent_chain):
                 raise ValueError('循環参照を防ぐため、この操作は許可されません')
         
-        # existing_pages_dictは不要（bulk_updateで内部処理される）
-        updated_siblings, old_orders, saved_entities_cache, entity_cache = self._execute_reorder(
-            entity, target_entity, target_page_id, position, entity_cache
+        updated_siblings, old_orders = self._execute_reorder(
+            entity, target_entity, target_page_id, position
         )
         
-        # 注: entity_cache.copy()は不要（同じ参照を使い続けるべき）
-        # キャッシュは参照渡しで共有されるため、copy()を使うと新しい辞書が作成されるが、
-        # 値（エンティティ）自体は参照がコピーされるため、基本的には問題ないが、
-        # 後の処理でキャッシュに追加されたエンティティが失われる可能性がある
-        
         if parent_changed:
-            saved_entity = entity_cache.get(page_id) or self.repository.find_by_id(page_id)
+            saved_entity = self.repository.find_by_id(page_id)
             if saved_entity:
-                entity_cache[page_id] = saved_entity
                 try:
-                    # entity_cacheを渡して親エンティティの重複取得を避ける
-                    # 親エンティティ（new_parent_id）がキャッシュにあることを確認
-                    if new_parent_id and new_parent_id not in entity_cache:
-                        parent_entity = self.repository.find_by_id(new_parent_id)
-                        if parent_entity:
-                            entity_cache[new_parent_id] = parent_entity
-                    self.folder_service.move_folder_to_new_parent(saved_entity, old_parent_id, entity_cache)
+                    self.folder_service.move_folder_to_new_parent(saved_entity, old_parent_id)
                 except Exception as e:
                     print(f"Warning: Failed to move folder to new parent for page {saved_entity.id}: {e}")
                     traceback.print_exc()
         
-        # _handle_order_changesでエンティティを取得し、キャッシュに保存
-        affected_page_ids, entity_cache = self._handle_order_changes(
-            updated_siblings, old_orders, page_id, entity_cache
-        )
+        affected_page_ids = self._handle_order_changes(updated_siblings, old_orders, page_id)
         
         if affected_page_ids:
-            # 全ページを再利用（既に取得済みの場合）、entity_cacheも渡す
-            self.url_service.update_all_pages_content_urls(affected_page_ids, entity_cache, all_pages)
+            self.url_service.update_all_pages_content_urls(affected_page_ids, all_pages)
         
-        # キャッシュされたエンティティを使用
-        # 親エンティティがキャッシュに含まれていることを確認してからHTML生成
-        self._generate_html_for_affected_pages(updated_siblings, page_id, entity_cache)
+        # HTMLは移動したページと、orderが変わった兄弟（リバランスした場合のみ）だけ生成し直す
+        reordered_siblings = [s for s in updated_siblings if old_orders.get(s.id) != s.order]
+        self._generate_html_for_affected_pages(reordered_siblings, page_id)
         
         try:
-            # 親エンティティは既にキャッシュにあるはず（事前に取得済み）
-            if target_entity.parent_id and target_entity.parent_id not in entity_cache:
-                # 念のため取得（通常は到達しない）
-                parent_entity = self.repository.find_by_id(target_entity.parent_id)
-                if parent_entity:
-                    entity_cache[target_entity.parent_id] = parent_entity
-            
-            # cleanup_orphaned_folders_in_parentにもentity_cacheを渡す
-            self.folder_service.cleanup_orphaned_folders_in_parent(target_entity.parent_id, entity_cache)
+            self.folder_service.cleanup_orphaned_folders_in_parent(target_entity.parent_id)
         except Exception as e:
             print(f"Warning: Failed to cleanup orphaned folders: {e}")
             traceback.print_exc()
         
-        # キャッシュからエンティティを取得（必ずキャッシュにあるはず）
-        final_entity = entity_cache.get(page_id)
+        final_entity = self.repository.find_by_id(page_id)
         if final_entity:
             aggregate = PageAggregate.from_entity_tree(final_entity)
             return DtoConverter.entity_to_dto(aggregate) if aggregate.id else None
         return None
     
+    @transaction.atomic
+    def rebalance_siblings(self, parent_id: Optional[int]) -> int:
+        """
+        兄弟ページのorderを等間隔に振り直す（リバランス）
+        
+        並び替えで中間値が取れなくなった兄弟をバックグラウンドで整理するためのもの。
+        orderが変わったページのフォルダ名・コンテンツURL・HTMLも更新する。
+        振り直したページ数を返す。
+        """
+        if parent_id:
+            siblings = self.repository.find_children(parent_id)
+        else:
+            siblings = self.repository.find_all_root_pages()
+        
+        if not siblings:
+            return 0
+        
+        if parent_id:
+            # 祖先をまとめて読み込んでおく（フォルダパスの計算はアイデンティティマップから解決される）
+            self.repository.find_ancestors(parent_id, include_self=True)
+        
+        old_orders = {s.id: s.order for s in siblings}
+        aggregates = [PageAggregate.from_entity_tree(s) for s in siblings]
+        changed = PageOrdering.rebalance(aggregates)
+        if not changed:
+            return 0
+        
+        self.repository.bulk_update(
+            [DtoConverter.aggregate_to_entity(a) for a in changed]
+        )
+        
+        affected_page_ids = self._handle_order_changes(changed, old_orders, changed[0].id)
+        if affected_page_ids:
+            self.url_service.update_all_pages_content_urls(affected_page_ids)
+        
+        self._generate_html_for_affected_pages(changed, changed[0].id)
+        return len(changed)
+    
     def _execute_reorder(
         self, 
         entity, 
         target_entity, 
         target_page_id: int, 
-        position: str,
-        entity_cache: Dict[int, PageEntity]
+        position: str
     ) -> tuple:
-        """並び替えを実行する（保存後のエンティティも返す）"""
+        """並び替えを実行する（更新後の兄弟と、変更前のorderを返す）"""
         target_parent_id = target_entity.parent_id
         
-        # 親ページを事前にキャッシュに追加（後で複数回使用されるため）
-        if target_parent_id and target_parent_id not in entity_cache:
-            parent_entity = self.repository.find_by_id(target_parent_id)
-            if parent_entity:
-                entity_cache[target_parent_id] = parent_entity
-        
         # 兄弟ページをリポジトリ経由で取得
         if target_parent_id:
             siblings_entities = self.repository.find_children(target_parent_id)
         else:
             siblings_entities = self.repository.find_all_root_pages()
         
-        # 兄弟ページをentity_cacheに追加（cleanup_orphaned_folders_in_parentで再利用）
-        for entity_item in siblings_entities:
-            if entity_item.id:
-                entity_cache[entity_item.id] = entity_item
-        
         siblings_entities = [s for s in siblings_entities if s.id != entity.id]
         
         target_in_siblings = any(s.id == target_page_id for s in siblings_entities)
@@ -199,173 +189,68 @@ class PageReorderService:
             entities_to_update.append(entity_to_update)
         
         # 一括更新（existing_pages_dictはNoneで渡す）
-        saved_entities = self.repository.bulk_update(entities_to_update, None)
-        saved_entities_cache = {e.id: e for e in saved_entities}
-        
-        # entity_cacheに保存済みエンティティも追加
-        entity_cache.update(saved_entities_cache)
-        
-        # デバッグ: キャッシュに全てのエンティティが含まれているか確認
-        # 注: updated_sibling_idsには親ページは含まれない（親は更新されないため）が、
-        # entity_cacheには親ページも含まれる可能性があるため、この比較は誤検知を引き起こす
-        # 代わりに、更新された兄弟ページが全てキャッシュに含まれているかを確認する
-        updated_sibling_ids = {s.id for s in updated_siblings}
-        cached_sibling_ids = {sid for sid in entity_cache.keys() if sid in updated_sibling_ids}
-        if updated_sibling_ids != cached_sibling_ids:
-            print(f"Warning: Some updated siblings not in cache. Updated siblings: {updated_sibling_ids}, Cached siblings: {cached_sibling_ids}")
+        # orderが変わらない兄弟は変更検出により書き込まれないため、通常は移動したページのみが更新される
+        # 保存後のエンティティはアイデンティティマップに入るため、以降の find_by_id はそれを返す
+        self.repository.bulk_update(entities_to_update, None)
         
         if entity.id not in old_orders:
             old_orders[entity.id] = entity.order
         
-        return updated_siblings, old_orders, saved_entities_cache, entity_cache
+        return updated_siblings, old_orders
     
     def _handle_order_changes(
         self, 
         updated_siblings: list, 
         old_orders: dict, 
-        page_id: int,
-        entity_cache: Dict[int, PageEntity]
-    ) -> tuple[Set[int], Dict[int, PageEntity]]:
-        """order変更時の処理（エンティティキャッシュを返す）"""
+        page_id: int
+    ) -> Set[int]:
+        """order変更時の処理（orderが変わったページのIDを返す）"""
         affected_page_ids = set()
         
-        for sibling in updated_siblings:
-            # キャッシュから取得（必ずキャッシュにあるはず）
-            saved_entity = entity_cache.get(sibling.id)
-            # キャッシュにない場合は、bulk_updateの結果が正しく保存されていない可能性がある
-            if saved_entity is None:
-                print(f"Warning: Entity {sibling.id} not found in cache, fetching from DB")
-                saved_entity = self.repository.find_by_id(sibling.id)
-                if saved_entity:
-                    entity_cache[sibling.id] = saved_entity
-            
-            if saved_entity and saved_entity.id in old_orders:
-                old_order = old_orders[saved_entity.id]
-                if old_order != saved_entity.order:
-                    affected_page_ids.add(saved_entity.id)
-                    try:
-                        old_folder_path_str, new_folder_path_str = self.folder_service.rename_folder_on_order_change(saved_entity, old_order, entity_cache)
-                        if old_folder_path_str and new_folder_path_str:
-                            self.url_service.update_content_urls_after_rename(saved_entity.id, old_folder_path_str, new_folder_path_str, saved_entity)
-                        else:
-                            self.url_service.update_content_urls_for_page(saved_entity.id, saved_entity, entity_cache)
-                    except Exception as e:
-                        print(f"Warning: Failed to rename folder for page {saved_entity.id}: {e}")
-                        traceback.print_exc()
+        if self.folder_service.media_service.uses_id_layout:
+            # IDレイアウトではorderが変わってもフォルダ名・URLは変わらない
+            return affected_page_ids
         
-        if not any(s.id == page_id for s in updated_siblings):
-            # キャッシュから取得（page_idもbulk_updateに含まれているはず）
-            saved_entity = entity_cache.get(page_id)
-            if saved_entity is None:
-                print(f"Warning: Entity {page_id} not found in cache, fetching from DB")
-                saved_entity = self.repository.find_by_id(page_id)
-                if saved_entity:
-                    entity_cache[page_id] = saved_entity
-            
+        page_ids = [sibling.id for sibling in updated_siblings]
+        if page_id not in page_ids:
+            page_ids.append(page_id)
+        
+        for target_id in page_ids:
+            saved_entity = self.repository.find_by_id(target_id)
             if saved_entity and saved_entity.id in old_orders:
                 old_order = old_orders[saved_entity.id]
                 if old_order != saved_entity.order:
-                    affected_page_ids.add(page_id)
+                    affected_page_ids.add(saved_entity.id)
                     try:
-                        old_folder_path_str, new_folder_path_str = self.folder_service.rename_folder_on_order_change(saved_entity, old_order, entity_cache)
+                        old_folder_path_str, new_folder_path_str = self.folder_service.rename_folder_on_order_change(saved_entity, old_order)
                         if old_folder_path_str and new_folder_path_str:
                             self.url_service.update_content_urls_after_rename(saved_entity.id, old_folder_path_str, new_folder_path_str, saved_entity)
                         else:
-                            self.url_service.update_content_urls_for_page(saved_entity.id, saved_entity, entity_cache)
+                            self.url_service.update_content_urls_for_page(saved_entity.id, saved_entity)
                     except Exception as e:
                         print(f"Warning: Failed to rename folder for page {saved_entity.id}: {e}")
                         traceback.print_exc()
         
-        return affected_page_ids, entity_cache
+        return affected_page_ids
     
     def _generate_html_for_affected_pages(
         self, 
         updated_siblings: list, 
-        page_id: int,
-        entity_cache: Dict[int, PageEntity]
+        page_id: int
     ) -> None:
-        """影響を受けたページのHTMLを生成する（キャッシュされたエンティティを使用）"""
-        # 親エンティティを事前にキャッシュに追加して重複取得を避ける
-        parent_ids = set()
-        for sibling in updated_siblings:
-            saved_entity = entity_cache.get(sibling.id)
-            if saved_entity and saved_entity.parent_id:
-                parent_ids.add(saved_entity.parent_id)
-        
-        saved_entity = entity_cache.get(page_id)
-        if saved_entity and saved_entity.parent_id:
-            parent_ids.add(saved_entity.parent_id)
-        
-        # 親エンティティを取得してキャッシュに追加（再帰的に親の親も取得）
-        all_parent_ids = set(parent_ids)
-        while parent_ids:
-            current_parent_ids = parent_ids.copy()
-            parent_ids = set()
-            
-            for parent_id in current_parent_ids:
-                if parent_id not in entity_cache:
-                    print(f"Warning: Parent {parent_id} not in cache before pre-fetch, fetching from DB")
-                    parent_entity = self.repository.find_by_id(parent_id)
-                    if parent_entity:
-                        entity_cache[parent_id] = parent_entity
-                        # 親の親も取得対象に追加
-                        if parent_entity.parent_id:
-                            parent_ids.add(parent_entity.parent_id)
-                            all_parent_ids.add(parent_entity.parent_id)
-                else:
-                    # キャッシュに既にある場合、その親も確認
-                    parent_entity = entity_cache[parent_id]
-                    if parent_entity.parent_id and parent_entity.parent_id not in entity_cache:
-                        parent_ids.add(parent_entity.parent_id)
-                        all_parent_ids.add(parent_entity.parent_id)
-        
-        # デバッグ: 親エンティティがキャッシュに追加されているか確認
-        for parent_id in all_parent_ids:
-            if parent_id not in entity_cache:
-                print(f"Warning: Parent {parent_id} not in cache after pre-fetch")
-            else:
-                # デバッグ: 親エンティティがキャッシュに存在することを確認
-                print(f"Debug: Parent {parent_id} is in cache before HTML generation")
+        """影響を受けたページのHTMLを生成する"""
+        page_ids = [sibling.id for sibling in updated_siblings]
+        if page_id not in page_ids:
+            page_ids.append(page_id)
         
-        for sibling in updated_siblings:
-            # キャッシュから取得（必ずキャッシュにあるはず）
-            saved_entity = entity_cache.get(sibling.id)
+        for target_id in page_ids:
+            saved_entity = self.repository.find_by_id(target_id)
             if saved_entity is None:
-                print(f"Warning: Entity {sibling.id} not found in cache for HTML generation, skipping")
+                print(f"Warning: Entity {target_id} not found for HTML generation, skipping")
                 continue
             
-            if saved_entity:
-                try:
-                    # エンティティキャッシュを渡して親エンティティの重複取得を避ける
-                    # キャッシュが共有されることを確認（参照渡し）
-                    # デバッグ: 親エンティティがキャッシュにあることを確認してからHTML生成
-                    if saved_entity.parent_id and saved_entity.parent_id not in entity_cache:
-                        print(f"Warning: Parent {saved_entity.parent_id} not in cache before calling save_html_to_folder for page {saved_entity.id}, fetching now")
-                        parent_entity = self.repository.find_by_id(saved_entity.parent_id)
-                        if parent_entity:
-                            entity_cache[saved_entity.parent_id] = parent_entity
-                    self.html_generator.save_html_to_folder(saved_entity, entity_cache)
-                except Exception as e:
-                    print(f"Warning: Failed to save HTML for page {saved_entity.id}: {e}")
-                    traceback.print_exc()
-        
-        if not any(s.id == page_id for s in updated_siblings):
-            # キャッシュから取得（必ずキャッシュにあるはず）
-            saved_entity = entity_cache.get(page_id)
-            if saved_entity is None:
-                print(f"Warning: Entity {page_id} not found in cache for HTML generation, skipping")
-                return
-            
-            if saved_entity:
-                try:
-                    # エンティティキャッシュを渡して親エンティティの重複取得を避ける
-                    # デバッグ: 親エンティティがキャッシュにあることを確認してからHTML生成
-                    if saved_entity.parent_id and saved_entity.parent_id not in entity_cache:
-                        print(f"Warning: Parent {saved_entity.parent_id} not in cache before calling save_html_to_folder for page {saved_entity.id}, fetching now")
-                        parent_entity = self.repository.find_by_id(saved_entity.parent_id)
-                        if parent_entity:
-                            entity_cache[saved_entity.parent_id] = parent_entity
-                    self.html_generator.save_html_to_folder(saved_entity, entity_cache)
-                except Exception as e:
-                    print(f"Warning: Failed to save HTML for moved page {saved_entity.id}: {e}")
-                    traceback.print_exc()
+            try:
+                self.html_generator.save_html_to_folder(saved_entity)
+            except Exception as e:
+                print(f"Warning: Failed to save HTML for page {saved_entity.id}: {e}")
+                traceback.print_exc()
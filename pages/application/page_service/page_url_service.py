@@ -1,14 +1,10 @@
 """ページURL更新サービス"""
 
-import re
-from pages.models import Page
-from typing import Optional, List, Set, Dict
-from datetime import datetime
-from django.db import transaction
-from django.utils import timezone
+from typing import Optional, List
 
 from ...domain.repositories import PageRepositoryInterface
 from .media_service import MediaService
+from .content_url_rewriter import ContentUrlRewriter
 
 
 class PageUrlService:
@@ -23,7 +19,7 @@ class PageUrlService:
         self.media_service = media_service
     
     def update_content_urls_after_rename(self, page_id: int, old_folder_path: str, new_folder_path: str, entity: Optional['PageEntity'] = None) -> None:
-        """フォルダリネーム後にコンテンツ内のURLを更新"""
+        """フォルダリネーム後にコンテンツ内のURLを更新（DBへの書き込みはリクエストの終わりにまとめて行う）"""
         try:
             # エンティティが渡されていればそれを使用、なければ取得
             if entity is None:
@@ -36,38 +32,12 @@ class PageUrlService:
             if not current_content:
                 return
             
-            # パターン1: /media/uploads/page_{id}/filename（古い形式）
-            pattern1 = re.compile(
-                rf'/media/uploads/page_{page_id}/([^"\'>\s]+)',
-                re.IGNORECASE
-            )
+            updated_content = ContentUrlRewriter({page_id: new_folder_path}).rewrite(current_content)
             
-            # パターン2: /media/uploads/{任意のorder}_page_{id}_{タイトル}/filename（現在の形式）
-            pattern2 = re.compile(
-                rf'/media/uploads/([^/]+/)*\d+_page_{page_id}_[^/]+/([^"\'>\s]+)',
-                re.IGNORECASE
-            )
-            
-            updated_content = current_content
-            
-            # パターン1を置換（古い形式）
-            def replace_url1(match):
-                filename = match.group(1)
-                return f'/media/uploads/{new_folder_path}/{filename}'
-            
-            updated_content = pattern1.sub(replace_url1, updated_content)
-            
-            # パターン2を置換（現在の形式）
-            def replace_url2(match):
-                filename = match.group(2)
-                return f'/media/uploads/{new_folder_path}/{filename}'
-            
-            updated_content = pattern2.sub(replace_url2, updated_content)
-            
-            # 変更があった場合のみ更新（リポジトリ経由）
+            # 変更があった場合のみ登録する（書き込みはリクエストの終わりにまとめて行う）
             if current_content != updated_content:
                 entity.content = updated_content
-                self.repository.save(entity)
+                self.repository.register_dirty(entity)
                 print(f"✓ Updated content URLs for page {page_id}: {old_folder_path} -> {new_folder_path}")
             else:
                 print(f"  No URL changes needed for page {page_id} (old: {old_folder_path}, new: {new_folder_path})")
@@ -77,8 +47,8 @@ class PageUrlService:
             import traceback
             traceback.print_exc()
     
-    def update_content_urls_for_page(self, page_id: int, entity: Optional['PageEntity'] = None, entity_cache: Optional[Dict[int, 'PageEntity']] = None) -> None:
-        """指定されたページのコンテンツ内のURLを現在のフォルダパスに更新"""
+    def update_content_urls_for_page(self, page_id: int, entity: Optional['PageEntity'] = None) -> None:
+        """指定されたページのコンテンツ内のURLを現在のフォルダパスに更新（DBへの書き込みはリクエストの終わりにまとめて行う）"""
         try:
             # エンティティが渡されていればそれを使用、なければ取得
             if entity is None:
@@ -91,39 +61,16 @@ class PageUrlService:
             if not current_content:
                 return
             
-            # 現在の正しいフォルダパスを取得（entity_cacheを渡す）
-            current_folder_path = self.media_service.get_page_folder_path(entity, entity_cache)
+            # 現在の正しいフォルダパスを取得
+            current_folder_path = self.media_service.get_page_folder_path(entity)
             folder_path_str = str(current_folder_path).replace('\\', '/')
             
-            # パターン1: /media/uploads/page_{id}/filename
-            pattern1 = re.compile(
-                rf'/media/uploads/page_{page_id}/([^"\'>\s]+)',
-                re.IGNORECASE
-            )
-            
-            # パターン2: /media/uploads/{任意のパス}/{任意のorder}_page_{id}_{タイトル}/filename
-            pattern2 = re.compile(
-                rf'/media/uploads/([^/]+/)*\d+_page_{page_id}_[^/]+/([^"\'>\s]+)',
-                re.IGNORECASE
-            )
-            
-            updated_content = current_content
+            updated_content = ContentUrlRewriter({page_id: folder_path_str}).rewrite(current_content)
             
-            def replace_url1(match):
-                filename = match.group(1)
-                return f'/media/uploads/{folder_path_str}/{filename}'
-            
-            def replace_url2(match):
-                filename = match.group(2)
-                return f'/media/uploads/{folder_path_str}/{filename}'
-            
-            updated_content = pattern1.sub(replace_url1, updated_content)
-            updated_content = pattern2.sub(replace_url2, updated_content)
-            
-            # 変更があった場合のみ更新（リポジトリ経由）
+            # 変更があった場合のみ登録する（書き込みはリクエストの終わりにまとめて行う）
             if current_content != updated_content:
                 entity.content = updated_content
-                self.repository.save(entity)
+                self.repository.register_dirty(entity)
                 print(f"✓ Updated content URLs for page {page_id} to current folder path: {folder_path_str}")
             
         except Exception as e:
@@ -134,80 +81,45 @@ class PageUrlService:
     def update_all_pages_content_urls(
         self, 
         affected_page_ids: set, 
-        entity_cache: Optional[Dict[int, 'PageEntity']] = None,
         all_pages: Optional[List['PageEntity']] = None
     ) -> None:
         """指定されたページIDを含むURLを持つすべてのページのコンテンツを更新"""
         try:
-            # 影響を受けたページのエンティティとフォルダパスを事前に取得してキャッシュ
-            # entity_cacheがある場合はそれを使用、なければfind_by_idsで一括取得
+            # 影響を受けたページのエンティティとフォルダパスを事前に取得する
+            # （読み込み済みのページはアイデンティティマップから返され、DBにはアクセスしない）
             affected_pages_cache = {}
             if affected_page_ids:
-                if entity_cache:
-                    # キャッシュから取得
-                    for page_id in affected_page_ids:
-                        if page_id in entity_cache:
-                            entity = entity_cache[page_id]
-                            current_folder_path = self.media_service.get_page_folder_path(entity, entity_cache)
-                            folder_path_str = str(current_folder_path).replace('\\', '/')
-                            affected_pages_cache[entity.id] = folder_path_str
-                else:
-                    # find_by_idsを使って一括取得
-                    entities = self.repository.find_by_ids(affected_page_ids)
-                    for entity in entities:
-                        if entity:
-                            current_folder_path = self.media_service.get_page_folder_path(entity, entity_cache)
-                            folder_path_str = str(current_folder_path).replace('\\', '/')
-                            affected_pages_cache[entity.id] = folder_path_str
+                for entity in self.repository.find_by_ids(list(affected_page_ids)):
+                    current_folder_path = self.media_service.get_page_folder_path(entity)
+                    folder_path_str = str(current_folder_path).replace('\\', '/')
+                    affected_pages_cache[entity.id] = folder_path_str
             
             # キャッシュが空の場合は何もしない
             if not affected_pages_cache:
                 return
             
-            # 全ページを取得（既に取得済みの場合は再利用）
-            if all_pages is None:
-                all_pages = self.repository.find_all_pages()
+            # 影響を受けたページのフォルダを参照しているページだけを対象にする（PageMediaの逆引き）
+            referencing_ids = self.repository.find_page_ids_referencing_page_folders(list(affected_pages_cache))
+            if not referencing_ids:
+                return
             
-            for page_entity in all_pages:
-                if not page_entity.content:
+            if all_pages is not None:
+                target_pages = [p for p in all_pages if p.id in referencing_ids]
+            else:
+                target_pages = self.repository.find_by_ids(list(referencing_ids))
+            
+            # 対象ページIDをまとめた1つのパターンで、各ページのコンテンツを1回だけ走査する
+            rewriter = ContentUrlRewriter(affected_pages_cache)
+            for page_entity in target_pages:
+                if not page_entity or not page_entity.content:
                     continue
                 
-                content_updated = False
-                updated_content = page_entity.content
-                
-                # キャッシュされたフォルダパスを使用
-                for affected_page_id, folder_path_str in affected_pages_cache.items():
-                    # パターン1: /media/uploads/page_{id}/filename
-                    pattern1 = re.compile(
-                        rf'/media/uploads/page_{affected_page_id}/([^"\'>\s]+)',
-                        re.IGNORECASE
-                    )
-                    
-                    # パターン2: /media/uploads/{任意のパス}/{任意のorder}_page_{id}_{タイトル}/filename
-                    pattern2 = re.compile(
-                        rf'/media/uploads/([^/]+/)*\d+_page_{affected_page_id}_[^/]+/([^"\'>\s]+)',
-                        re.IGNORECASE
-                    )
-                    
-                    def replace_url1(match):
-                        filename = match.group(1)
-                        return f'/media/uploads/{folder_path_str}/{filename}'
-                    
-                    def replace_url2(match):
-                        filename = match.group(2)
-                        return f'/media/uploads/{folder_path_str}/{filename}'
-                    
-                    old_before = updated_content
-                    updated_content = pattern1.sub(replace_url1, updated_content)
-                    updated_content = pattern2.sub(replace_url2, updated_content)
-                    
-                    if old_before != updated_content:
-                        content_updated = True
+                updated_content = rewriter.rewrite(page_entity.content)
                 
-                # 変更があった場合のみ更新（リポジトリ経由）
-                if content_updated:
+                # 変更があった場合のみ登録し、リクエストの終わりに一括で書き込む
+                if updated_content != page_entity.content:
                     page_entity.content = updated_content
-                    self.repository.save(page_entity)
+                    self.repository.register_dirty(page_entity)
             
         except Exception as e:
             print(f"Warning: Failed to update all pages content URLs: {e}")
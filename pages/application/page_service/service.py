@@ -1,6 +1,6 @@
 """ページアプリケーションサービス（メイン）"""
 
-from typing import Optional, List
+from typing import Optional, List, Iterator, Tuple
 
 from ...domain.repositories import PageRepositoryInterface
 from ...domain.page_aggregate import PageDomainService
@@ -8,6 +8,7 @@ from ..dto import CreatePageDTO, UpdatePageDTO, PageDTO
 from .page_query import PageQueryService
 from .page_command import PageCommandService
 from .page_export import PageExportService
+from .page_archive import PageArchiveService
 from .media_service import MediaService
 from .html_generator import HtmlGenerator
 
@@ -34,15 +35,16 @@ class PageApplicationService:
             self.html_generator
         )
         self.export_service = PageExportService(repository, self.html_generator)
+        self.archive_service = PageArchiveService(repository, self.media_service, self.html_generator)
     
     # クエリ操作の委譲
     def get_all_root_pages(self) -> List[PageDTO]:
         """ルートページをすべて取得する"""
         return self.query_service.get_all_root_pages()
     
-    def get_page_tree(self) -> dict:
+    def get_page_tree(self, include_content: bool = True) -> dict:
         """すべてのページをツリー構造として取得する"""
-        return self.query_service.get_page_tree()
+        return self.query_service.get_page_tree(include_content)
     
     def get_page_detail(self, page_id: int) -> Optional[PageDTO]:
         """ページ詳細を取得する"""
@@ -77,6 +79,18 @@ class PageApplicationService:
         """ページの並び替え：ターゲットの前後に挿入"""
         return self.command_service.reorder_page(page_id, target_page_id, position)
     
+    def rebalance_page_order(self, parent_id: Optional[int]) -> int:
+        """兄弟ページのorderを等間隔に振り直す"""
+        return self.command_service.rebalance_page_order(parent_id)
+    
     def export_page_as_html(self, page_id: int) -> Optional[str]:
         """ページを画像埋め込み済み単一HTMLとしてエクスポートする"""
         return self.export_service.export_page_as_html(page_id)
+    
+    def stream_page_as_html(self, page_id: int) -> Optional[Tuple[str, Iterator[str]]]:
+        """ページを画像埋め込み済み単一HTMLとして少しずつ生成する（タイトルとHTMLの断片のイテレータ）"""
+        return self.export_service.stream_page_as_html(page_id)
+    
+    def stream_page_subtree_zip(self, page_id: int) -> Optional[Tuple[str, Iterator[bytes]]]:
+        """ページとその子孫をZIPとして少しずつ生成する（ルートページのタイトルとZIPの断片のイテレータ）"""
+        return self.archive_service.stream_subtree_zip(page_id)
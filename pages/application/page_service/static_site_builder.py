@@ -0,0 +1,274 @@
+"""ワークスペース全体の静的サイトの差分ビルド"""
+
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import django
+from django.conf import settings
+
+from ...domain.page_aggregate import PageEntity
+from ...domain.repositories import PageRepositoryInterface
+from .html_generator import HtmlGenerator
+from .media_service import MediaService
+
+
+def _render_page(job: Dict[str, Any]) -> int:
+    """ページのHTMLを生成して書き込む（ワーカープロセスで実行するため、DBにはアクセスしない）"""
+    entity = PageEntity(**job['page'])
+    document = HtmlGenerator().generate_linked_html_content(entity, job['media_url_prefix'])
+    target = Path(job['output'])
+    target.parent.mkdir(parents=True, exist_ok=True)
+    HtmlGenerator._replace_file_atomically(target, document.encode('utf-8'))
+    return entity.id
+
+
+class StaticSiteBuilder:
+    """
+    全ページを出力先ディレクトリに静的サイトとして書き出す（前回から変わったページだけを書き直す）
+
+    出力の構成:
+    - index.html: ページ階層の目次
+    - {order}_page_{id}_{タイトル}/{タイトル}.html: ページ階層どおりに入れ子にしたページ
+    - media/{MEDIA_ROOT からの相対パス}: 参照されているメディア（HTMLからは相対パスでリンクする）
+    - .build-manifest.json: ページごとのフィンガープリントとメディアの状態（次回の差分判定に使う）
+
+    ページのフィンガープリントはタイトル・コンテンツ・アイコン・order・親・出力パス
+    （祖先のフォルダ名を含む）・参照メディアのサイズと更新日時から作るため、
+    祖先のタイトル・並び順の変更や画像の差し替えでも書き直される。
+    """
+
+    MANIFEST_FILENAME = '.build-manifest.json'
+    MEDIA_DIR = 'media'
+    INDEX_FILENAME = 'index.html'
+
+    def __init__(self, repository: PageRepositoryInterface, media_service: Optional[MediaService] = None):
+        self.repository = repository
+        self.media_service = media_service or MediaService(repository)
+        self.media_root = Path(settings.MEDIA_ROOT).resolve()
+
+    def build(self, output_dir: Path, workers: int = 1, force: bool = False, copy_media: bool = False) -> Dict[str, int]:
+        """静的サイトをビルドし、件数の集計を返す"""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self._load_manifest(output_dir)
+
+        pages = self.repository.find_all_pages()
+        media_by_page = self.repository.find_media_paths_by_page()
+        pages_by_id = {page.id: page for page in pages}
+        folder_parts: Dict[int, Tuple[str, ...]] = {}
+        media_stats: Dict[str, Optional[Tuple[int, int]]] = {}
+
+        new_pages: Dict[str, Dict[str, str]] = {}
+        jobs = []
+        for page in pages:
+            parts = self._get_folder_parts(page, pages_by_id, folder_parts)
+            safe_title = re.sub(r'[<>:"/\\|?*]', '_', page.title)
+            relative_path = '/'.join(parts + (f'{safe_title}.html',))
+
+            media = []
+            for media_path in sorted(media_by_page.get(page.id, ())):
+                if media_path not in media_stats:
+                    media_stats[media_path] = self._stat_media(media_path)
+                media.append([media_path, media_stats[media_path]])
+
+            entry = {'path': relative_path, 'fingerprint': self._fingerprint(page, relative_path, media)}
+            new_pages[str(page.id)] = entry
+            if force or manifest['pages'].get(str(page.id)) != entry or not (output_dir / relative_path).exists():
+                jobs.append({
+                    'page': {
+                        'id': page.id, 'title': page.title, 'content': page.content, 'parent_id': page.parent_id,
+                        'created_at': page.created_at, 'updated_at': page.updated_at,
+                        'icon': page.icon, 'order': page.order,
+                    },
+                    'media_url_prefix': '../' * len(parts) + f'{self.MEDIA_DIR}/',
+                    'output': str(output_dir / relative_path),
+                })
+
+        # 削除・移動・タイトル変更されたページの古い出力を削除する
+        removed = 0
+        for page_id, old_entry in manifest['pages'].items():
+            new_entry = new_pages.get(page_id)
+            if new_entry is None or new_entry['path'] != old_entry['path']:
+                old_file = output_dir / old_entry['path']
+                if old_file.is_file():
+                    old_file.unlink()
+                removed += 1
+
+        self._render(jobs, workers)
+
+        media = {path: list(stat) for path, stat in media_stats.items() if stat is not None}
+        copied_media, removed_media = self._sync_media(output_dir, manifest['media'], media, force, copy_media)
+        self._write_index(output_dir, pages, pages_by_id, folder_parts)
+        self._prune_empty_dirs(output_dir)
+        self._save_manifest(output_dir, {'pages': new_pages, 'media': media})
+
+        return {
+            'pages': len(pages),
+            'rendered': len(jobs),
+            'removed': removed,
+            'media_copied': copied_media,
+            'media_removed': removed_media,
+        }
+
+    def _get_folder_parts(
+        self,
+        page: PageEntity,
+        pages_by_id: Dict[int, PageEntity],
+        folder_parts: Dict[int, Tuple[str, ...]]
+    ) -> Tuple[str, ...]:
+        """ページの出力フォルダ（祖先のフォルダ名を含む）を返す"""
+        if page.id in folder_parts:
+            return folder_parts[page.id]
+        parent = pages_by_id.get(page.parent_id) if page.parent_id else None
+        parent_parts = self._get_folder_parts(parent, pages_by_id, folder_parts) if parent else ()
+        parts = parent_parts + (self.media_service.path_service.get_page_folder_name(page),)
+        folder_parts[page.id] = parts
+        return parts
+
+    def _resolve_media(self, media_path: str) -> Optional[Path]:
+        """MEDIA_ROOT 配下のメディアの絶対パス（配下でない場合は None）"""
+        file_path = (self.media_root / media_path).resolve()
+        if not file_path.is_relative_to(self.media_root):
+            return None
+        return file_path
+
+    def _stat_media(self, media_path: str) -> Optional[Tuple[int, int]]:
+        """メディアの (サイズ, 更新日時[ns])（存在しない場合は None）"""
+        file_path = self._resolve_media(media_path)
+        if file_path is None or not file_path.is_file():
+            return None
+        stat = file_path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def _fingerprint(page: PageEntity, relative_path: str, media: List[Any]) -> str:
+        """ページの出力内容を決める値のハッシュ"""
+        source = json.dumps([
+            page.title, page.content, page.icon, page.order, page.parent_id, relative_path,
+            page.created_at.isoformat(), page.updated_at.isoformat(), media,
+        ], ensure_ascii=False)
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    def _render(self, jobs: List[Dict[str, Any]], workers: int) -> None:
+        """ページのHTMLを書き出す（workers が2以上ならプロセスプールで並列に行う）"""
+        if workers <= 1 or len(jobs) < 2:
+            for job in jobs:
+                _render_page(job)
+            return
+
+        # spawn で起動したワーカーでもモデルを読み込めるよう、最初に Django を初期化する
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            for _ in pool.map(_render_page, jobs, chunksize=chunksize):
+                pass
+
+    def _sync_media(
+        self,
+        output_dir: Path,
+        old_media: Dict[str, List[int]],
+        media: Dict[str, List[int]],
+        force: bool,
+        copy_media: bool
+    ) -> Tuple[int, int]:
+        """参照されているメディアを出力先に配置し、参照されなくなったものを削除する"""
+        media_dir = output_dir / self.MEDIA_DIR
+        copied = 0
+        for media_path, stat in media.items():
+            target = media_dir / media_path
+            if not force and old_media.get(media_path) == stat and target.exists():
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists():
+                target.unlink()
+            source = self._resolve_media(media_path)
+            if not copy_media:
+                try:
+                    os.link(source, target)
+                    copied += 1
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(source, target)
+            copied += 1
+
+        removed = 0
+        for media_path in old_media:
+            if media_path not in media and (media_dir / media_path).is_file():
+                (media_dir / media_path).unlink()
+                removed += 1
+        return copied, removed
+
+    def _write_index(
+        self,
+        output_dir: Path,
+        pages: List[PageEntity],
+        pages_by_id: Dict[int, PageEntity],
+        folder_parts: Dict[int, Tuple[str, ...]]
+    ) -> None:
+        """ページ階層の目次（index.html）を書き出す（内容が変わらなければ書き込まない）"""
+        children: Dict[Optional[int], List[PageEntity]] = {}
+        for page in pages:
+            parent_id = page.parent_id if page.parent_id in pages_by_id else None
+            children.setdefault(parent_id, []).append(page)
+
+        lines: List[str] = []
+
+        def render_list(parent_id: Optional[int], depth: int) -> None:
+            lines.append('    ' * depth + '<ul>')
+            for page in children.get(parent_id, []):
+                safe_title = re.sub(r'[<>:"/\\|?*]', '_', page.title)
+                href = urllib.parse.quote('/'.join(folder_parts[page.id] + (f'{safe_title}.html',)))
+                lines.append('    ' * (depth + 1) + f'<li><a href="{href}">{html.escape(page.icon)} {html.escape(page.title)}</a>')
+                if page.id in children:
+                    render_list(page.id, depth + 2)
+                lines.append('    ' * (depth + 1) + '</li>')
+            lines.append('    ' * depth + '</ul>')
+
+        render_list(None, 1)
+        tree = '\n'.join(lines)
+        document = f'''<!DOCTYPE html>
+<html lang="ja">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Nmemo</title>
+</head>
+<body>
+    <h1>Nmemo</h1>
+{tree}
+</body>
+</html>'''
+        data = document.encode('utf-8')
+        index_file = output_dir / self.INDEX_FILENAME
+        if index_file.is_file() and index_file.read_bytes() == data:
+            return
+        HtmlGenerator._replace_file_atomically(index_file, data)
+
+    def _prune_empty_dirs(self, output_dir: Path) -> None:
+        """古い出力の削除で空になったフォルダを削除する"""
+        for dirpath, dirnames, filenames in os.walk(output_dir, topdown=False):
+            path = Path(dirpath)
+            if path != output_dir and not any(path.iterdir()):
+                path.rmdir()
+
+    def _load_manifest(self, output_dir: Path) -> Dict[str, Dict]:
+        """前回のビルドの記録を読み込む（ない・壊れている場合は空）"""
+        manifest_file = output_dir / self.MANIFEST_FILENAME
+        try:
+            manifest = json.loads(manifest_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {'pages': {}, 'media': {}}
+        return {'pages': manifest.get('pages', {}), 'media': manifest.get('media', {})}
+
+    def _save_manifest(self, output_dir: Path, manifest: Dict[str, Dict]) -> None:
+        """ビルドの記録を保存する"""
+        data = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+        HtmlGenerator._replace_file_atomically(output_dir / self.MANIFEST_FILENAME, data)
@@ -0,0 +1,104 @@
+"""アップロードを保存するファイル名の確保"""
+
+import os
+import re
+import uuid
+from pathlib import Path
+from django.conf import settings
+
+
+class UploadNameAllocator:
+    """
+    保存先フォルダに重複しないファイル名を原子的に確保する
+
+    ファイル名は O_CREAT|O_EXCL で空のファイルを作ることで確保するため、複数のワーカーが
+    同じファイル名を同時にアップロードしても同じ名前を2回使うことはない。
+    名前が使われていた場合は、フォルダの一覧を1回だけ読んで使われている番号の最大値を求め、
+    その次の番号（name_3.xlsx など）から試す（1つずつ exists() で確かめない）。
+    同時のアップロードと競合し続けた場合も MAX_ATTEMPTS 回で諦め、ランダムな接尾辞の名前にする。
+    """
+
+    MAX_ATTEMPTS = 8
+    COPY_BUFFER_SIZE = 256 * 1024
+
+    def __init__(self):
+        self.media_root = Path(settings.MEDIA_ROOT)
+
+    def reserve(self, folder: Path, filename: str) -> Path:
+        """folder に filename（使われていれば番号付きの名前）で空のファイルを作り、そのパスを返す"""
+        path = folder / filename
+        if self._try_create(path):
+            return path
+
+        stem, ext = os.path.splitext(filename)
+        counter = self._max_counter(folder, stem, ext) + 1
+        for _ in range(self.MAX_ATTEMPTS):
+            path = folder / f'{stem}_{counter}{ext}'
+            if self._try_create(path):
+                return path
+            counter += 1
+
+        path = folder / f'{stem}_{uuid.uuid4().hex[:8]}{ext}'
+        if not self._try_create(path):
+            raise FileExistsError(f'ファイル名を確保できませんでした: {path}')
+        return path
+
+    def save(self, uploaded_file, folder_path: str, filename: str) -> str:
+        """アップロードされたファイルを確保した名前で保存し、MEDIA_ROOT からの相対パスを返す
+
+        folder_path は MEDIA_ROOT からの相対パス（"/" 区切り）。受け取り用フォルダで受け取った
+        ファイル（temporary_file_path を持つもの）は確保した名前に os.replace で移動する（書き直さない）。
+        """
+        path = self.reserve(self.media_root / folder_path, filename)
+        try:
+            if not self._move_staged(uploaded_file, path):
+                with open(path, 'wb') as f:
+                    for chunk in uploaded_file.chunks(self.COPY_BUFFER_SIZE):
+                        f.write(chunk)
+            if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                os.chmod(path, settings.FILE_UPLOAD_PERMISSIONS)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return f'{folder_path}/{path.name}'
+
+    def _move_staged(self, uploaded_file, path: Path) -> bool:
+        """受け取り済みのファイルを path に移動する（移動できなければ False）"""
+        if not hasattr(uploaded_file, 'temporary_file_path'):
+            return False
+        try:
+            os.replace(uploaded_file.temporary_file_path(), path)
+        except OSError:
+            # 別のファイルシステム、または開いているファイルを移動できないOSでは書き込み直す
+            return False
+        return True
+
+    def _try_create(self, path: Path) -> bool:
+        """path に空のファイルを排他的に作る（既にあれば False）"""
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+        try:
+            fd = os.open(path, flags, 0o644)
+        except FileExistsError:
+            return False
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                fd = os.open(path, flags, 0o644)
+            except FileExistsError:
+                return False
+        os.close(fd)
+        return True
+
+    def _max_counter(self, folder: Path, stem: str, ext: str) -> int:
+        """folder 内の {stem}_{番号}{ext} の番号の最大値（なければ 0）"""
+        pattern = re.compile(rf'{re.escape(stem)}_(\d+){re.escape(ext)}', re.IGNORECASE)
+        max_counter = 0
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    match = pattern.fullmatch(entry.name)
+                    if match:
+                        max_counter = max(max_counter, int(match.group(1)))
+        except OSError:
+            pass
+        return max_counter
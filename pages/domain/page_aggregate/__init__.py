@@ -4,16 +4,24 @@ from .aggregate import PageAggregate
 from .entities import PageEntity
 from .page_validator import PageValidator
 from .page_hierarchy import PageHierarchy
+from .page_ordering import PageOrdering
 from .page_converter import PageConverter
 from .page_tree_builder import PageTreeBuilder
 from .page_domain_service import PageDomainService
+from .media_reference import MediaReferenceExtractor
+from .content_scanner import ContentScanner, ContentScan, ContentReference
 
 __all__ = [
     'PageAggregate',
     'PageEntity',
     'PageValidator',
     'PageHierarchy',
+    'PageOrdering',
     'PageConverter',
     'PageTreeBuilder',
     'PageDomainService',
+    'MediaReferenceExtractor',
+    'ContentScanner',
+    'ContentScan',
+    'ContentReference',
 ]
\ No newline at end of file
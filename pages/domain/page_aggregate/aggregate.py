@@ -5,6 +5,7 @@ from datetime import datetime
 from typing import Optional, List
 from .page_validator import PageValidator
 from .page_hierarchy import PageHierarchy
+from .page_ordering import PageOrdering
 from .page_converter import PageConverter
 
 
@@ -128,9 +129,16 @@ class PageAggregate:
         if not inserted:
             new_order.append(self)
         
-        # 並び順を一括更新（10刻みで設定）
-        for idx, page in enumerate(new_order):
-            page.order = idx * 10
+        # 移動したページだけに前後の兄弟の中間値を割り当てる
+        # （中間値が取れない場合のみ兄弟全体を振り直す）
+        idx = next(i for i, page in enumerate(new_order) if page is self)
+        before = new_order[idx - 1].order if idx > 0 else None
+        after = new_order[idx + 1].order if idx + 1 < len(new_order) else None
+        new_position = PageOrdering.order_between(before, after)
+        if new_position is None:
+            PageOrdering.rebalance(new_order)
+        else:
+            self.order = new_position
         
         self.updated_at = datetime.now()
         
@@ -0,0 +1,186 @@
+"""ページコンテンツ（HTML）の1回走査によるURL属性の抽出"""
+
+import hashlib
+import html
+import re
+import threading
+import urllib.parse
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class ContentReference(NamedTuple):
+    """コンテンツ内のURL属性（src/href）1つ分"""
+
+    tag: str
+    attr: str
+    # 属性値（文字参照はデコード済み）
+    url: str
+    # コンテンツ内の属性値の位置（引用符を含まない）
+    start: int
+    end: int
+    # /media/ 以降に正規化したURL（http://host/media/... も含む。メディアでなければ None）
+    media_url: Optional[str]
+    # メディア参照の種別（image/video/file。メディア参照として数えない場合は None）
+    kind: Optional[str]
+
+    def with_media_url(self, media_url: str) -> str:
+        """/media/ 以降を media_url に置き換えた属性値（http://host の部分はそのまま残す）"""
+        return self.url[:len(self.url) - len(self.media_url)] + media_url
+
+
+class ContentScan:
+    """ContentScanner.scan の結果（コンテンツ内のURL属性を出現順に持つ）"""
+
+    TEMP_UPLOAD_PREFIXES = ('/media/uploads/temp_uploads/', '/media/uploads/page_temp/')
+
+    def __init__(self, references: Tuple[ContentReference, ...]):
+        self.references = references
+
+    def media_urls(self) -> Dict[str, str]:
+        """参照しているメディアURLと種別の辞書（同じURLは最初に見つかった種別を使う）"""
+        urls: Dict[str, str] = {}
+        for reference in self.references:
+            if reference.kind is not None:
+                urls.setdefault(reference.media_url, reference.kind)
+        return urls
+
+    def temp_upload_references(self) -> List[ContentReference]:
+        """一時フォルダ（temp_uploads/page_temp）のファイルを参照しているURL属性"""
+        return [
+            reference for reference in self.references
+            if reference.media_url is not None and reference.media_url.startswith(self.TEMP_UPLOAD_PREFIXES)
+        ]
+
+    def rewrite(self, content: str, replace: Callable[[ContentReference], Optional[str]]) -> str:
+        """URL属性の値を replace の戻り値で置き換えたコンテンツを返す（None を返した属性はそのまま）
+
+        content は scan に渡したものと同じであること。置き換える値はHTMLとしてエスケープして書き込む。
+        """
+        parts: List[str] = []
+        position = 0
+        for reference in self.references:
+            new_url = replace(reference)
+            if new_url is None or new_url == reference.url:
+                continue
+            parts.append(content[position:reference.start])
+            parts.append(html.escape(new_url))
+            position = reference.end
+        if not parts:
+            return content
+        parts.append(content[position:])
+        return ''.join(parts)
+
+
+class _UrlAttributeParser(HTMLParser):
+    """開始タグの src/href 属性を、コンテンツ内の位置とともに集める"""
+
+    # タグ名 -> (URL属性, メディア参照の種別, 種別を付けるURLの接頭辞)
+    MEDIA_TAGS = {
+        'img': ('src', 'image', '/media/'),
+        'video': ('src', 'video', '/media/'),
+        # video 内の source タグ
+        'source': ('src', 'video', '/media/'),
+        # Quill の動画埋め込み
+        'iframe': ('src', 'video', '/media/'),
+        # a タグの href 属性から /media/uploads/ のファイルリンク
+        'a': ('href', 'file', '/media/uploads/'),
+    }
+    URL_ATTRIBUTES = ('src', 'href')
+    # 開始タグ内の属性（名前, 値の引用符, 引用符付きの値, 引用符なしの値）
+    ATTRIBUTE_PATTERN = re.compile(
+        r'(?<=[\s"\'/])([^\s/>=]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+))'
+    )
+    TAG_NAME_PATTERN = re.compile(r'<[^\s/>]+')
+
+    def __init__(self, content: str):
+        super().__init__(convert_charrefs=True)
+        self.content = content
+        self.line_starts = [0] + [match.end() for match in re.finditer('\n', content)]
+        self.references: List[ContentReference] = []
+
+    def handle_starttag(self, tag, attrs):
+        if not any(name in self.URL_ATTRIBUTES and value for name, value in attrs):
+            return
+        tag_text = self.get_starttag_text()
+        line, column = self.getpos()
+        tag_start = self.line_starts[line - 1] + column
+        name_end = self.TAG_NAME_PATTERN.match(tag_text).end()
+
+        media_attr, kind, kind_prefix = self.MEDIA_TAGS.get(tag, (None, None, None))
+        for match in self.ATTRIBUTE_PATTERN.finditer(tag_text, name_end):
+            attr = match.group(1).lower()
+            if attr not in self.URL_ATTRIBUTES:
+                continue
+            group = next(index for index in (2, 3, 4) if match.group(index) is not None)
+            url = html.unescape(match.group(group))
+            media_url = ContentScanner.normalize_media_url(url)
+            reference_kind = None
+            if attr == media_attr and media_url is not None and media_url.startswith(kind_prefix):
+                reference_kind = kind
+            self.references.append(ContentReference(
+                tag=tag,
+                attr=attr,
+                url=url,
+                start=tag_start + match.start(group),
+                end=tag_start + match.end(group),
+                media_url=media_url,
+                kind=reference_kind,
+            ))
+
+    handle_startendtag = handle_starttag
+
+
+class ContentScanner:
+    """
+    HTMLコンテンツを1回走査し、URL属性（src/href）を位置・正規化済みのメディアURL・種別とともに抽出する
+
+    メディア参照の抽出、一時アップロードの移動・掃除、フォルダ移動時のURL書き換え、
+    HTMLエクスポートの画像埋め込みはすべてこの結果を使うため、引用符・文字参照・
+    絶対URL・source/iframe タグの扱いがどこでも同じになる。
+    同じコンテンツの走査結果は直近の数件だけキャッシュし、保存処理の中での再走査を避ける
+    （キーはコンテンツのハッシュで、コンテンツ自体は保持しない）。
+    """
+
+    MEDIA_URL_PREFIX = '/media/'
+    CACHE_SIZE = 8
+
+    _cache: 'OrderedDict[bytes, ContentScan]' = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    @classmethod
+    def scan(cls, content: str) -> ContentScan:
+        """コンテンツを走査する"""
+        if not content:
+            return ContentScan(())
+        key = hashlib.blake2b(content.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        with cls._cache_lock:
+            result = cls._cache.get(key)
+            if result is not None:
+                cls._cache.move_to_end(key)
+                return result
+        result = cls._scan(content)
+        with cls._cache_lock:
+            cls._cache[key] = result
+            while len(cls._cache) > cls.CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _scan(content: str) -> ContentScan:
+        parser = _UrlAttributeParser(content)
+        parser.feed(content)
+        parser.close()
+        return ContentScan(tuple(parser.references))
+
+    @classmethod
+    def normalize_media_url(cls, url: str) -> Optional[str]:
+        """/media/ 配下を指すURLを /media/ 以降に正規化する（http://host/media/... を含む。それ以外は None）"""
+        if url.startswith(cls.MEDIA_URL_PREFIX):
+            return url
+        if url.startswith(('http://', 'https://')):
+            parsed = urllib.parse.urlsplit(url)
+            if parsed.path.startswith(cls.MEDIA_URL_PREFIX):
+                return url[url.index(parsed.path, len(parsed.scheme) + 3):]
+        return None
@@ -2,7 +2,7 @@
 
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 
 
 @dataclass
@@ -17,6 +17,11 @@ class PageEntity:
     icon: str = '📄'
     order: int = 0
     children: List['PageEntity'] = field(default_factory=list)
+    # content を読み込んでいるか（ツリー表示用に content を除いて取得したエンティティは False で、content を永続化しない）
+    content_loaded: bool = True
+    
+    # 永続化対象のフィールド（変更検出に使用）
+    PERSISTENT_FIELDS = ('title', 'content', 'icon', 'parent_id', 'order')
 
     def validate(self) -> None:
         """エンティティの状態を検証する"""
@@ -26,6 +31,29 @@ class PageEntity:
         if len(self.title) > 200:
             raise ValueError('タイトルは200文字以内で入力してください')
     
+    def _persistent_field_names(self) -> tuple:
+        """永続化対象のフィールド名（content を読み込んでいない場合は content を除く）"""
+        if self.content_loaded:
+            return self.PERSISTENT_FIELDS
+        return tuple(name for name in self.PERSISTENT_FIELDS if name != 'content')
+    
+    def get_persistent_state(self) -> Dict[str, Any]:
+        """永続化対象フィールドの現在値を返す"""
+        return {name: getattr(self, name) for name in self._persistent_field_names()}
+    
+    def get_changed_fields(self, original_state: Optional[Dict[str, Any]]) -> List[str]:
+        """読み込み時の値（original_state）から変更されたフィールド名を返す
+        
+        original_state が不明（None）の場合はすべてのフィールドを変更ありとみなす。
+        """
+        field_names = self._persistent_field_names()
+        if original_state is None:
+            return list(field_names)
+        return [
+            name for name in field_names
+            if getattr(self, name) != original_state.get(name)
+        ]
+    
     def update_title(self, title: str) -> None:
         """バリデーションを行いタイトルを更新する"""
         if not title or not title.strip():
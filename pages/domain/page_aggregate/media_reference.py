@@ -0,0 +1,63 @@
+"""ページコンテンツが参照するメディアファイルの抽出"""
+
+import re
+import urllib.parse
+from typing import Dict, Optional
+
+from .content_scanner import ContentScanner
+
+
+class MediaReferenceExtractor:
+    """HTMLコンテンツから参照しているメディアファイル（/media/ 配下）を抽出する"""
+
+    KIND_IMAGE = 'image'
+    KIND_VIDEO = 'video'
+    KIND_FILE = 'file'
+
+    MEDIA_URL_PREFIX = '/media/'
+    # ページフォルダ名（{order}_page_{id}_{タイトル}、旧形式の page_{id}）
+    PAGE_FOLDER_PATTERN = re.compile(r'(?:\d+_)?page_(\d+)(?:_.*)?')
+
+    @classmethod
+    def extract_urls(cls, content: str) -> Dict[str, str]:
+        """参照しているメディアURLと種別（image/video/file）の辞書を返す
+
+        絶対URL（http://host/media/...）は /media/ 以降に正規化する。
+        同じURLが複数のタグにある場合は、最初に見つかった種別を使う。
+        """
+        return ContentScanner.scan(content).media_urls()
+
+    @classmethod
+    def to_media_path(cls, url: str) -> Optional[str]:
+        """メディアURLを MEDIA_ROOT からの相対パス（クエリ・フラグメントなし、デコード済み）に変換する"""
+        url = url.split('?')[0].split('#')[0]
+        if not url.startswith(cls.MEDIA_URL_PREFIX):
+            return None
+        path = urllib.parse.unquote(url[len(cls.MEDIA_URL_PREFIX):])
+        return path or None
+
+    @classmethod
+    def extract_paths(cls, content: str) -> Dict[str, str]:
+        """参照しているメディアファイルの相対パス（MEDIA_ROOT基準）と種別の辞書を返す"""
+        paths: Dict[str, str] = {}
+        for url, kind in cls.extract_urls(content).items():
+            path = cls.to_media_path(url)
+            if path:
+                paths.setdefault(path, kind)
+        return paths
+
+    @classmethod
+    def folder_page_id(cls, media_path: str) -> Optional[int]:
+        """メディアパスのファイルを含む（最も内側の）ページフォルダのページID（ページフォルダ外なら None）
+
+        階層レイアウトの uploads/10_page_1_親/20_page_5_子/a.png なら 5、
+        IDレイアウトの uploads/pages/5/a.png でも 5 を返す。
+        """
+        segments = media_path.split('/')[:-1]
+        for index in range(len(segments) - 1, 0, -1):
+            match = cls.PAGE_FOLDER_PATTERN.fullmatch(segments[index])
+            if match:
+                return int(match.group(1))
+            if index == 2 and segments[1] == 'pages' and segments[index].isdigit():
+                return int(segments[index])
+        return None
@@ -0,0 +1,67 @@
+"""ページの並び順（order）の採番"""
+
+from typing import Optional, List, Sequence
+
+
+class PageOrdering:
+    """
+    間隔をあけた並び順の採番ロジックを担当
+
+    兄弟ページのorderは ORDER_GAP 刻みで採番し、並び替えでは前後の兄弟の
+    中間値を移動したページにだけ割り当てる。中間に整数が残っていない場合
+    に限り、兄弟全体を振り直す（リバランス）。
+    """
+
+    ORDER_GAP = 1024
+
+    @staticmethod
+    def next_order(max_order: int) -> int:
+        """末尾に追加するページのorderを返す"""
+        return max_order + PageOrdering.ORDER_GAP
+
+    @staticmethod
+    def order_between(before: Optional[int], after: Optional[int]) -> Optional[int]:
+        """
+        前後の兄弟のorderの間に入るorderを返す
+
+        before/after が None の場合はそれぞれ先頭・末尾への挿入を表す。
+        orderは0を下限とし、間に整数が残っていない場合は None を返す（リバランスが必要）。
+        """
+        if before is None and after is None:
+            return PageOrdering.ORDER_GAP
+        if before is None:
+            if after <= 0:
+                return None
+            if after > PageOrdering.ORDER_GAP:
+                return after - PageOrdering.ORDER_GAP
+            return after // 2
+        if after is None:
+            return before + PageOrdering.ORDER_GAP
+        if after - before < 2:
+            return None
+        return (before + after) // 2
+
+    @staticmethod
+    def rebalance(pages: Sequence) -> List:
+        """
+        兄弟ページのorderを ORDER_GAP 刻みで振り直す
+
+        orderが変わったページのリストを返す。
+        """
+        changed = []
+        for idx, page in enumerate(pages, start=1):
+            new_order = idx * PageOrdering.ORDER_GAP
+            if page.order != new_order:
+                page.order = new_order
+                changed.append(page)
+        return changed
+
+    @staticmethod
+    def needs_rebalance(orders: Sequence[int], min_gap: int = 2) -> bool:
+        """
+        並び順（昇順）の中に間隔が min_gap 未満の隣接ペアがあるかを判定する
+
+        既定の 2 は中間値を取れないペアを表す。ORDER_GAP を渡すと、
+        採番の間隔より詰まっている兄弟（ORDER_GAP 導入前の10刻みのものを含む）を判定できる。
+        """
+        return any(b - a < min_gap for a, b in zip(orders, orders[1:]))
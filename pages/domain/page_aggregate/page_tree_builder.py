@@ -13,6 +13,10 @@ class PageTreeBuilder:
         page_map = {page.id: page for page in pages if page.id is not None}
         root_pages = []
         
+        # リポジトリが同じエンティティを返す場合に備え、前回構築した子を引き継がない
+        for page in pages:
+            page.children = []
+        
         for page in pages:
             if page.parent_id is None:
                 root_pages.append(page)
@@ -1,8 +1,11 @@
 """リポジトリインターフェース（抽象クラス）"""
 
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple, Set
 from .page_aggregate import PageEntity
+from .upload_session import UploadSessionEntity
+from .temp_upload import TempUploadEntity
 
 
 class PageRepositoryInterface(ABC):
@@ -23,11 +26,26 @@ class PageRepositoryInterface(ABC):
         """すべてのページを取得する"""
         pass
     
+    @abstractmethod
+    def find_all_tree_nodes(self) -> List[PageEntity]:
+        """ツリー表示用にすべてのページを取得する（content は読み込まず空文字とする）"""
+        pass
+    
     @abstractmethod
     def find_children(self, page_id: int) -> List[PageEntity]:
         """指定ページのすべての子ページを取得する"""
         pass
     
+    @abstractmethod
+    def find_ancestors(self, page_id: int, include_self: bool = False) -> List[PageEntity]:
+        """祖先ページをルートから順に取得する（include_self=True の場合は末尾に自身を含める）"""
+        pass
+    
+    @abstractmethod
+    def is_in_subtree(self, page_id: int, root_id: int) -> bool:
+        """page_id が root_id 自身またはその子孫であるかを判定する"""
+        pass
+    
     @abstractmethod
     def save(self, entity: PageEntity) -> PageEntity:
         """ページエンティティを保存する"""
@@ -38,6 +56,16 @@ class PageRepositoryInterface(ABC):
         """ID でページを削除する"""
         pass
     
+    @abstractmethod
+    def delete_with_descendants(self, page_id: int) -> Tuple[List[int], Dict[int, PageEntity]]:
+        """ページとその子孫を一括削除し、削除したIDとエンティティマップを返す
+        
+        Returns:
+            (削除したページIDのリスト（先頭が指定ページ）, IDをキーとするエンティティの辞書)
+            ページが存在しない場合は ([], {})
+        """
+        pass
+    
     @abstractmethod
     def find_with_all_descendants(self, page_id: int) -> Optional[PageEntity]:
         """子孫をすべて読み込んだ状態でページを取得する"""
@@ -54,7 +82,200 @@ class PageRepositoryInterface(ABC):
         """
         pass
     
+    @abstractmethod
+    def get_loaded(self, page_id: int) -> Optional[PageEntity]:
+        """読み込み済みのエンティティを取得する（DBにはアクセスしない）"""
+        pass
+    
     @abstractmethod
     def find_by_ids(self, page_ids: List[int]) -> List[PageEntity]:
         """複数のIDでページを一括検索する"""
-        pass
\ No newline at end of file
+        pass
+    
+    @abstractmethod
+    def find_page_ids_referencing_media(self, media_path: str) -> List[int]:
+        """指定メディア（MEDIA_ROOT基準の相対パス）を参照しているページIDを取得する"""
+        pass
+    
+    @abstractmethod
+    def find_page_ids_referencing_page_folders(self, page_ids: List[int]) -> Set[int]:
+        """指定ページのメディアフォルダ（配下を含む）内のファイルを参照しているページIDを取得する"""
+        pass
+    
+    @abstractmethod
+    def find_media_paths_with_prefix(self, prefix: str) -> Set[str]:
+        """指定プレフィックス配下で、いずれかのページが参照しているメディアパスを取得する"""
+        pass
+    
+    @abstractmethod
+    def find_media_paths_in_subtree(self, page_id: int) -> Set[str]:
+        """指定ページとその子孫が参照しているメディアパスを取得する"""
+        pass
+    
+    @abstractmethod
+    def find_media_paths_by_page(self) -> Dict[int, Set[str]]:
+        """全ページについて、ページID -> 参照しているメディアパスの辞書を取得する"""
+        pass
+    
+    @abstractmethod
+    def register_dirty(self, entity: PageEntity) -> None:
+        """変更済みエンティティを登録する（Unit of Work の範囲の終わりにまとめて、範囲外ではその場で書き込む）"""
+        pass
+    
+    @abstractmethod
+    def flush(self) -> List[PageEntity]:
+        """登録済みの変更済みエンティティを一括で書き込み、保存後のエンティティを返す"""
+        pass
+    
+    @abstractmethod
+    def clear(self) -> None:
+        """読み込み済みエンティティのキャッシュと未書き込みの変更を破棄する"""
+        pass
+
+
+class FolderManifestRepositoryInterface(ABC):
+    """ページID -> メディアフォルダの相対パス（uploads/ 基準）の対応表のインターフェース"""
+    
+    @abstractmethod
+    def get_path(self, page_id: int) -> Optional[str]:
+        """ページのフォルダの相対パスを取得する（未登録なら None）"""
+        pass
+    
+    @abstractmethod
+    def get_paths(self, page_ids: List[int]) -> Dict[int, str]:
+        """複数のページのフォルダの相対パスを取得する（ページID -> 相対パス、未登録のページは含まない）"""
+        pass
+    
+    @abstractmethod
+    def get_paths_in_subtree(self, page_id: int) -> Dict[int, str]:
+        """指定ページとその子孫のフォルダの相対パスを取得する（ページID -> 相対パス）"""
+        pass
+    
+    @abstractmethod
+    def save_path(self, page_id: int, relative_path: str) -> None:
+        """ページのフォルダの相対パスを登録・更新する"""
+        pass
+    
+    @abstractmethod
+    def move_prefix(self, old_path: str, new_path: str) -> int:
+        """フォルダのリネーム・移動に合わせて、配下を含むすべての相対パスを置き換える"""
+        pass
+    
+    @abstractmethod
+    def delete_paths(self, page_ids: List[int]) -> None:
+        """ページのフォルダの登録を削除する"""
+        pass
+
+
+class HtmlExportQueueRepositoryInterface(ABC):
+    """HTML書き出しの待ち行列（ページID単位）のインターフェース"""
+    
+    @abstractmethod
+    def enqueue(self, page_id: int) -> None:
+        """書き出しを要求する（同じページの要求が残っていれば、その要求日時を更新してまとめる）"""
+        pass
+    
+    @abstractmethod
+    def count_pending(self) -> int:
+        """未処理（失敗済みを除く）の要求数を取得する"""
+        pass
+    
+    @abstractmethod
+    def claim_due(self, limit: int, claim_timeout: float) -> List[Tuple[int, datetime, int]]:
+        """実行時刻を過ぎた要求を処理中にして、(ページID, 要求日時, 失敗回数) のリストを返す
+        
+        claim_timeout 秒以上処理中のままの要求は、ワーカーが異常終了したものとみなして取り直す。
+        """
+        pass
+    
+    @abstractmethod
+    def complete(self, page_id: int, requested_at: datetime) -> None:
+        """要求を完了にする（処理中に新しい要求があった場合は残して、もう一度処理させる）"""
+        pass
+    
+    @abstractmethod
+    def fail(self, page_id: int, requested_at: datetime, error: str, retry_at: Optional[datetime]) -> None:
+        """要求の失敗を記録する（retry_at が None なら再試行しない）"""
+        pass
+    
+    @abstractmethod
+    def retry_failed(self) -> int:
+        """再試行の上限を超えた要求を、もう一度実行対象に戻す"""
+        pass
+
+
+class HtmlDigestRepositoryInterface(ABC):
+    """書き出したHTMLファイルの内容のダイジェスト（パス単位）のインターフェース"""
+    
+    @abstractmethod
+    def get_digest(self, path: str) -> Optional[Tuple[str, int]]:
+        """最後に書き込んだ内容の (SHA-256, サイズ) を取得する（未記録なら None）"""
+        pass
+    
+    @abstractmethod
+    def save_digest(self, path: str, digest: str, size: int) -> None:
+        """書き込んだ内容の SHA-256 とサイズを記録する"""
+        pass
+
+
+class UploadSessionRepositoryInterface(ABC):
+    """分割アップロードのセッションのインターフェース"""
+    
+    @abstractmethod
+    def create(self, session: UploadSessionEntity) -> UploadSessionEntity:
+        """セッションを作成する（upload_id が空なら採番する）"""
+        pass
+    
+    @abstractmethod
+    def find(self, upload_id: str) -> Optional[UploadSessionEntity]:
+        """セッションを取得する"""
+        pass
+    
+    @abstractmethod
+    def advance(self, upload_id: str, expected_offset: int, new_offset: int) -> bool:
+        """受信済みの位置を進める（現在の位置が expected_offset の場合だけ。進めたかを返す）"""
+        pass
+    
+    @abstractmethod
+    def complete(self, upload_id: str, completed_path: str) -> None:
+        """組み立て後のファイルのパスを記録する"""
+        pass
+    
+    @abstractmethod
+    def delete(self, upload_id: str) -> None:
+        """セッションを削除する"""
+        pass
+    
+    @abstractmethod
+    def find_updated_before(self, before: datetime) -> List[UploadSessionEntity]:
+        """before より前から更新されていないセッションを取得する"""
+        pass
+
+
+class TempUploadRepositoryInterface(ABC):
+    """一時フォルダへのアップロードの登録のインターフェース"""
+    
+    @abstractmethod
+    def register(self, upload: TempUploadEntity) -> None:
+        """アップロードを登録する（同じパスの登録があれば置き換える）"""
+        pass
+    
+    @abstractmethod
+    def find_by_uploader(self, uploader: str) -> List[TempUploadEntity]:
+        """指定したセッションからのアップロードを取得する"""
+        pass
+    
+    @abstractmethod
+    def find_created_before(self, before: datetime) -> List[TempUploadEntity]:
+        """before より前のアップロードを取得する"""
+        pass
+    
+    @abstractmethod
+    def find_all_paths(self) -> Set[str]:
+        """登録されているすべてのパスを取得する"""
+        pass
+    
+    @abstractmethod
+    def delete(self, media_paths: List[str]) -> None:
+        """指定したパスの登録を削除する"""
+        pass
@@ -0,0 +1,24 @@
+"""一時フォルダへのアップロードの登録"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass
+class TempUploadEntity:
+    """新規作成モーダル（page_id='temp'）から temp_uploads/ にアップロードされ、まだページに移動されていないファイル
+
+    ページの作成時にページフォルダへ移動した時点で登録を消すため、登録が残っているものは
+    どのページにも取り込まれていない（作成を取りやめた・作成中の）ファイルである。
+    """
+    # MEDIA_ROOT からの相対パス（uploads/temp_uploads/...）
+    media_path: str
+    # アップロードの種類（image/video/excel/zip/sketch/ico）
+    kind: str
+    # アップロード元のファイル名
+    original_name: str
+    size: int
+    # アップロードしたブラウザのセッションキー
+    uploader: str = ''
+    created_at: Optional[datetime] = None
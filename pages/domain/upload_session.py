@@ -0,0 +1,31 @@
+"""分割アップロードのセッション"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass
+class UploadSessionEntity:
+    """分割・再開可能なアップロード1件分の状態
+
+    受信済みのバイト列は保存先フォルダの一時ファイル（.{upload_id}.part）に offset まで書き込まれている。
+    """
+    upload_id: str
+    # アップロードの種類（image/video/excel/zip/sketch/ico）
+    kind: str
+    # 保存先のページID（None なら temp_uploads/）
+    page_id: Optional[int]
+    # 保存するファイル名（作成時に決め、組み立て時に重複していれば番号を付ける）
+    filename: str
+    # アップロード元のファイル名
+    original_name: str
+    size: int
+    offset: int = 0
+    # 組み立て後のファイルの MEDIA_ROOT からの相対パス（完了前は空）
+    completed_path: str = ''
+    updated_at: Optional[datetime] = None
+
+    @property
+    def is_complete(self) -> bool:
+        return bool(self.completed_path)
@@ -1,19 +1,51 @@
 """Django ORM を用いたリポジトリ実装"""
 
-from typing import Optional, List, Dict
-from datetime import datetime
-from django.db import transaction
+import uuid
+from dataclasses import replace
+from typing import Optional, List, Dict, Tuple, Any, Set
+from datetime import datetime, timedelta
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction, IntegrityError
 from django.utils import timezone
 
-from ..models import Page
-from ..domain.page_aggregate import PageEntity
-from ..domain.repositories import PageRepositoryInterface
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+
+from ..models import Page, PageFolder, PageMedia, HtmlExportTask, ExportedHtml, UploadSession, TempUpload
+from ..domain.page_aggregate import PageEntity, MediaReferenceExtractor
+from ..domain.upload_session import UploadSessionEntity
+from ..domain.temp_upload import TempUploadEntity
+from .unit_of_work import UnitOfWork
+from ..domain.repositories import (
+    PageRepositoryInterface,
+    FolderManifestRepositoryInterface,
+    HtmlExportQueueRepositoryInterface,
+    HtmlDigestRepositoryInterface,
+    UploadSessionRepositoryInterface,
+    TempUploadRepositoryInterface,
+)
 
 
 class PageRepository(PageRepositoryInterface):
-    """Page リポジトリの実装"""
+    """Page リポジトリの実装
+    
+    インスタンスごとにアイデンティティマップを持つ。ビュー・管理コマンドは
+    リクエスト（コマンド実行）ごとにリポジトリを生成するため、マップの有効範囲は
+    1リクエスト／1コマンドとなり、その間の find_by_id / find_by_ids は
+    2回目以降DBにアクセスしない。
+    """
     
-    def _to_entity(self, page: Page, load_children: bool = False) -> PageEntity:
+    def __init__(self):
+        # ID -> 読み込み済みエンティティ
+        self._identity_map: Dict[int, PageEntity] = {}
+        # ID -> flush待ちの変更済みエンティティ
+        self._dirty: Dict[int, PageEntity] = {}
+        # ID -> DBに保存されている（と分かっている）永続化フィールドの値（変更検出用）
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        # ID -> ツリー表示用に読み込んだ content なしのエンティティ（フォルダパスの計算などに使う）
+        self._tree_nodes: Dict[int, PageEntity] = {}
+    
+    def _to_entity(self, page: Page) -> PageEntity:
         """Django のモデルをドメインエンティティへ変換"""
         entity = PageEntity(
             id=page.id,
@@ -26,13 +58,112 @@ class PageRepository(PageRepositoryInterface):
             updated_at=page.updated_at,
             children=[]
         )
+        return entity
+    
+    def _load(self, page: Page) -> PageEntity:
+        """モデルをエンティティに変換してアイデンティティマップに登録する（登録済みならその実体を返す）"""
+        entity = self._identity_map.get(page.id)
+        if entity is None:
+            entity = self._to_entity(page)
+            self._identity_map[page.id] = entity
+            self._snapshots[page.id] = entity.get_persistent_state()
+        return entity
+    
+    def _remember(self, entity: PageEntity) -> PageEntity:
+        """保存済みエンティティでアイデンティティマップと変更検出用の値を更新する
         
-        if load_children:
-            children = page.children.all().order_by('created_at')
-            entity.children = [self._to_entity(child, load_children=True) for child in children]
-        
+        content を読み込んでいないエンティティはマップに登録しない（次の find_by_id でDBから読み直す）。
+        """
+        if entity.content_loaded:
+            self._identity_map[entity.id] = entity
+            self._tree_nodes.pop(entity.id, None)
+        else:
+            self._identity_map.pop(entity.id, None)
+            self._tree_nodes[entity.id] = entity
+        self._snapshots[entity.id] = entity.get_persistent_state()
+        self._dirty.pop(entity.id, None)
         return entity
     
+    def _forget(self, page_id: int) -> None:
+        """削除されたページをアイデンティティマップから取り除く"""
+        self._identity_map.pop(page_id, None)
+        self._tree_nodes.pop(page_id, None)
+        self._snapshots.pop(page_id, None)
+        self._dirty.pop(page_id, None)
+    
+    def _sync_media_references(self, contents: Dict[int, str]) -> None:
+        """コンテンツ（ページID -> HTML）が参照するメディアとの差分だけをメディア参照表に反映する"""
+        if not contents:
+            return
+        
+        wanted = {
+            page_id: MediaReferenceExtractor.extract_paths(content)
+            for page_id, content in contents.items()
+        }
+        existing: Dict[int, Dict[str, Tuple[int, str]]] = {page_id: {} for page_id in contents}
+        for row_id, page_id, path, kind in PageMedia.objects.filter(
+            page_id__in=list(contents)
+        ).values_list('id', 'page_id', 'path', 'kind'):
+            existing[page_id][path] = (row_id, kind)
+        
+        stale_ids = []
+        to_create = []
+        for page_id, paths in wanted.items():
+            current = existing[page_id]
+            for path, (row_id, kind) in current.items():
+                if paths.get(path) != kind:
+                    stale_ids.append(row_id)
+            for path, kind in paths.items():
+                if path not in current or current[path][1] != kind:
+                    to_create.append(PageMedia(
+                        page_id=page_id,
+                        path=path,
+                        kind=kind,
+                        folder_page_id=MediaReferenceExtractor.folder_page_id(path),
+                    ))
+        
+        if stale_ids:
+            PageMedia.objects.filter(id__in=stale_ids).delete()
+        if to_create:
+            PageMedia.objects.bulk_create(to_create, batch_size=500)
+    
+    def _rebuild_paths_for_moved(self, moved: Dict[int, Optional[int]]) -> None:
+        """親が変わったページ（ID -> 新しい親ID）の祖先パスを更新する"""
+        if not moved:
+            return
+        for page in Page.objects.filter(id__in=list(moved)).only('id', 'parent_id', 'path', 'depth'):
+            page.parent_id = moved[page.id]
+            if page.is_path_stale():
+                page.rebuild_path()
+    
+    def _fetch_subtree_pages(self, page_id: int) -> List[Page]:
+        """再帰CTEで指定ページとその子孫を1クエリで取得する（order, created_at順）"""
+        qn = connection.ops.quote_name
+        table = qn(Page._meta.db_table)
+        sql = (
+            f'WITH RECURSIVE subtree(id) AS ('
+            f' SELECT id FROM {table} WHERE id = %s'
+            f' UNION ALL'
+            f' SELECT p.id FROM {table} p INNER JOIN subtree s ON p.parent_id = s.id'
+            f')'
+            f' SELECT * FROM {table} WHERE id IN (SELECT id FROM subtree)'
+            f' ORDER BY {qn("order")}, {qn("created_at")}'
+        )
+        return list(Page.objects.raw(sql, [page_id]))
+    
+    def _build_subtree_entity(self, pages: List[Page], root_id: int) -> Optional[PageEntity]:
+        """取得済みの行からメモリ上でエンティティツリーを組み立てる（エンティティはアイデンティティマップに登録する）"""
+        entities = {}
+        for page in pages:
+            entity = self._load(page)
+            entity.children = []
+            entities[page.id] = entity
+        # pagesはorder, created_at順に並んでいるため、追加順がそのまま兄弟の並び順になる
+        for page in pages:
+            if page.id != root_id and page.parent_id in entities:
+                entities[page.parent_id].children.append(entities[page.id])
+        return entities.get(root_id)
+    
     def _to_model(self, entity: PageEntity, existing_page: Optional[Page] = None) -> Page:
         """ドメインエンティティを Django モデルへ変換"""
         if existing_page:
@@ -55,79 +186,186 @@ class PageRepository(PageRepositoryInterface):
         return page
     
     def find_by_id(self, page_id: int) -> Optional[PageEntity]:
-        """ID でページを検索"""
+        """ID でページを検索（アイデンティティマップにあればDBにアクセスしない）"""
+        if page_id in self._identity_map:
+            return self._identity_map[page_id]
         try:
             page = Page.objects.get(id=page_id)
-            return self._to_entity(page)
+            return self._load(page)
         except Page.DoesNotExist:
             return None
     
+    def get_loaded(self, page_id: int) -> Optional[PageEntity]:
+        """読み込み済みのエンティティを取得する（DBにはアクセスしない。読み込んでいなければ None）
+        
+        find_all_tree_nodes で読み込んだ content なしのエンティティも返すため、タイトル・order・親など
+        content 以外を参照する用途（フォルダパスの計算など）に使う。
+        """
+        return self._identity_map.get(page_id) or self._tree_nodes.get(page_id)
+    
     def find_all_root_pages(self) -> List[PageEntity]:
         """ルート直下のページをすべて取得"""
         pages = Page.objects.filter(parent=None).order_by('order', 'created_at')
-        return [self._to_entity(page) for page in pages]
+        return [self._load(page) for page in pages]
     
     def find_all_pages(self) -> List[PageEntity]:
         """全ページを取得"""
         pages = Page.objects.all().order_by('order', 'created_at')
-        return [self._to_entity(page) for page in pages]
+        return [self._load(page) for page in pages]
+    
+    def find_all_tree_nodes(self) -> List[PageEntity]:
+        """ツリー表示用に全ページを取得（contentカラムはSELECTしない）
+        
+        アイデンティティマップにあるページはその実体を返す。それ以外は content を読み込んでいない
+        エンティティ（content_loaded=False）を返し、保存しても content は書き込まれない。
+        """
+        rows = Page.objects.order_by('order', 'created_at').values(
+            'id', 'title', 'icon', 'parent_id', 'order', 'created_at', 'updated_at'
+        )
+        nodes = []
+        for row in rows:
+            entity = self._identity_map.get(row['id'])
+            if entity is None:
+                entity = PageEntity(
+                    id=row['id'],
+                    title=row['title'],
+                    content='',
+                    icon=row['icon'],
+                    parent_id=row['parent_id'],
+                    order=row['order'],
+                    created_at=row['created_at'],
+                    updated_at=row['updated_at'],
+                    children=[],
+                    content_loaded=False
+                )
+                self._snapshots.setdefault(entity.id, entity.get_persistent_state())
+                self._tree_nodes[entity.id] = entity
+            nodes.append(entity)
+        return nodes
     
     def find_children(self, page_id: int) -> List[PageEntity]:
         """指定ページの子ページをすべて取得"""
         pages = Page.objects.filter(parent_id=page_id).order_by('order', 'created_at')
-        return [self._to_entity(page) for page in pages]
+        return [self._load(page) for page in pages]
+    
+    def find_ancestors(self, page_id: int, include_self: bool = False) -> List[PageEntity]:
+        """祖先パス（path）を用いて祖先ページをルートから順に取得"""
+        path = Page.objects.filter(id=page_id).values_list('path', flat=True).first()
+        if not path:
+            return []
+        
+        ancestor_ids = Page.path_to_ids(path)
+        if not include_self:
+            ancestor_ids = ancestor_ids[:-1]
+        if not ancestor_ids:
+            return []
+        
+        pages = Page.objects.filter(id__in=ancestor_ids).order_by('depth')
+        return [self._load(page) for page in pages]
+    
+    def is_in_subtree(self, page_id: int, root_id: int) -> bool:
+        """page_id のパスが root_id のサブツリーの範囲に収まるかで判定（インデックス範囲検索）"""
+        root_path = Page.objects.filter(id=root_id).values_list('path', flat=True).first()
+        if not root_path:
+            return False
+        lower, upper = Page.subtree_path_range(root_path)
+        return Page.objects.filter(id=page_id, path__gte=lower, path__lt=upper).exists()
     
     def save(self, entity: PageEntity) -> PageEntity:
-        """ページエンティティを保存"""
+        """ページエンティティを保存
+        
+        既存ページは事前のSELECTを行わず、読み込み時から変更されたカラムだけを
+        UPDATEする。変更がなければDBにアクセスしない。
+        """
         entity.validate()
         
-        if entity.id:
-            # 既存レコードを更新
-            try:
-                existing_page = Page.objects.get(id=entity.id)
-                page = self._to_model(entity, existing_page)
-            except Page.DoesNotExist:
-                page = self._to_model(entity)
-        else:
+        if not entity.id:
             # 新規作成
-            page = self._to_model(entity)
+            with transaction.atomic():
+                page = self._to_model(entity)
+                page.save()
+                self._sync_media_references({page.id: page.content})
+            return self._remember(self._to_entity(page))
+        
+        changed_fields = entity.get_changed_fields(self._snapshots.get(entity.id))
+        if not changed_fields:
+            return entity
+        
+        now = timezone.now()
+        values = {name: getattr(entity, name) for name in changed_fields}
+        with transaction.atomic():
+            updated = Page.objects.filter(id=entity.id).update(updated_at=now, **values)
+            if not updated:
+                # レコードが存在しない場合は新規作成
+                page = self._to_model(entity)
+                page.save()
+                self._sync_media_references({page.id: page.content})
+                return self._remember(self._to_entity(page))
+            
+            if 'parent_id' in changed_fields:
+                self._rebuild_paths_for_moved({entity.id: entity.parent_id})
+            if 'content' in changed_fields:
+                self._sync_media_references({entity.id: entity.content})
         
-        page.save()
-        return self._to_entity(page)
+        return self._remember(replace(entity, updated_at=now, children=[]))
     
-    @transaction.atomic
     def delete(self, page_id: int) -> None:
-        """ページとその子孫を再帰的に削除"""
-        try:
-            page = Page.objects.get(id=page_id)
-            
-            def delete_recursive(p: Page):
-                # 再帰的に子を削除してから自身を削除
-                for child in p.children.all():
-                    delete_recursive(child)
-                p.delete()
-            
-            delete_recursive(page)
-        except Page.DoesNotExist:
-            pass
+        """ページとその子孫を削除"""
+        self.delete_with_descendants(page_id)
+    
+    @transaction.atomic
+    def delete_with_descendants(self, page_id: int) -> Tuple[List[int], Dict[int, PageEntity]]:
+        """ページとその子孫を集合単位で一括削除し、削除したIDとエンティティマップを返す"""
+        pages = self._fetch_subtree_pages(page_id)
+        if not pages:
+            return [], {}
+        
+        entities_map = {page.id: self._to_entity(page) for page in pages}
+        # ルートを先頭にする（メディアフォルダ削除は親フォルダから行う）
+        deleted_ids = [page_id] + [pid for pid in entities_map if pid != page_id]
+        
+        # CASCADEのコレクタを経由せず、IDのバッチ単位でDELETEを発行する
+        # 子孫はすべて同じトランザクション内で削除されるため、外部キー制約は満たされる
+        qn = connection.ops.quote_name
+        table = qn(Page._meta.db_table)
+        folder_table = qn(PageFolder._meta.db_table)
+        media_table = qn(PageMedia._meta.db_table)
+        batch_size = 500
+        with connection.cursor() as cursor:
+            for start in range(0, len(deleted_ids), batch_size):
+                batch = deleted_ids[start:start + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                # フォルダ対応表・メディア参照の行も同じバッチで削除する（CASCADEのコレクタを経由しないため）
+                cursor.execute(f'DELETE FROM {folder_table} WHERE page_id IN ({placeholders})', batch)
+                cursor.execute(f'DELETE FROM {media_table} WHERE page_id IN ({placeholders})', batch)
+                cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', batch)
+        
+        for deleted_id in deleted_ids:
+            self._forget(deleted_id)
+        
+        return deleted_ids, entities_map
     
     def find_with_all_descendants(self, page_id: int) -> Optional[PageEntity]:
-        """指定ページを、全ての子孫を読み込んだ状態で取得"""
-        try:
-            page = Page.objects.get(id=page_id)
-            return self._to_entity(page, load_children=True)
-        except Page.DoesNotExist:
-            return None
+        """指定ページを、全ての子孫を読み込んだ状態で取得（1クエリ）"""
+        pages = self._fetch_subtree_pages(page_id)
+        return self._build_subtree_entity(pages, page_id)
     
     def find_by_ids(self, page_ids: List[int]) -> List[PageEntity]:
-        """複数のIDでページを一括検索"""
+        """複数のIDでページを一括検索（アイデンティティマップにないIDだけをDBから取得）"""
         if not page_ids:
             return []
-        pages = Page.objects.filter(id__in=page_ids)
-        return [self._to_entity(page) for page in pages]
+        found = [self._identity_map[pid] for pid in page_ids if pid in self._identity_map]
+        missing_ids = [pid for pid in page_ids if pid not in self._identity_map]
+        if missing_ids:
+            found.extend(self._load(page) for page in Page.objects.filter(id__in=missing_ids))
+        return found
     
     def bulk_update(self, entities: List[PageEntity], existing_pages: Optional[Dict[int, Page]] = None) -> List[PageEntity]:
-        """複数のページエンティティを一括更新する"""
+        """複数のページエンティティを一括更新する
+        
+        事前のSELECTは行わず、読み込み時から変更されたカラムだけを更新する。
+        変更のないエンティティは書き込まずにそのまま返す。
+        """
         if not entities:
             return []
         
@@ -135,42 +373,342 @@ class PageRepository(PageRepositoryInterface):
         for entity in entities:
             entity.validate()
         
-        # IDで既存のPageオブジェクトを一括取得
-        entity_ids = [e.id for e in entities if e.id]
-        if not entity_ids:
+        entities = [e for e in entities if e.id]
+        if not entities:
             return []
         
-        # 既存のPageオブジェクトが渡されていればそれを使用、なければ取得
-        if existing_pages is None:
-            existing_pages = {}
-        
-        # 不足しているPageオブジェクトを取得
-        missing_ids = [eid for eid in entity_ids if eid not in existing_pages]
-        if missing_ids:
-            fetched_pages = Page.objects.filter(id__in=missing_ids)
-            for page in fetched_pages:
-                existing_pages[page.id] = page
-        
         # 現在時刻を取得（全エンティティで統一、タイムゾーン対応）
         now = timezone.now()
         
-        # Djangoモデルに変換
+        # 変更のあったエンティティだけをDjangoモデル（主キーのみを持つ未取得のインスタンス）に変換
         pages_to_update = []
+        update_fields = set()
+        moved = {}
+        contents = {}
+        saved = {}
         for entity in entities:
-            if entity.id and entity.id in existing_pages:
-                page = self._to_model(entity, existing_pages[entity.id])
-                # bulk_updateではauto_nowが効かないため、手動でupdated_atを設定
-                page.updated_at = now
-                pages_to_update.append(page)
-        
-        # 一括更新（order, parent_id, updated_at, title, content, iconを更新）
-        Page.objects.bulk_update(
-            pages_to_update,
-            ['order', 'parent_id', 'updated_at', 'title', 'content', 'icon'],
-            batch_size=100
+            changed_fields = entity.get_changed_fields(self._snapshots.get(entity.id))
+            if not changed_fields:
+                saved[entity.id] = entity
+                continue
+            
+            page = Page(id=entity.id, updated_at=now, **entity.get_persistent_state())
+            pages_to_update.append(page)
+            update_fields.update(changed_fields)
+            if 'parent_id' in changed_fields:
+                moved[entity.id] = entity.parent_id
+            if 'content' in changed_fields:
+                contents[entity.id] = entity.content
+            saved[entity.id] = replace(entity, updated_at=now, children=[])
+        
+        if pages_to_update:
+            # 一括更新（変更のあったカラムとupdated_atのみ。bulk_updateではauto_nowが効かないため手動で設定）
+            with transaction.atomic():
+                Page.objects.bulk_update(
+                    pages_to_update,
+                    sorted(update_fields) + ['updated_at'],
+                    batch_size=100
+                )
+                
+                # bulk_updateはsave()を経由しないため、親が変わったページの祖先パスをここで更新する
+                self._rebuild_paths_for_moved(moved)
+                self._sync_media_references(contents)
+        
+        return [self._remember(saved[e.id]) for e in entities]
+    
+    def find_page_ids_referencing_media(self, media_path: str) -> List[int]:
+        """指定メディア（MEDIA_ROOT基準の相対パス）を参照しているページIDを取得する"""
+        return list(PageMedia.objects.filter(path=media_path).values_list('page_id', flat=True))
+    
+    def find_page_ids_referencing_page_folders(self, page_ids: List[int]) -> Set[int]:
+        """指定ページのメディアフォルダ（配下を含む）内のファイルを参照しているページIDを取得する
+
+        フォルダ配下のファイルは、指定ページとその子孫のいずれかのフォルダに入っているため、
+        サブツリーのIDを祖先パスの範囲検索で求め、参照表のフォルダのページID（索引）で検索する。
+        """
+        folder_page_ids = set(page_ids)
+        paths = list(Page.objects.filter(id__in=list(page_ids)).values_list('path', flat=True))
+        # ORの連鎖が長くなりすぎないよう（SQLiteの式の深さ制限）、一定件数ごとに分けて検索する
+        batch_size = 200
+        for start in range(0, len(paths), batch_size):
+            condition = Q()
+            for path in paths[start:start + batch_size]:
+                lower, upper = Page.subtree_path_range(path)
+                condition |= Q(path__gte=lower, path__lt=upper)
+            folder_page_ids.update(Page.objects.filter(condition).values_list('id', flat=True))
+        
+        folder_page_ids = list(folder_page_ids)
+        referencing = set()
+        for start in range(0, len(folder_page_ids), 500):
+            referencing.update(PageMedia.objects.filter(
+                folder_page_id__in=folder_page_ids[start:start + 500]
+            ).values_list('page_id', flat=True))
+        return referencing
+    
+    def find_media_paths_with_prefix(self, prefix: str) -> Set[str]:
+        """指定プレフィックス（例: "uploads/temp_uploads/"）配下で参照されているメディアパスを取得する"""
+        return set(PageMedia.objects.filter(path__startswith=prefix).values_list('path', flat=True))
+    
+    def find_media_paths_in_subtree(self, page_id: int) -> Set[str]:
+        """指定ページとその子孫が参照しているメディアパスを取得する（祖先パスの範囲検索）"""
+        path = Page.objects.filter(id=page_id).values_list('path', flat=True).first()
+        if not path:
+            return set()
+        lower, upper = Page.subtree_path_range(path)
+        return set(
+            PageMedia.objects.filter(page__path__gte=lower, page__path__lt=upper).values_list('path', flat=True)
+        )
+    
+    def find_media_paths_by_page(self) -> Dict[int, Set[str]]:
+        """全ページについて、ページID -> 参照しているメディアパスの辞書を取得する（1クエリ）"""
+        paths: Dict[int, Set[str]] = {}
+        for page_id, path in PageMedia.objects.values_list('page_id', 'path'):
+            paths.setdefault(page_id, set()).add(path)
+        return paths
+    
+    def register_dirty(self, entity: PageEntity) -> None:
+        """変更済みエンティティを登録する
+        
+        Unit of Work の範囲内（リクエスト・コマンドの実行中）では範囲の終わりの flush でまとめて書き込み、
+        範囲の外ではその場で書き込む（登録した変更が書き込まれないまま失われることはない）。
+        """
+        current = UnitOfWork.current()
+        if current is None:
+            self.save(entity)
+            return
+        if entity.content_loaded:
+            self._identity_map[entity.id] = entity
+        self._dirty[entity.id] = entity
+        current.track(self)
+    
+    def flush(self) -> List[PageEntity]:
+        """登録済みの変更済みエンティティを1回の一括更新で書き込む"""
+        if not self._dirty:
+            return []
+        entities = list(self._dirty.values())
+        self._dirty.clear()
+        return self.bulk_update(entities)
+    
+    def clear(self) -> None:
+        """アイデンティティマップ・変更検出用の値・未flushの変更を破棄する"""
+        self._identity_map.clear()
+        self._tree_nodes.clear()
+        self._snapshots.clear()
+        self._dirty.clear()
+
+
+class FolderManifestRepository(FolderManifestRepositoryInterface):
+    """ページID -> メディアフォルダの相対パスの対応表（PageFolder）の実装"""
+    
+    def get_path(self, page_id: int) -> Optional[str]:
+        """ページのフォルダの相対パスを取得する（主キーによる1回の読み取り）"""
+        return PageFolder.objects.filter(page_id=page_id).values_list('relative_path', flat=True).first()
+    
+    def get_paths(self, page_ids: List[int]) -> Dict[int, str]:
+        """複数のページのフォルダの相対パスを取得する（主キーの IN 検索）"""
+        page_ids = list(page_ids)
+        paths = {}
+        for start in range(0, len(page_ids), 500):
+            paths.update(
+                PageFolder.objects.filter(page_id__in=page_ids[start:start + 500])
+                .values_list('page_id', 'relative_path')
+            )
+        return paths
+    
+    def get_paths_in_subtree(self, page_id: int) -> Dict[int, str]:
+        """指定ページとその子孫のフォルダの相対パスを取得する（祖先パスの範囲検索で1クエリ）"""
+        path = Page.objects.filter(id=page_id).values_list('path', flat=True).first()
+        if not path:
+            return {}
+        lower, upper = Page.subtree_path_range(path)
+        return dict(
+            PageFolder.objects.filter(page__path__gte=lower, page__path__lt=upper)
+            .values_list('page_id', 'relative_path')
+        )
+    
+    def save_path(self, page_id: int, relative_path: str) -> None:
+        """ページのフォルダの相対パスを登録・更新する（削除済みのページは登録しない）"""
+        updated = PageFolder.objects.filter(page_id=page_id).update(
+            relative_path=relative_path, updated_at=timezone.now()
+        )
+        if not updated and Page.objects.filter(id=page_id).exists():
+            PageFolder.objects.create(page_id=page_id, relative_path=relative_path)
+    
+    def move_prefix(self, old_path: str, new_path: str) -> int:
+        """フォルダのリネーム・移動に合わせて、配下を含むすべての相対パスを1回のUPDATEで置き換える"""
+        if not old_path or old_path == new_path:
+            return 0
+        return PageFolder.objects.filter(
+            Q(relative_path=old_path) | Q(relative_path__startswith=f'{old_path}/')
+        ).update(
+            relative_path=Concat(Value(new_path), Substr('relative_path', len(old_path) + 1)),
+            updated_at=timezone.now()
+        )
+    
+    def delete_paths(self, page_ids: List[int]) -> None:
+        """ページのフォルダの登録を削除する"""
+        if page_ids:
+            PageFolder.objects.filter(page_id__in=page_ids).delete()
+
+
+class HtmlExportQueueRepository(HtmlExportQueueRepositoryInterface):
+    """HTML書き出しの待ち行列（HtmlExportTask）の実装"""
+    
+    def enqueue(self, page_id: int) -> None:
+        """書き出しを要求する（既存の要求があれば1回のUPDATEでまとめる）"""
+        now = timezone.now()
+        values = dict(requested_at=now, next_attempt_at=now, attempts=0, failed=False, last_error='')
+        if HtmlExportTask.objects.filter(page_id=page_id).update(**values):
+            return
+        try:
+            with transaction.atomic():
+                HtmlExportTask.objects.create(page_id=page_id, **values)
+        except IntegrityError:
+            # 同時に別のリクエストが登録した場合はその要求を更新する
+            HtmlExportTask.objects.filter(page_id=page_id).update(**values)
+    
+    def count_pending(self) -> int:
+        """未処理（失敗済みを除く）の要求数を取得する"""
+        return HtmlExportTask.objects.filter(failed=False).count()
+    
+    def claim_due(self, limit: int, claim_timeout: float) -> List[Tuple[int, datetime, int]]:
+        """実行時刻を過ぎた要求を処理中にする（条件付きUPDATEで、複数のワーカーが同じ要求を取らないようにする）"""
+        now = timezone.now()
+        claimable = Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - timedelta(seconds=claim_timeout))
+        candidates = list(
+            HtmlExportTask.objects.filter(claimable, failed=False, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', 'page_id', 'requested_at', 'attempts')[:limit]
         )
         
-        # 更新したpages_to_updateオブジェクトを直接エンティティに変換して返す
-        # 再度SELECTクエリを実行しない
-        pages_dict = {page.id: page for page in pages_to_update}
-        return [self._to_entity(pages_dict[e.id]) for e in entities if e.id and e.id in pages_dict]
\ No newline at end of file
+        claimed = []
+        for task_id, page_id, requested_at, attempts in candidates:
+            if HtmlExportTask.objects.filter(claimable, id=task_id, requested_at=requested_at).update(claimed_at=now):
+                claimed.append((page_id, requested_at, attempts))
+        return claimed
+    
+    def complete(self, page_id: int, requested_at: datetime) -> None:
+        """要求を完了にする（要求日時が変わっていれば、処理中の印だけを外す）"""
+        if not HtmlExportTask.objects.filter(page_id=page_id, requested_at=requested_at).delete()[0]:
+            HtmlExportTask.objects.filter(page_id=page_id).update(claimed_at=None)
+    
+    def fail(self, page_id: int, requested_at: datetime, error: str, retry_at: Optional[datetime]) -> None:
+        """要求の失敗を記録する（要求日時が変わっていれば、新しい要求として処理させる）"""
+        updated = HtmlExportTask.objects.filter(page_id=page_id, requested_at=requested_at).update(
+            claimed_at=None,
+            attempts=F('attempts') + 1,
+            last_error=error,
+            next_attempt_at=retry_at or timezone.now(),
+            failed=retry_at is None,
+        )
+        if not updated:
+            HtmlExportTask.objects.filter(page_id=page_id).update(claimed_at=None)
+    
+    def retry_failed(self) -> int:
+        """再試行の上限を超えた要求を、もう一度実行対象に戻す"""
+        return HtmlExportTask.objects.filter(failed=True).update(
+            failed=False, attempts=0, claimed_at=None, next_attempt_at=timezone.now()
+        )
+
+
+class HtmlDigestRepository(HtmlDigestRepositoryInterface):
+    """書き出したHTMLファイルのダイジェスト（ExportedHtml）の実装"""
+    
+    def get_digest(self, path: str) -> Optional[Tuple[str, int]]:
+        """最後に書き込んだ内容の (SHA-256, サイズ) を取得する"""
+        return ExportedHtml.objects.filter(path=path).values_list('digest', 'size').first()
+    
+    def save_digest(self, path: str, digest: str, size: int) -> None:
+        """書き込んだ内容の SHA-256 とサイズを記録する"""
+        ExportedHtml.objects.update_or_create(path=path, defaults={'digest': digest, 'size': size})
+
+
+class UploadSessionRepository(UploadSessionRepositoryInterface):
+    """分割アップロードのセッション（UploadSession）の実装"""
+    
+    FIELDS = ('upload_id', 'kind', 'page_id', 'filename', 'original_name', 'size', 'offset', 'completed_path', 'updated_at')
+    
+    def create(self, session: UploadSessionEntity) -> UploadSessionEntity:
+        """セッションを作成する（upload_id が空なら採番する）"""
+        upload_id = session.upload_id or str(uuid.uuid4())
+        model = UploadSession.objects.create(
+            upload_id=upload_id,
+            kind=session.kind,
+            page_id=session.page_id,
+            filename=session.filename,
+            original_name=session.original_name,
+            size=session.size,
+            offset=session.offset,
+        )
+        return replace(session, upload_id=upload_id, updated_at=model.updated_at)
+    
+    def find(self, upload_id: str) -> Optional[UploadSessionEntity]:
+        """セッションを取得する"""
+        try:
+            row = UploadSession.objects.filter(upload_id=upload_id).values(*self.FIELDS).first()
+        except ValidationError:
+            # UUID として解釈できないID
+            return None
+        return self._to_entity(row) if row else None
+    
+    def advance(self, upload_id: str, expected_offset: int, new_offset: int) -> bool:
+        """受信済みの位置を進める（同じ位置への同時書き込みは、先に記録した方だけが成功する）"""
+        return UploadSession.objects.filter(upload_id=upload_id, offset=expected_offset).update(
+            offset=new_offset, updated_at=timezone.now()
+        ) == 1
+    
+    def complete(self, upload_id: str, completed_path: str) -> None:
+        """組み立て後のファイルのパスを記録する"""
+        UploadSession.objects.filter(upload_id=upload_id).update(
+            completed_path=completed_path, updated_at=timezone.now()
+        )
+    
+    def delete(self, upload_id: str) -> None:
+        """セッションを削除する"""
+        UploadSession.objects.filter(upload_id=upload_id).delete()
+    
+    def find_updated_before(self, before: datetime) -> List[UploadSessionEntity]:
+        """before より前から更新されていないセッションを取得する"""
+        rows = UploadSession.objects.filter(updated_at__lt=before).values(*self.FIELDS)
+        return [self._to_entity(row) for row in rows]
+    
+    @staticmethod
+    def _to_entity(row: Dict[str, Any]) -> UploadSessionEntity:
+        return UploadSessionEntity(**{**row, 'upload_id': str(row['upload_id'])})
+
+
+class TempUploadRepository(TempUploadRepositoryInterface):
+    """一時フォルダへのアップロードの登録（TempUpload）の実装"""
+    
+    FIELDS = ('media_path', 'kind', 'original_name', 'size', 'uploader', 'created_at')
+    
+    def register(self, upload: TempUploadEntity) -> None:
+        """アップロードを登録する（同じパスの登録があれば置き換える）"""
+        TempUpload.objects.update_or_create(
+            media_path=upload.media_path,
+            defaults={
+                'kind': upload.kind,
+                'original_name': upload.original_name,
+                'size': upload.size,
+                'uploader': upload.uploader,
+            },
+        )
+    
+    def find_by_uploader(self, uploader: str) -> List[TempUploadEntity]:
+        """指定したセッションからのアップロードを取得する"""
+        rows = TempUpload.objects.filter(uploader=uploader).values(*self.FIELDS)
+        return [TempUploadEntity(**row) for row in rows]
+    
+    def find_created_before(self, before: datetime) -> List[TempUploadEntity]:
+        """before より前のアップロードを取得する"""
+        rows = TempUpload.objects.filter(created_at__lt=before).values(*self.FIELDS)
+        return [TempUploadEntity(**row) for row in rows]
+    
+    def find_all_paths(self) -> Set[str]:
+        """登録されているすべてのパスを取得する"""
+        return set(TempUpload.objects.values_list('media_path', flat=True))
+    
+    def delete(self, media_paths: List[str]) -> None:
+        """指定したパスの登録を削除する"""
+        if media_paths:
+            TempUpload.objects.filter(media_path__in=list(media_paths)).delete()
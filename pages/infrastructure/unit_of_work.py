@@ -0,0 +1,69 @@
+"""リクエスト（コマンド実行）単位で変更をまとめて書き込む Unit of Work"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional
+
+from django.db import transaction
+
+
+_current: ContextVar[Optional['UnitOfWork']] = ContextVar('pages_unit_of_work', default=None)
+
+
+class UnitOfWork:
+    """
+    範囲内で変更が登録されたリポジトリを覚えておき、範囲の終わりに1回だけ flush する
+
+    範囲はビューではミドルウェア（nmemo.middleware.UnitOfWorkMiddleware）、管理コマンドでは
+    unit_of_work() で開く。範囲の外で登録された変更は、リポジトリがその場で書き込む。
+    """
+
+    def __init__(self):
+        self._repositories: List = []
+        self._after_flush: List[Callable[[], None]] = []
+
+    @staticmethod
+    def current() -> Optional['UnitOfWork']:
+        """実行中の Unit of Work（範囲の外では None）"""
+        return _current.get()
+
+    def track(self, repository) -> None:
+        """flush 待ちの変更を持つリポジトリを登録する"""
+        if not any(tracked is repository for tracked in self._repositories):
+            self._repositories.append(repository)
+
+    def after_flush(self, callback: Callable[[], None]) -> None:
+        """変更を書き込んだ後に実行する処理を登録する"""
+        self._after_flush.append(callback)
+
+    def flush(self) -> None:
+        """登録されたリポジトリの変更を1つのトランザクションで書き込み、書き込み後の処理を実行する"""
+        repositories, self._repositories = self._repositories, []
+        if repositories:
+            with transaction.atomic():
+                for repository in repositories:
+                    repository.flush()
+        callbacks, self._after_flush = self._after_flush, []
+        for callback in callbacks:
+            callback()
+
+
+def run_after_flush(callback: Callable[[], None]) -> None:
+    """変更を書き込んだ後に実行する（範囲の外ではその場で実行する）"""
+    unit_of_work = UnitOfWork.current()
+    if unit_of_work is None:
+        callback()
+    else:
+        unit_of_work.after_flush(callback)
+
+
+@contextmanager
+def unit_of_work() -> Iterator[UnitOfWork]:
+    """Unit of Work の範囲を開き、例外なく抜けた場合に変更を書き込む"""
+    current = UnitOfWork()
+    token = _current.set(current)
+    try:
+        yield current
+        current.flush()
+    finally:
+        _current.reset(token)
@@ -0,0 +1,106 @@
+"""アップロードされたファイルを MEDIA_ROOT と同じファイルシステム上に受け取るアップロードハンドラー"""
+
+import hashlib
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.files import temp as tempfile
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+STAGING_FOLDER = '.staging'
+STAGING_PREFIX = '.upload-'
+
+
+def get_staging_dir() -> Path:
+    """受け取り用フォルダ（MEDIA_ROOT/uploads/.staging）"""
+    return Path(settings.MEDIA_ROOT) / 'uploads' / STAGING_FOLDER
+
+
+def cleanup_staging_dir(max_age: timedelta, dry_run: bool = False) -> int:
+    """受け取り途中で中断された（プロセスが強制終了された等）古いファイルを削除し、件数を返す"""
+    staging_dir = get_staging_dir()
+    if not staging_dir.is_dir():
+        return 0
+    cutoff = time.time() - max_age.total_seconds()
+    count = 0
+    for file_path in staging_dir.glob(f'{STAGING_PREFIX}*'):
+        try:
+            if not file_path.is_file() or file_path.stat().st_mtime >= cutoff:
+                continue
+            if not dry_run:
+                file_path.unlink()
+            count += 1
+        except OSError as e:
+            print(f"Warning: Failed to remove staged upload {file_path}: {e}")
+    return count
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    受け取り用フォルダに書き込まれたアップロードファイル
+
+    default_storage.save() は temporary_file_path() のファイルを os.rename で保存先に移動するため、
+    保存時に内容をコピーし直さない。digest は受け取りながら計算した内容の SHA-256。
+    """
+
+    def __init__(self, staging_dir: Path, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(prefix=STAGING_PREFIX, suffix='.upload' + ext, dir=staging_dir)
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.digest = hashlib.sha256()
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # 保存先に移動済み
+            pass
+
+
+class MediaStagingUploadHandler(FileUploadHandler):
+    """
+    アップロードされたファイルを MEDIA_ROOT/uploads/.staging に直接書き込むハンドラー
+
+    Django の既定のハンドラーはメモリか FILE_UPLOAD_TEMP_DIR（通常は /tmp）に受け取るため、
+    MEDIA_ROOT が Box の同期フォルダなど別のファイルシステムにあると、保存時に全体をコピーし直していた。
+    同じファイルシステムで受け取れば保存先（ページフォルダ・temp_uploads・blob）への移動は
+    os.rename だけになり、メディアの内容は同期フォルダに1回だけ書き込まれる。
+    
+    プロジェクト全体の FILE_UPLOAD_HANDLERS には登録せず、メディアのアップロードビューだけで
+    request.upload_handlers の先頭に追加する（pages.views.upload_views.stage_uploads）。
+    受け取ったファイルは後ろの既定のハンドラーには渡さない。
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        staging_dir = get_staging_dir()
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        self.file = StagedUploadedFile(
+            staging_dir, self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        # 既定のハンドラー（メモリ・/tmp）にはこのファイルを受け取らせない
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.file.digest.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            temp_location = self.file.temporary_file_path()
+            try:
+                self.file.close()
+                os.remove(temp_location)
+            except FileNotFoundError:
+                pass
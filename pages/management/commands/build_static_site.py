@@ -0,0 +1,61 @@
+"""全ページを静的サイトとして書き出すコマンド
+
+ページ階層どおりのフォルダに各ページのHTMLを書き出し、メディアは media/ に配置して
+相対パスでリンクする（base64で埋め込まない）。前回のビルドの記録（.build-manifest.json）と
+比べて、内容・タイトル・アイコン・並び順・親・参照メディアが変わったページだけを書き直す。
+
+使用方法:
+    python manage.py build_static_site /path/to/site
+    python manage.py build_static_site /path/to/site --workers 4  # 4プロセスで並列に書き出す
+    python manage.py build_static_site /path/to/site --force      # すべて書き直す
+    python manage.py build_static_site /path/to/site --copy       # メディアをハードリンクではなくコピーする
+"""
+
+import os
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from pages.infrastructure.repositories import PageRepository
+from pages.application.page_service.static_site_builder import StaticSiteBuilder
+
+
+class Command(BaseCommand):
+    help = '全ページを静的サイトとして書き出します（変更のあったページだけを書き直します）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('destination', help='書き出し先のディレクトリ')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='HTMLを書き出すプロセス数（1ならプロセスを分けない）',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='前回のビルドの記録を無視してすべて書き直す',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='メディアをハードリンクではなくコピーする',
+        )
+
+    def handle(self, *args, **options):
+        destination = Path(options['destination']).resolve()
+        builder = StaticSiteBuilder(PageRepository())
+
+        media_root = builder.media_root
+        if destination == media_root or media_root in destination.parents:
+            self.stdout.write(self.style.ERROR('出力先に MEDIA_ROOT 配下は指定できません。'))
+            return
+
+        result = builder.build(
+            destination,
+            workers=options['workers'],
+            force=options['force'],
+            copy_media=options['copy'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'ビルドしました: {destination}'))
+        self.stdout.write(f'  ページ: {result["pages"]}件（書き直し {result["rendered"]}件, 古い出力の削除 {result["removed"]}件）')
+        self.stdout.write(f'  メディア: 配置 {result["media_copied"]}件, 削除 {result["media_removed"]}件')
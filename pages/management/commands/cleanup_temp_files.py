@@ -1,5 +1,10 @@
 """page_tempフォルダの古いファイルをクリーンアップするコマンド
 
+UPLOAD_SESSION_EXPIRY_HOURS 以上更新されていない分割アップロードも中止し、一時ファイル（.part）を削除する。
+受け取り途中で中断されたアップロード（uploads/.staging）も同じ期限で削除する。
+一時アップロードの登録（TempUpload）にあるファイルは登録から古いものを検索して削除し、
+フォルダの一覧からは登録のないファイル（登録を始める前のもの・page_temp）だけを処理する。
+
 使用方法:
     python manage.py cleanup_temp_files
     python manage.py cleanup_temp_files --dry-run  # 実行せずに変更内容を表示
@@ -12,8 +17,11 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from pages.infrastructure.repositories import PageRepository
+from django.utils import timezone
+from pages.infrastructure.repositories import PageRepository, TempUploadRepository
+from pages.infrastructure.upload_handlers import cleanup_staging_dir
 from pages.application.page_service.media_service import MediaService
+from pages.application.page_service.chunked_upload_service import ChunkedUploadService
 
 
 class Command(BaseCommand):
@@ -54,6 +62,23 @@ class Command(BaseCommand):
         total_skipped = 0
         total_errors = 0
         
+        # 途中で止まった分割アップロード（一時ファイルはページフォルダにある場合もある）
+        expiry = timedelta(hours=getattr(settings, 'UPLOAD_SESSION_EXPIRY_HOURS', 24))
+        expired_uploads = ChunkedUploadService().expire_stale(expiry, dry_run=dry_run)
+        if expired_uploads:
+            self.stdout.write(f'期限切れの分割アップロード: {expired_uploads}件')
+        # 受け取り途中で中断されたアップロード（uploads/.staging）
+        staged_uploads = cleanup_staging_dir(expiry, dry_run=dry_run)
+        if staged_uploads:
+            self.stdout.write(f'受け取り途中で中断されたアップロード: {staged_uploads}件')
+        
+        # 登録されている一時アップロード
+        deleted, skipped, errors = self._cleanup_registered(dry_run, delete_all, days)
+        total_deleted += deleted
+        total_skipped += skipped
+        total_errors += errors
+        registered_paths = TempUploadRepository().find_all_paths()
+        
         for folder_name, temp_folder in temp_folders:
             if not temp_folder.exists():
                 self.stdout.write(self.style.SUCCESS(f'{folder_name}フォルダが存在しません。'))
@@ -65,7 +90,7 @@ class Command(BaseCommand):
             
             self.stdout.write(f'\n{folder_name}フォルダの処理を開始...')
             deleted, skipped, errors = self._cleanup_folder(
-                temp_folder, folder_name, dry_run, delete_all, days
+                temp_folder, folder_name, dry_run, delete_all, days, registered_paths
             )
             total_deleted += deleted
             total_skipped += skipped
@@ -83,14 +108,56 @@ class Command(BaseCommand):
             self.stdout.write(f'  スキップ: {total_skipped}件')
             self.stdout.write(f'  エラー: {total_errors}件')
     
-    def _cleanup_folder(self, temp_folder, folder_name, dry_run, delete_all, days):
-        """個別のフォルダをクリーンアップ"""
+    def _cleanup_registered(self, dry_run, delete_all, days):
+        """登録されている一時アップロードのうち古いものを削除する（フォルダは一覧しない）"""
+        registry = TempUploadRepository()
+        cutoff = timezone.now() if delete_all else timezone.now() - timedelta(days=days)
+        uploads = registry.find_created_before(cutoff)
+        if not uploads:
+            return 0, 0, 0
+        
+        self.stdout.write(f'\n登録されている一時アップロードの処理を開始...（{len(uploads)}件）')
+        referenced = PageRepository().find_media_paths_with_prefix('uploads/temp_uploads/')
+        media_root = Path(settings.MEDIA_ROOT)
+        
+        deleted_paths = []
+        skipped_count = 0
+        error_count = 0
+        for upload in uploads:
+            if upload.media_path in referenced:
+                self.stdout.write(
+                    self.style.WARNING(f'  ⚠ [{upload.media_path}] 参照されているためスキップ')
+                )
+                skipped_count += 1
+                continue
+            if dry_run:
+                self.stdout.write(f'  [{upload.media_path}] 削除対象: {upload.created_at:%Y-%m-%d %H:%M:%S} のアップロード')
+                deleted_paths.append(upload.media_path)
+                continue
+            try:
+                (media_root / upload.media_path).unlink(missing_ok=True)
+                self.stdout.write(self.style.SUCCESS(f'  ✓ [{upload.media_path}] 削除しました'))
+                deleted_paths.append(upload.media_path)
+            except OSError as e:
+                self.stdout.write(self.style.ERROR(f'  ✗ [{upload.media_path}] 削除エラー: {e}'))
+                error_count += 1
+        
+        if not dry_run:
+            registry.delete(deleted_paths)
+        return len(deleted_paths), skipped_count, error_count
+    
+    def _cleanup_folder(self, temp_folder, folder_name, dry_run, delete_all, days, registered_paths=frozenset()):
+        """個別のフォルダをクリーンアップ（登録されているファイルは _cleanup_registered で処理する）"""
         # ファイルを取得
         files = []
         try:
             for item in temp_folder.iterdir():
-                if item.is_file():
-                    files.append(item)
+                # 分割アップロード中の一時ファイルはセッションの期限で削除する
+                if not item.is_file() or item.suffix == ChunkedUploadService.PART_SUFFIX:
+                    continue
+                if f'uploads/{folder_name}/{item.name}' in registered_paths:
+                    continue
+                files.append(item)
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'ファイル一覧の取得に失敗しました: {e}')
@@ -188,26 +255,12 @@ class Command(BaseCommand):
         return deleted_count, skipped_count, error_count
     
     def _get_referenced_files(self, repository, folder_name) -> set:
-        """すべてのページコンテンツから参照されているファイル名の集合を取得"""
+        """いずれかのページから参照されているファイル名の集合を取得（メディア参照表の索引検索）"""
         referenced = set()
         
         try:
-            from pages.models import Page
-            all_pages = Page.objects.all()
-            
-            # フォルダ名に応じたパターン
-            if folder_name == 'temp_uploads':
-                pattern = r'/media/uploads/temp_uploads/([^"\'>\s?]+)'
-            else:
-                pattern = r'/media/uploads/page_temp/([^"\'>\s?]+)'
-            
-            for page in all_pages:
-                if page.content:
-                    import re
-                    matches = re.findall(pattern, page.content)
-                    for match in matches:
-                        filename = match.split('?')[0].split('#')[0]
-                        referenced.add(filename)
+            for media_path in repository.find_media_paths_with_prefix(f'uploads/{folder_name}/'):
+                referenced.add(media_path.split('/')[-1])
         except Exception as e:
             self.stdout.write(
                 self.style.WARNING(f'参照ファイルの取得中にエラー: {e}')
@@ -0,0 +1,96 @@
+"""ページのメディアフォルダを人が読める階層構造で書き出すコマンド
+
+IDレイアウト（PAGE_MEDIA_LAYOUT=id）では uploads/pages/{id}/ にファイルを保存するため、
+ページ階層どおりの {order}_page_{id}_{タイトル}/ 構造はこのコマンドで別のディレクトリに生成する。
+ファイルは可能な限りハードリンクで配置する（同一ファイルシステムでない場合はコピー）。
+
+使用方法:
+    python manage.py export_media_tree /path/to/export
+    python manage.py export_media_tree /path/to/export --copy   # ハードリンクを使わずコピーする
+    python manage.py export_media_tree /path/to/export --clean  # 出力先を空にしてから書き出す
+"""
+
+import os
+import re
+import shutil
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from pages.infrastructure.repositories import PageRepository
+from pages.application.page_service.media_service import MediaService
+from pages.application.page_service.html_generator import HtmlGenerator
+
+
+class Command(BaseCommand):
+    help = 'ページのメディアフォルダをページ階層どおりのフォルダ構造で書き出します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('destination', help='書き出し先のディレクトリ')
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='ハードリンクではなくファイルをコピーする',
+        )
+        parser.add_argument(
+            '--clean',
+            action='store_true',
+            help='書き出し前に出力先ディレクトリを空にする',
+        )
+
+    def handle(self, *args, **options):
+        destination = Path(options['destination']).resolve()
+        use_copy = options['copy']
+
+        repository = PageRepository()
+        media_service = MediaService(repository)
+        path_service = media_service.path_service
+
+        if destination == media_service.uploads_dir.resolve() or media_service.uploads_dir.resolve() in destination.parents:
+            self.stdout.write(self.style.ERROR('出力先に uploads/ 配下は指定できません。'))
+            return
+
+        if options['clean'] and destination.exists():
+            shutil.rmtree(destination)
+        destination.mkdir(parents=True, exist_ok=True)
+
+        # ツリー表示用の軽量な取得（contentなし）で全ページを読み込んでおき、パス計算でDBにアクセスしない
+        nodes = repository.find_all_tree_nodes()
+
+        exported_files = 0
+        missing_folders = 0
+        for entity in nodes:
+            source_folder = path_service.find_existing_page_folder(entity)
+            target_folder = destination / path_service.get_hierarchical_folder_path(entity)
+            target_folder.mkdir(parents=True, exist_ok=True)
+
+            if not source_folder:
+                missing_folders += 1
+                continue
+
+            for item in source_folder.iterdir():
+                # 階層レイアウトではサブフォルダは子ページのフォルダなので、ファイルのみを対象にする
+                if not item.is_file():
+                    continue
+                name = item.name
+                if name == HtmlGenerator.ID_LAYOUT_HTML_FILENAME and path_service.uses_id_layout:
+                    safe_title = re.sub(r'[<>:"/\\|?*]', '_', entity.title)
+                    name = f'{safe_title}.html'
+                self._place_file(item, target_folder / name, use_copy)
+                exported_files += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'書き出しました: ページ {len(nodes)}件, ファイル {exported_files}件 -> {destination}'
+        ))
+        if missing_folders:
+            self.stdout.write(self.style.WARNING(f'  メディアフォルダのないページ: {missing_folders}件'))
+
+    def _place_file(self, source: Path, target: Path, use_copy: bool) -> None:
+        """ファイルをハードリンク（またはコピー）で配置する"""
+        if target.exists():
+            target.unlink()
+        if not use_copy:
+            try:
+                os.link(source, target)
+                return
+            except OSError:
+                pass
+        shutil.copy2(source, target)
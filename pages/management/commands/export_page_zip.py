@@ -0,0 +1,55 @@
+"""ページとその子孫をZIPとして書き出すコマンド
+
+ページごとのHTML（メディアへは相対パスでリンク）と、参照しているメディアファイルを
+1つのZIPにまとめる。ZIPは書き込みながら出力するため、全体をメモリに持たない。
+
+使用方法:
+    python manage.py export_page_zip 12 /path/to/section.zip
+    python manage.py export_page_zip 12 /path/to/section.zip --workers 8  # 先読みのスレッド数
+"""
+
+import os
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from pages.infrastructure.repositories import PageRepository
+from pages.application.page_service.page_archive import PageArchiveService
+
+
+class Command(BaseCommand):
+    help = 'ページとその子孫をZIPとして書き出します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('page_id', type=int, help='書き出すページのID')
+        parser.add_argument('output', help='出力するZIPファイルのパス')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='メディアファイルを先読みするスレッド数',
+        )
+
+    def handle(self, *args, **options):
+        output = Path(options['output'])
+        archive_service = PageArchiveService(PageRepository(), max_workers=options['workers'])
+
+        result = archive_service.stream_subtree_zip(options['page_id'])
+        if result is None:
+            raise CommandError(f'ページが見つかりません: {options["page_id"]}')
+        title, zip_chunks = result
+
+        # 書き込み途中のZIPが残らないよう、一時ファイルに書いてから置き換える
+        output.parent.mkdir(parents=True, exist_ok=True)
+        temp_output = output.with_name(f'.{output.name}.tmp')
+        size = 0
+        try:
+            with open(temp_output, 'wb') as f:
+                for chunk in zip_chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(temp_output, output)
+        except BaseException:
+            if temp_output.exists():
+                temp_output.unlink()
+            raise
+
+        self.stdout.write(self.style.SUCCESS(f'書き出しました: {title} -> {output} ({size:,} bytes)'))
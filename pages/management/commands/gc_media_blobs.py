@@ -0,0 +1,37 @@
+"""どのページからも参照されていない blob（内容アドレス方式で保存したメディア）を削除するコマンド
+
+アップロードされたまま保存されなかった blob は、ページの保存・削除時には削除されないため、
+このコマンドで定期的に削除する（MEDIA_DEDUP_GRACE_SECONDS を過ぎたものだけが対象）。
+
+使用方法:
+    python manage.py gc_media_blobs
+    python manage.py gc_media_blobs --dry-run  # 実行せずに削除対象を表示
+"""
+
+from django.core.management.base import BaseCommand
+from pages.infrastructure.repositories import PageRepository
+from pages.application.page_service.media_blob_store import MediaBlobStore
+
+
+class Command(BaseCommand):
+    help = 'どのページからも参照されていない blob を削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='実際には削除せず、削除対象を表示するだけ',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        blob_store = MediaBlobStore(PageRepository())
+
+        collected = blob_store.collect_garbage(dry_run=dry_run)
+        for media_path in collected:
+            self.stdout.write(f'  {media_path}')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'削除対象: {len(collected)}件（DRY RUN）'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'削除しました: {len(collected)}件'))
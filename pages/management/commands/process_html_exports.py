@@ -0,0 +1,84 @@
+"""HTML書き出しの待ち行列を処理するコマンド
+
+HTML_EXPORT_MODE=queue では、ページ保存時にHTML版の書き出しを待ち行列（HtmlExportTask）に
+登録するだけにしている。--loop で常駐させている間は、HTML_EXPORT_IN_PROCESS_WORKER=auto（既定）の
+サーバープロセスは自前のワーカーを動かさず、このコマンドだけが書き出す。
+
+使用方法:
+    python manage.py process_html_exports                 # 溜まっている要求を処理して終了
+    python manage.py process_html_exports --loop          # 常駐して処理し続ける
+    python manage.py process_html_exports --retry-failed  # 再試行の上限を超えた要求を戻してから処理
+    python manage.py process_html_exports --status        # 待ち行列の状況を表示
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from pages.models import HtmlExportTask
+from pages.application.page_service.html_export_queue import HtmlExportQueue
+
+
+class Command(BaseCommand):
+    help = 'HTML書き出しの待ち行列を処理します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='終了せずに待ち行列を処理し続ける',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=HtmlExportQueue.POLL_INTERVAL,
+            help='--loop で待ち行列を確認する間隔（秒）',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='再試行の上限を超えた要求を実行対象に戻す',
+        )
+        parser.add_argument(
+            '--status',
+            action='store_true',
+            help='処理せずに待ち行列の状況を表示するだけ',
+        )
+
+    def handle(self, *args, **options):
+        queue = HtmlExportQueue()
+
+        if options['status']:
+            self._show_status()
+            return
+
+        if options['retry_failed']:
+            count = queue.queue_repository.retry_failed()
+            self.stdout.write(f'失敗した要求を戻しました: {count}件')
+
+        if not options['loop']:
+            processed = queue.process_pending()
+            self.stdout.write(self.style.SUCCESS(f'HTMLを書き出しました: {processed}件'))
+            return
+
+        self.stdout.write(f'待ち行列を処理しています（{options["interval"]}秒間隔、Ctrl+Cで終了）')
+        try:
+            while True:
+                queue.touch_heartbeat(options['interval'])
+                close_old_connections()
+                processed = queue.process_pending()
+                if processed:
+                    self.stdout.write(f'  HTMLを書き出しました: {processed}件')
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('終了しました'))
+        finally:
+            queue.clear_heartbeat()
+
+    def _show_status(self):
+        """待ち行列の件数と、失敗した要求を表示する"""
+        pending = HtmlExportTask.objects.filter(failed=False).count()
+        failed = HtmlExportTask.objects.filter(failed=True).order_by('page_id')
+        self.stdout.write(f'未処理: {pending}件')
+        self.stdout.write(f'失敗（再試行の上限超過）: {failed.count()}件')
+        for task in failed:
+            self.stdout.write(self.style.WARNING(f'  ページ {task.page_id}: {task.last_error}'))
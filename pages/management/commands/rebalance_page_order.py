@@ -0,0 +1,79 @@
+"""兄弟ページの並び順（order）を等間隔に振り直すコマンド
+
+並び替えは前後の兄弟の中間値を割り当てるため、同じ位置への移動を繰り返すと
+中間値が取れなくなる。その場合は並び替え時に兄弟全体を振り直すが、定期的に
+このコマンドを実行しておくことで、通常の並び替えを1件の書き込みに保てる。
+
+既定では、間隔が ORDER_GAP 未満の兄弟を振り直す。ORDER_GAP 導入前に10刻みで
+採番されたページもこれに含まれるため、アップグレード後に一度実行しておく。
+
+使用方法:
+    python manage.py rebalance_page_order
+    python manage.py rebalance_page_order --min-gap 2  # 中間値を取れない兄弟だけ振り直す
+    python manage.py rebalance_page_order --all        # 間隔に余裕がある兄弟も振り直す
+    python manage.py rebalance_page_order --dry-run    # 実行せずに対象を表示
+"""
+
+from itertools import groupby
+from django.core.management.base import BaseCommand
+from pages.models import Page
+from pages.infrastructure.repositories import PageRepository
+from pages.infrastructure.unit_of_work import unit_of_work
+from pages.application.page_service.service import PageApplicationService
+from pages.domain.page_aggregate import PageOrdering
+
+
+class Command(BaseCommand):
+    help = '兄弟ページの並び順を等間隔に振り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='間隔に余裕がある兄弟も含めてすべて振り直す',
+        )
+        parser.add_argument(
+            '--min-gap',
+            type=int,
+            default=PageOrdering.ORDER_GAP,
+            help=f'隣接する兄弟の間隔がこの値未満の兄弟を振り直す（既定: {PageOrdering.ORDER_GAP}）',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='実際には変更せず、対象の親ページを表示するだけ',
+        )
+
+    def handle(self, *args, **options):
+        rebalance_all = options['all']
+        min_gap = options['min_gap']
+        dry_run = options['dry_run']
+
+        rows = Page.objects.order_by('parent_id', 'order', 'created_at').values_list('parent_id', 'order')
+        targets = []
+        for parent_id, group in groupby(rows, key=lambda row: row[0]):
+            orders = [order for _, order in group]
+            if rebalance_all or PageOrdering.needs_rebalance(orders, min_gap):
+                targets.append(parent_id)
+
+        if not targets:
+            self.stdout.write(self.style.SUCCESS('振り直しが必要な兄弟ページはありません。'))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUNモード: 実際の変更は行いません'))
+            for parent_id in targets:
+                self.stdout.write(f'  親ページ: {parent_id if parent_id else "(ルート)"}')
+            return
+
+        total = 0
+        for parent_id in targets:
+            # 親ごとにリポジトリ（アイデンティティマップ）を分けて、メモリ使用量を抑える
+            # URLの書き換えは親ごとの Unit of Work の終わりにまとめて書き込む
+            with unit_of_work():
+                service = PageApplicationService(PageRepository())
+                count = service.rebalance_page_order(parent_id)
+            total += count
+            self.stdout.write(f'  親ページ: {parent_id if parent_id else "(ルート)"} - {count}件')
+
+        self.stdout.write(self.style.SUCCESS(f'並び順を振り直しました: {total}件'))
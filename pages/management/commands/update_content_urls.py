@@ -5,11 +5,12 @@
     python manage.py update_content_urls --dry-run  # 実行せずに変更内容を表示
 """
 
-import re
 from django.core.management.base import BaseCommand
-from pages.models import Page
+from pages.models import Page, PageMedia
+from pages.domain.page_aggregate import ContentScanner
 from pages.infrastructure.repositories import PageRepository
 from pages.application.page_service.media_service import MediaService
+from pages.application.page_service.content_url_rewriter import ContentUrlRewriter
 
 
 class Command(BaseCommand):
@@ -28,8 +29,8 @@ class Command(BaseCommand):
         repository = PageRepository()
         media_service = MediaService(repository)
         
-        # すべてのページを取得
-        all_pages = Page.objects.all()
+        # メディアを参照しているページだけを取得（メディア参照表の索引検索）
+        all_pages = Page.objects.filter(id__in=PageMedia.objects.values('page_id'))
         total_pages = all_pages.count()
         
         if total_pages == 0:
@@ -83,9 +84,9 @@ class Command(BaseCommand):
                             new_url = f'/media/uploads/{folder_path_str}/{filename}'
                             self.stdout.write(f'    {old_url} -> {new_url}')
                     else:
-                        # データベースを更新
-                        page.content = new_content
-                        page.save(update_fields=['content'])
+                        # データベースを更新（リポジトリ経由で保存し、メディア参照表も更新する）
+                        entity.content = new_content
+                        repository.save(entity)
                         self.stdout.write(
                             self.style.SUCCESS(
                                 f'  [{page.id}] ✓ {page.title} - URLを更新しました'
@@ -118,64 +119,19 @@ class Command(BaseCommand):
             self.stdout.write(f'  エラー: {error_count}件')
     
     def _update_urls_in_content(self, content: str, page_id: int, new_folder_path: str) -> str:
-        """コンテンツ内のURLを新しいフォルダパスに更新"""
-        if not content:
-            return content
+        """コンテンツ内のURLを新しいフォルダパスに更新
         
-        # 古いURLパターンを検索
-        # パターン1: /media/uploads/page_{id}/filename
-        pattern1 = re.compile(
-            rf'/media/uploads/page_{page_id}/([^"\'>\s]+)',
-            re.IGNORECASE
-        )
-        
-        # パターン2: /media/uploads/{order}_page_{id}_{title}/filename (既に変換済みだが階層構造ではない)
-        pattern2 = re.compile(
-            rf'/media/uploads/\d+_page_{page_id}_[^/]+/([^"\'>\s]+)',
-            re.IGNORECASE
-        )
-        
-        updated_content = content
-        
-        def replace_url(match):
-            filename = match.group(1)
-            new_url = f'/media/uploads/{new_folder_path}/{filename}'
-            return new_url
-        
-        # パターン1を置換
-        updated_content = pattern1.sub(replace_url, updated_content)
-        
-        # パターン2を置換（既に変換済みだが、フラット構造の場合）
-        updated_content = pattern2.sub(replace_url, updated_content)
-        
-        return updated_content
+        /media/uploads/page_{id}/filename（古い形式）と
+        /media/uploads/.../{order}_page_{id}_{title}/filename の両方を書き換える。
+        """
+        return ContentUrlRewriter({page_id: new_folder_path}).rewrite(content)
     
     def _extract_urls(self, content: str, page_id: int) -> list:
-        """コンテンツから該当ページのURLを抽出"""
-        if not content:
-            return []
-        
+        """コンテンツから該当ページのURL（img/video/source タグの src 属性）を抽出"""
         urls = []
-        
-        # img タグのsrc属性を抽出
-        img_pattern = r'<img[^>]+src=["\']([^"\']+)["\']'
-        for match in re.finditer(img_pattern, content):
-            url = match.group(1)
-            if f'page_{page_id}' in url or '/media/uploads/' in url:
-                urls.append(url)
-        
-        # video タグのsrc属性を抽出
-        video_pattern = r'<video[^>]+src=["\']([^"\']+)["\']'
-        for match in re.finditer(video_pattern, content):
-            url = match.group(1)
-            if f'page_{page_id}' in url or '/media/uploads/' in url:
-                urls.append(url)
-        
-        # source タグのsrc属性を抽出
-        source_pattern = r'<source[^>]+src=["\']([^"\']+)["\']'
-        for match in re.finditer(source_pattern, content):
-            url = match.group(1)
-            if f'page_{page_id}' in url or '/media/uploads/' in url:
-                urls.append(url)
-        
+        for reference in ContentScanner.scan(content).references:
+            if reference.tag not in ('img', 'video', 'source') or reference.attr != 'src':
+                continue
+            if f'page_{page_id}' in reference.url or '/media/uploads/' in reference.url:
+                urls.append(reference.url)
         return urls
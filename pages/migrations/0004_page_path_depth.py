@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+def populate_page_paths(apps, schema_editor):
+    """既存ページのpath/depthをルートから幅優先で計算する"""
+    Page = apps.get_model('pages', 'Page')
+    children_map = {}
+    for page in Page.objects.all().only('id', 'parent_id'):
+        children_map.setdefault(page.parent_id, []).append(page)
+    
+    pages_to_update = []
+    queue = [(page, '/') for page in children_map.get(None, [])]
+    while queue:
+        page, parent_path = queue.pop(0)
+        page.path = f'{parent_path}{page.id}/'
+        page.depth = page.path.count('/') - 2
+        pages_to_update.append(page)
+        queue.extend((child, page.path) for child in children_map.get(page.id, []))
+    
+    Page.objects.bulk_update(pages_to_update, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0003_alter_page_options_page_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, verbose_name='階層の深さ'),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=1000, verbose_name='祖先パス'),
+        ),
+        migrations.RunPython(populate_page_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0004_page_path_depth'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['parent', 'order', 'created_at'], name='page_parent_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['order', 'created_at'], name='page_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['-updated_at'], name='page_updated_at_idx'),
+        ),
+    ]
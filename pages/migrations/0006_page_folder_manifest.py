@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0005_page_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageFolder',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='folder', serialize=False, to='pages.page', verbose_name='ページ')),
+                ('relative_path', models.CharField(db_index=True, max_length=1000, verbose_name='フォルダの相対パス')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'ページフォルダ',
+                'verbose_name_plural': 'ページフォルダ',
+            },
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:12
+
+import urllib.parse
+from html.parser import HTMLParser
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# 抽出処理はこのマイグレーションを作成した時点のものを固定して持つ
+# （アプリケーションの MediaReferenceExtractor / ContentScanner は変わり続けるため参照しない）
+# 規則は実行時のものと同じ: 開始タグの属性をHTMLとして解釈し（文字参照はデコード、コメント内は対象外）、
+# タグごとのURL属性が /media/ 配下（a タグは /media/uploads/ 配下）を指すものを数える
+MEDIA_TAGS = {
+    'img': ('src', 'image', '/media/'),
+    'video': ('src', 'video', '/media/'),
+    # video 内の source タグ
+    'source': ('src', 'video', '/media/'),
+    # Quill の動画埋め込み
+    'iframe': ('src', 'video', '/media/'),
+    # a タグの href 属性から /media/uploads/ のファイルリンク
+    'a': ('href', 'file', '/media/uploads/'),
+}
+
+
+def normalize_media_url(url):
+    """/media/ 配下を指すURLを /media/ 以降に正規化する（http://host/media/... を含む。それ以外は None）"""
+    if url.startswith('/media/'):
+        return url
+    if url.startswith(('http://', 'https://')):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.path.startswith('/media/'):
+            return url[url.index(parsed.path, len(parsed.scheme) + 3):]
+    return None
+
+
+class MediaAttributeParser(HTMLParser):
+    """メディア参照となるURL属性を出現順に集める"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.media_urls = {}
+
+    def handle_starttag(self, tag, attrs):
+        media_attr, kind, kind_prefix = MEDIA_TAGS.get(tag, (None, None, None))
+        if media_attr is None:
+            return
+        for name, value in attrs:
+            if name != media_attr or not value:
+                continue
+            media_url = normalize_media_url(value)
+            if media_url is not None and media_url.startswith(kind_prefix):
+                self.media_urls.setdefault(media_url, kind)
+
+    handle_startendtag = handle_starttag
+
+
+def extract_media_paths(content):
+    """コンテンツが参照しているメディアファイルの相対パス（MEDIA_ROOT基準）と種別の辞書を返す"""
+    paths = {}
+    if not content:
+        return paths
+    parser = MediaAttributeParser()
+    parser.feed(content)
+    parser.close()
+    for url, kind in parser.media_urls.items():
+        url = url.split('?')[0].split('#')[0]
+        path = urllib.parse.unquote(url[len('/media/'):])
+        if path:
+            paths.setdefault(path, kind)
+    return paths
+
+
+def populate_page_media(apps, schema_editor):
+    """既存ページのコンテンツからメディア参照を抽出して登録する"""
+    Page = apps.get_model('pages', 'Page')
+    PageMedia = apps.get_model('pages', 'PageMedia')
+    
+    references = []
+    for page_id, content in Page.objects.values_list('id', 'content').iterator():
+        for path, kind in extract_media_paths(content).items():
+            references.append(PageMedia(page_id=page_id, path=path, kind=kind))
+    
+    PageMedia.objects.bulk_create(references, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0006_page_folder_manifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(db_index=True, max_length=1000, verbose_name='メディアパス')),
+                ('kind', models.CharField(choices=[('image', '画像'), ('video', '動画'), ('file', 'ファイル')], max_length=10, verbose_name='種別')),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_refs', to='pages.page', verbose_name='ページ')),
+            ],
+            options={
+                'verbose_name': 'ページのメディア参照',
+                'verbose_name_plural': 'ページのメディア参照',
+                'constraints': [models.UniqueConstraint(fields=('page', 'path'), name='page_media_page_path_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_page_media, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0007_page_media_references'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HtmlExportTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_id', models.BigIntegerField(unique=True, verbose_name='ページID')),
+                ('requested_at', models.DateTimeField(verbose_name='要求日時')),
+                ('next_attempt_at', models.DateTimeField(db_index=True, verbose_name='次回実行日時')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='処理開始日時')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='失敗回数')),
+                ('failed', models.BooleanField(default=False, verbose_name='失敗（再試行の上限超過）')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='最後のエラー')),
+            ],
+            options={
+                'verbose_name': 'HTML書き出し待ち',
+                'verbose_name_plural': 'HTML書き出し待ち',
+            },
+        ),
+    ]
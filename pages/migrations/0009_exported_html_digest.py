@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0008_html_export_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportedHtml',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1000, unique=True, verbose_name='HTMLファイルのパス')),
+                ('digest', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('size', models.PositiveBigIntegerField(verbose_name='サイズ')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '書き出し済みHTML',
+                'verbose_name_plural': '書き出し済みHTML',
+            },
+        ),
+    ]
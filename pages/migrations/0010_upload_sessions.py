@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0009_exported_html_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.UUIDField(unique=True, verbose_name='アップロードID')),
+                ('kind', models.CharField(max_length=20, verbose_name='種類')),
+                ('page_id', models.BigIntegerField(blank=True, null=True, verbose_name='ページID')),
+                ('filename', models.CharField(max_length=255, verbose_name='保存するファイル名')),
+                ('original_name', models.CharField(max_length=255, verbose_name='元のファイル名')),
+                ('size', models.PositiveBigIntegerField(verbose_name='サイズ')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='受信済みのバイト数')),
+                ('completed_path', models.CharField(blank=True, default='', max_length=1000, verbose_name='組み立て後のパス')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '分割アップロード',
+                'verbose_name_plural': '分割アップロード',
+            },
+        ),
+    ]
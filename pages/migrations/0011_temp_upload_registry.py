@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0010_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TempUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_path', models.CharField(max_length=500, unique=True, verbose_name='パス')),
+                ('kind', models.CharField(max_length=20, verbose_name='種類')),
+                ('original_name', models.CharField(max_length=255, verbose_name='元のファイル名')),
+                ('size', models.PositiveBigIntegerField(verbose_name='サイズ')),
+                ('uploader', models.CharField(blank=True, db_index=True, default='', max_length=40, verbose_name='アップロードしたセッション')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='アップロード日時')),
+            ],
+            options={
+                'verbose_name': '一時アップロード',
+                'verbose_name_plural': '一時アップロード',
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:46
+
+import re
+
+from django.db import migrations, models
+
+
+# フォルダ名の解釈はこのマイグレーションを作成した時点のものを固定して持つ
+PAGE_FOLDER_PATTERN = re.compile(r'(?:\d+_)?page_(\d+)(?:_.*)?')
+
+
+def folder_page_id(media_path):
+    """メディアパスのファイルを含む（最も内側の）ページフォルダのページID"""
+    segments = media_path.split('/')[:-1]
+    for index in range(len(segments) - 1, 0, -1):
+        match = PAGE_FOLDER_PATTERN.fullmatch(segments[index])
+        if match:
+            return int(match.group(1))
+        if index == 2 and segments[1] == 'pages' and segments[index].isdigit():
+            return int(segments[index])
+    return None
+
+
+def populate_folder_page_id(apps, schema_editor):
+    """既存のメディア参照にフォルダのページIDを設定する"""
+    PageMedia = apps.get_model('pages', 'PageMedia')
+    
+    rows = []
+    for row in PageMedia.objects.only('id', 'path').iterator():
+        row.folder_page_id = folder_page_id(row.path)
+        if row.folder_page_id is not None:
+            rows.append(row)
+    PageMedia.objects.bulk_update(rows, ['folder_page_id'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0011_temp_upload_registry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagemedia',
+            name='folder_page_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True, verbose_name='フォルダのページID'),
+        ),
+        migrations.RunPython(populate_folder_page_id, migrations.RunPython.noop),
+    ]
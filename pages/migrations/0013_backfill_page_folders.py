@@ -0,0 +1,67 @@
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.db import migrations
+
+
+# フォルダの探し方はこのマイグレーションを作成した時点のもの（MediaPathService の走査）を固定して持つ
+UNSAFE_TITLE_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+def find_page_folder(subfolders, page_id, title):
+    """親フォルダ直下のフォルダから、フォルダ名にページIDと現在のタイトルを含むものを探す"""
+    safe_title = UNSAFE_TITLE_CHARS.sub('_', title)
+    for item in subfolders:
+        if f'_page_{page_id}_' in item.name and safe_title in item.name:
+            return item
+    return None
+
+
+def backfill_page_folders(apps, schema_editor):
+    """既存のページフォルダを対応表（PageFolder）に登録する
+
+    ルートのページから順に、親のフォルダの直下だけを調べる（子を持つページごとに1回の iterdir）。
+    IDレイアウト（uploads/pages/{id}/）ではフォルダの場所が決まっているため対応表を使わない。
+    """
+    if getattr(settings, 'PAGE_MEDIA_LAYOUT', 'hierarchical') == 'id':
+        return
+    uploads_dir = Path(settings.MEDIA_ROOT) / 'uploads'
+    if not uploads_dir.is_dir():
+        return
+
+    Page = apps.get_model('pages', 'Page')
+    PageFolder = apps.get_model('pages', 'PageFolder')
+
+    children = {}
+    for page_id, parent_id, title in Page.objects.values_list('id', 'parent_id', 'title').order_by('order', 'id'):
+        children.setdefault(parent_id, []).append((page_id, title))
+    recorded = set(PageFolder.objects.values_list('page_id', flat=True))
+
+    rows = []
+    stack = [(None, uploads_dir)]
+    while stack:
+        parent_id, parent_folder = stack.pop()
+        if parent_id not in children:
+            continue
+        subfolders = sorted(item for item in parent_folder.iterdir() if item.is_dir())
+        for page_id, title in children[parent_id]:
+            folder = find_page_folder(subfolders, page_id, title)
+            if folder is None:
+                # フォルダのないページの子孫はフォルダを持てない（親フォルダの直下に作られる）
+                continue
+            if page_id not in recorded:
+                rows.append(PageFolder(page_id=page_id, relative_path=folder.relative_to(uploads_dir).as_posix()))
+            stack.append((page_id, folder))
+    PageFolder.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0012_page_media_folder_page'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_page_folders, migrations.RunPython.noop),
+    ]
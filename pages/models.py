@@ -1,6 +1,8 @@
 """Page models"""
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 
 
 class Page(models.Model):
@@ -17,6 +19,9 @@ class Page(models.Model):
         verbose_name='親ページ'
     )
     order = models.IntegerField(default=0, verbose_name='表示順序')
+    # 祖先パス（例: "/1/5/12/"。ルートから自身までのIDを "/" 区切りで保持する）
+    path = models.CharField(max_length=1000, blank=True, default='', db_index=True, verbose_name='祖先パス')
+    depth = models.PositiveIntegerField(default=0, verbose_name='階層の深さ')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
 
@@ -24,7 +29,211 @@ class Page(models.Model):
         verbose_name = 'ページ'
         verbose_name_plural = 'ページ'
         ordering = ['order', 'created_at']
+        indexes = [
+            # 兄弟一覧（parent_id = ? / parent_id IS NULL）を表示順のまま索引から読む
+            models.Index(fields=['parent', 'order', 'created_at'], name='page_parent_order_idx'),
+            # 全ページ一覧（既定の並び順）をソートなしで読む
+            models.Index(fields=['order', 'created_at'], name='page_order_idx'),
+            # 最近更新されたページの一覧
+            models.Index(fields=['-updated_at'], name='page_updated_at_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """保存と同じトランザクション内で祖先パス（path/depth）を維持する"""
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if self.is_path_stale():
+                self.rebuild_path()
+
+    def is_path_stale(self) -> bool:
+        """pathが現在の親子関係と一致していないか（新規作成・親の変更時）を追加クエリなしで判定する"""
+        if self.parent_id:
+            return not self.path.endswith(f'/{self.parent_id}/{self.id}/')
+        return self.path != f'/{self.id}/'
+
+    def rebuild_path(self) -> None:
+        """親の現在のpathに合わせて、このページと子孫のpath/depthを更新する"""
+        if self.parent_id:
+            parent_path = Page.objects.values_list('path', flat=True).get(id=self.parent_id)
+        else:
+            parent_path = '/'
+        new_path = f'{parent_path}{self.id}/'
+        new_depth = new_path.count('/') - 2
+        
+        old_path = self.path
+        if old_path:
+            # サブツリー全体のプレフィックスを1回のUPDATEで置き換える
+            lower, upper = Page.subtree_path_range(old_path)
+            Page.objects.filter(path__gte=lower, path__lt=upper).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (new_depth - self.depth)
+            )
+        else:
+            Page.objects.filter(id=self.id).update(path=new_path, depth=new_depth)
+        
+        self.path = new_path
+        self.depth = new_depth
+
+    @staticmethod
+    def subtree_path_range(path: str) -> tuple:
+        """指定pathのサブツリー（自身を含む）をインデックス範囲検索するための [下限, 上限) を返す
+
+        pathは数字と "/" のみで構成され、"/" (0x2F) の次の文字は "0" (0x30) なので、
+        "/1/5/" で始まる文字列はすべて ["/1/5/", "/1/50") の範囲に収まる。
+        """
+        return path, path[:-1] + '0'
+
+    @staticmethod
+    def path_to_ids(path: str) -> list:
+        """pathをルートから自身までのIDのリストに変換する"""
+        return [int(part) for part in path.strip('/').split('/') if part]
+
+
+class PageFolder(models.Model):
+    """ページのメディアフォルダの所在（uploads/ からの相対パス）
+
+    フォルダ名は order とタイトルに依存するため、ディレクトリを走査せずに
+    ページIDから現在のフォルダを引けるよう、作成・リネーム・移動のたびに更新する。
+    """
+    page = models.OneToOneField(
+        Page,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='folder',
+        verbose_name='ページ'
+    )
+    relative_path = models.CharField(max_length=1000, db_index=True, verbose_name='フォルダの相対パス')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = 'ページフォルダ'
+        verbose_name_plural = 'ページフォルダ'
+
+    def __str__(self):
+        return self.relative_path
+
+
+class PageMedia(models.Model):
+    """ページコンテンツが参照しているメディアファイル（コンテンツ保存時に差分更新する）"""
+    KIND_CHOICES = [
+        ('image', '画像'),
+        ('video', '動画'),
+        ('file', 'ファイル'),
+    ]
+
+    page = models.ForeignKey(
+        Page,
+        on_delete=models.CASCADE,
+        related_name='media_refs',
+        verbose_name='ページ'
+    )
+    # MEDIA_ROOT からの相対パス（例: "uploads/10_page_1_タイトル/image.png"）
+    path = models.CharField(max_length=1000, db_index=True, verbose_name='メディアパス')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name='種別')
+    # path を含むページフォルダのページID（フォルダのリネーム・移動時に参照しているページを索引で逆引きする）
+    folder_page_id = models.BigIntegerField(null=True, blank=True, db_index=True, verbose_name='フォルダのページID')
+
+    class Meta:
+        verbose_name = 'ページのメディア参照'
+        verbose_name_plural = 'ページのメディア参照'
+        constraints = [
+            models.UniqueConstraint(fields=['page', 'path'], name='page_media_page_path_uniq'),
+        ]
+
+    def __str__(self):
+        return self.path
+
+
+class HtmlExportTask(models.Model):
+    """HTML書き出しの待ち行列（ページごとに1件）
+
+    保存のたびに要求日時を更新するため、同じページへの連続した要求は1回の書き出しにまとまる。
+    ページ削除時に行を消さなくてよいよう、ページは外部キーではなくIDで持つ
+    （削除済みのページの要求はワーカーが破棄する）。
+    """
+    page_id = models.BigIntegerField(unique=True, verbose_name='ページID')
+    requested_at = models.DateTimeField(verbose_name='要求日時')
+    next_attempt_at = models.DateTimeField(db_index=True, verbose_name='次回実行日時')
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='処理開始日時')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='失敗回数')
+    failed = models.BooleanField(default=False, verbose_name='失敗（再試行の上限超過）')
+    last_error = models.TextField(blank=True, default='', verbose_name='最後のエラー')
+
+    class Meta:
+        verbose_name = 'HTML書き出し待ち'
+        verbose_name_plural = 'HTML書き出し待ち'
+
+    def __str__(self):
+        return f'page {self.page_id}'
+
+
+class ExportedHtml(models.Model):
+    """書き出したHTMLファイルの内容のダイジェスト
+
+    同じ内容での書き直し（クラウドストレージの同期クライアントによる再アップロード）を
+    省くため、書き出し先のパスごとに最後に書き込んだ内容のSHA-256とサイズを記録する。
+    """
+    # MEDIA_ROOT からの相対パス（例: "uploads/10_page_1_タイトル/タイトル.html"）
+    path = models.CharField(max_length=1000, unique=True, verbose_name='HTMLファイルのパス')
+    digest = models.CharField(max_length=64, verbose_name='SHA-256')
+    size = models.PositiveBigIntegerField(verbose_name='サイズ')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = '書き出し済みHTML'
+        verbose_name_plural = '書き出し済みHTML'
+
+    def __str__(self):
+        return self.path
+
+
+class UploadSession(models.Model):
+    """分割・再開可能なアップロードのセッション
+
+    受信したチャンクは保存先フォルダの一時ファイル（.{upload_id}.part）に追記し、
+    ここには受信済みの位置だけを記録する。完了後も組み立てたファイルのパスを残し、
+    最後の応答を受け取れなかったクライアントが問い合わせられるようにする（古いものは定期的に削除する）。
+    """
+    upload_id = models.UUIDField(unique=True, verbose_name='アップロードID')
+    kind = models.CharField(max_length=20, verbose_name='種類')
+    # 保存先のページID（None なら temp_uploads/）。ページ削除時に行を消さなくてよいよう外部キーにしない
+    page_id = models.BigIntegerField(null=True, blank=True, verbose_name='ページID')
+    filename = models.CharField(max_length=255, verbose_name='保存するファイル名')
+    original_name = models.CharField(max_length=255, verbose_name='元のファイル名')
+    size = models.PositiveBigIntegerField(verbose_name='サイズ')
+    offset = models.PositiveBigIntegerField(default=0, verbose_name='受信済みのバイト数')
+    completed_path = models.CharField(max_length=1000, blank=True, default='', verbose_name='組み立て後のパス')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = '分割アップロード'
+        verbose_name_plural = '分割アップロード'
+
+    def __str__(self):
+        return f'{self.original_name} ({self.offset}/{self.size})'
+
+
+class TempUpload(models.Model):
+    """新規作成モーダルから一時フォルダ（temp_uploads/）にアップロードされたファイルの登録
+
+    ページの作成時にページフォルダへ移動したものは登録を消す。一時フォルダの掃除
+    （モーダルを閉じたとき・cleanup_temp_files）はフォルダを一覧せず、ここを検索して削除するファイルを決める。
+    """
+    media_path = models.CharField(max_length=500, unique=True, verbose_name='パス')
+    kind = models.CharField(max_length=20, verbose_name='種類')
+    original_name = models.CharField(max_length=255, verbose_name='元のファイル名')
+    size = models.PositiveBigIntegerField(verbose_name='サイズ')
+    # アップロードしたブラウザのセッションキー
+    uploader = models.CharField(max_length=40, blank=True, default='', db_index=True, verbose_name='アップロードしたセッション')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='アップロード日時')
+
+    class Meta:
+        verbose_name = '一時アップロード'
+        verbose_name_plural = '一時アップロード'
+
+    def __str__(self):
+        return self.media_path
@@ -1,5 +1,6 @@
 // ドラッグ&ドロップアップロード
 import { MAX_IMAGE_FILE_SIZE, MAX_VIDEO_FILE_SIZE } from './clipboard.js';
+import { uploadInChunks } from '../../shared/chunked-upload.js';
 
 let dropHandler = null; // 既存のハンドラーを保持
 
@@ -255,18 +256,9 @@ async function uploadVideo(file, pageId, csrfToken, editor, range) {
         return null;
     }
 
-    const formData = new FormData();
-    formData.append('video', file);
-    formData.append('page_id', pageId);
-
     try {
-        const response = await fetch('/api/upload-video/', {
-            method: 'POST',
-            headers: { 'X-CSRFToken': csrfToken },
-            body: formData
-        });
-
-        const data = await response.json();
+        // 大きな動画は分割して送り、接続が切れても続きから再開する
+        const data = await uploadInChunks(file, 'video', pageId, csrfToken);
 
         if (data.success) {
             const video = document.createElement('video');
@@ -1,5 +1,6 @@
 // 画像・動画のアップロードと挿入
 import { MAX_IMAGE_FILE_SIZE, MAX_VIDEO_FILE_SIZE } from './clipboard.js';
+import { uploadInChunks } from '../../shared/chunked-upload.js';
 
 export function createImageHandler(editor, currentPageId, isCreateModal) {
     return async () => {
@@ -106,20 +107,11 @@ export function createVideoHandler(editor, currentPageId, isCreateModal) {
                     return;
                 }
 
-                const formData = new FormData();
-                formData.append('video', file);
-                formData.append('page_id', pageId);
-
                 const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
 
                 try {
-                    const response = await fetch('/api/upload-video/', {
-                        method: 'POST',
-                        headers: { 'X-CSRFToken': csrfToken },
-                        body: formData
-                    });
-
-                    const data = await response.json();
+                    // 大きな動画は分割して送り、接続が切れても続きから再開する
+                    const data = await uploadInChunks(file, 'video', pageId, csrfToken);
 
                     if (data.success) {
                         insertVideo(editor, data.url);
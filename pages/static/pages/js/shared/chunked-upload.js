@@ -0,0 +1,94 @@
+// 分割・再開可能なアップロード（/api/uploads/）
+// 接続が切れた場合は、サーバーの受信済みの位置を問い合わせて続きから送り直す
+
+const MAX_RETRIES = 5;
+const RETRY_DELAY_MS = 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function fetchStatus(uploadUrl, csrfToken) {
+    const response = await fetch(uploadUrl, { headers: { 'X-CSRFToken': csrfToken } });
+    if (!response.ok) {
+        throw new Error('アップロードの状態を取得できませんでした');
+    }
+    return response.json();
+}
+
+/**
+ * ファイルを分割してアップロードする
+ * @param {File} file
+ * @param {string} kind - image/video/excel/zip/sketch/ico
+ * @param {string} pageId - ページID または 'temp'
+ * @param {string} csrfToken
+ * @param {(sent: number, total: number) => void} [onProgress]
+ * @returns {Promise<object>} 単一POSTのアップロードと同じ形式（success, url, filename）
+ */
+export async function uploadInChunks(file, kind, pageId, csrfToken, onProgress) {
+    const createResponse = await fetch('/api/uploads/', {
+        method: 'POST',
+        headers: { 'X-CSRFToken': csrfToken, 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            kind,
+            page_id: pageId,
+            filename: file.name,
+            size: file.size,
+            content_type: file.type,
+        }),
+    });
+    const session = await createResponse.json();
+    if (!createResponse.ok || !session.success) {
+        return session;
+    }
+
+    const uploadUrl = createResponse.headers.get('Location') || `/api/uploads/${session.upload_id}/`;
+    const chunkSize = parseInt(createResponse.headers.get('Upload-Chunk-Size'), 10) || 8 * 1024 * 1024;
+    let offset = session.offset;
+    let retries = 0;
+
+    while (true) {
+        let data;
+        try {
+            const end = Math.min(offset + chunkSize, file.size);
+            const response = await fetch(uploadUrl, {
+                method: 'PUT',
+                headers: {
+                    'X-CSRFToken': csrfToken,
+                    'Content-Type': 'application/octet-stream',
+                    'Upload-Offset': String(offset),
+                },
+                body: file.slice(offset, end),
+            });
+            data = await response.json();
+            if (response.status === 409) {
+                // サーバーの受信済みの位置から送り直す（受信し終えていれば結果を問い合わせる）
+                offset = data.offset;
+                if (offset >= file.size) {
+                    return fetchStatus(uploadUrl, csrfToken);
+                }
+                continue;
+            }
+            if (!response.ok) {
+                return data;
+            }
+        } catch (error) {
+            // 切断された場合は、受信済みの位置を問い合わせて続きから送る
+            if (++retries > MAX_RETRIES) {
+                throw error;
+            }
+            await sleep(RETRY_DELAY_MS * retries);
+            try {
+                data = await fetchStatus(uploadUrl, csrfToken);
+            } catch (statusError) {
+                continue;
+            }
+        }
+
+        offset = data.offset;
+        if (onProgress) {
+            onProgress(offset, file.size);
+        }
+        if (data.url) {
+            return data;
+        }
+    }
+}
@@ -1,5 +1,8 @@
 // 統合されたファイルドラッグ&ドロップアップロード機能
 // 画像、動画、エクセルファイルを1つのハンドラーで処理
+// 大きくなりうる動画・ZIP・Sketchは分割・再開可能なアップロード（/api/uploads/）で送る
+
+import { uploadInChunks } from '/static/pages/js/shared/chunked-upload.js';
 
 // エディタ要素に既にイベントリスナーが登録されているか確認するためのマップ
 const editorHandlersInitialized = new WeakMap();
@@ -125,20 +128,8 @@ export function addDragDropFileUpload(quill, isCreateModal, currentPageId) {
                     continue;
                 }
                 
-                const formData = new FormData();
-                formData.append('video', file);
-                formData.append('page_id', pageId);
-                
                 try {
-                    const response = await fetch('/api/upload-video/', {
-                        method: 'POST',
-                        headers: {
-                            'X-CSRFToken': csrfToken
-                        },
-                        body: formData
-                    });
-                    
-                    const data = await response.json();
+                    const data = await uploadInChunks(file, 'video', pageId, csrfToken);
                     
                     if (data.success) {
                         quill.insertEmbed(insertIndex, 'video', data.url);
@@ -211,20 +202,8 @@ export function addDragDropFileUpload(quill, isCreateModal, currentPageId) {
                         continue;
                     }
                     
-                    const formData = new FormData();
-                    formData.append('zip', file);
-                    formData.append('page_id', pageId);
-                    
                     try {
-                        const response = await fetch('/api/upload-zip/', {
-                            method: 'POST',
-                            headers: {
-                                'X-CSRFToken': csrfToken
-                            },
-                            body: formData
-                        });
-                        
-                        const data = await response.json();
+                        const data = await uploadInChunks(file, 'zip', pageId, csrfToken);
                         
                         if (data.success) {
                             const linkText = `📦 ${data.filename || file.name}`;
@@ -245,20 +224,8 @@ export function addDragDropFileUpload(quill, isCreateModal, currentPageId) {
                         continue;
                     }
                     
-                    const formData = new FormData();
-                    formData.append('sketch', file);
-                    formData.append('page_id', pageId);
-                    
                     try {
-                        const response = await fetch('/api/upload-sketch/', {
-                            method: 'POST',
-                            headers: {
-                                'X-CSRFToken': csrfToken
-                            },
-                            body: formData
-                        });
-                        
-                        const data = await response.json();
+                        const data = await uploadInChunks(file, 'sketch', pageId, csrfToken);
                         
                         if (data.success) {
                             const linkText = `🎨 ${data.filename || file.name}`;
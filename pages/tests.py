@@ -1,11 +1,16 @@
 """ページアプリケーションのテスト"""
 
+import os
 from django.test import TestCase, Client
 from django.urls import reverse
 from datetime import datetime
-from .models import Page
+from io import StringIO
+from .models import Page, PageFolder, PageMedia, HtmlExportTask, ExportedHtml
 from .application.dto import CreatePageDTO, UpdatePageDTO
-from .domain.page_aggregate import PageEntity
+from .domain.page_aggregate import PageEntity, PageOrdering, MediaReferenceExtractor
+from .infrastructure.repositories import PageRepository
+from .application.page_service.service import PageApplicationService
+from .application.page_service.media_service import MediaService
 
 
 class PageModelTest(TestCase):
@@ -319,6 +324,156 @@ class PageHierarchyTest(TestCase):
         
         self.child1.refresh_from_db()
         self.assertIsNone(self.child1.parent)
+    
+    def test_reorder_page(self):
+        """ページの並び替えテスト"""
+        response = self.client.post(
+            reverse('pages:page_reorder', args=[self.child2.id]),
+            {
+                'target_page_id': str(self.child1.id),
+                'position': 'before'
+            }
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        
+        self.child1.refresh_from_db()
+        self.child2.refresh_from_db()
+        self.assertLess(self.child2.order, self.child1.order)
+    
+    def test_reorder_page_writes_only_moved_page(self):
+        """並び替えで移動したページのorderだけが変わるテスト"""
+        child3 = Page.objects.create(title='子3', parent=self.root1, order=30)
+        response = self.client.post(
+            reverse('pages:page_reorder', args=[child3.id]),
+            {
+                'target_page_id': str(self.child2.id),
+                'position': 'before'
+            }
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.child1.refresh_from_db()
+        self.child2.refresh_from_db()
+        child3.refresh_from_db()
+        self.assertEqual((self.child1.order, self.child2.order), (10, 20))
+        self.assertEqual(child3.order, 15)
+
+    def test_reorder_page_writes_rewritten_urls_at_end_of_request(self):
+        """並び替えで書き換えたコンテンツのURLがリクエストの終わりに書き込まれるテスト"""
+        child3 = Page.objects.create(title='子3', parent=self.root1, order=30)
+        Page.objects.filter(id=child3.id).update(
+            content=f'<p><img src="/media/uploads/30_page_{child3.id}_子3/a.png"></p>'
+        )
+        response = self.client.post(
+            reverse('pages:page_reorder', args=[child3.id]),
+            {
+                'target_page_id': str(self.child2.id),
+                'position': 'before'
+            }
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        child3.refresh_from_db()
+        self.assertIn(f'/15_page_{child3.id}_子3/a.png', child3.content)
+
+    def test_reorder_page_regenerates_html_only_for_moved_page(self):
+        """並び替えでHTMLを生成し直すのはorderが変わったページだけであるテスト"""
+        from unittest import mock
+        from .application.page_service.html_generator import HtmlGenerator
+
+        child3 = Page.objects.create(title='子3', parent=self.root1, order=30)
+        with mock.patch.object(HtmlGenerator, 'save_html_to_folder') as save_html:
+            response = self.client.post(
+                reverse('pages:page_reorder', args=[child3.id]),
+                {
+                    'target_page_id': str(self.child2.id),
+                    'position': 'before'
+                }
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c.args[0].id for c in save_html.call_args_list], [child3.id])
+
+    def test_reorder_page_rebalances_when_gap_exhausted(self):
+        """中間値が取れない場合は兄弟全体を振り直すテスト"""
+        Page.objects.filter(id=self.child2.id).update(order=11)
+        child3 = Page.objects.create(title='子3', parent=self.root1, order=30)
+        response = self.client.post(
+            reverse('pages:page_reorder', args=[child3.id]),
+            {
+                'target_page_id': str(self.child2.id),
+                'position': 'before'
+            }
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        orders = list(
+            Page.objects.filter(parent=self.root1).order_by('order').values_list('id', 'order')
+        )
+        gap = PageOrdering.ORDER_GAP
+        self.assertEqual(orders, [(self.child1.id, gap), (child3.id, gap * 2), (self.child2.id, gap * 3)])
+
+    def test_reorder_to_head_does_not_go_negative(self):
+        """先頭への移動でorderが負にならず、0より下に余地がない場合は振り直すテスト"""
+        gap = PageOrdering.ORDER_GAP
+        self.assertEqual(PageOrdering.order_between(None, gap * 2), gap)
+        self.assertEqual(PageOrdering.order_between(None, 10), 5)
+        self.assertIsNone(PageOrdering.order_between(None, 0))
+
+        Page.objects.filter(id=self.child1.id).update(order=0)
+        response = self.client.post(
+            reverse('pages:page_reorder', args=[self.child2.id]),
+            {
+                'target_page_id': str(self.child1.id),
+                'position': 'before'
+            }
+        )
+
+        self.assertEqual(response.status_code, 200)
+        orders = list(
+            Page.objects.filter(parent=self.root1).order_by('order').values_list('id', 'order')
+        )
+        self.assertEqual(orders, [(self.child2.id, gap), (self.child1.id, gap * 2)])
+
+    def test_rebalance_page_order(self):
+        """兄弟ページのorderを等間隔に振り直すテスト"""
+        service = PageApplicationService(PageRepository())
+        self.assertEqual(service.rebalance_page_order(self.root1.id), 2)
+        
+        self.child1.refresh_from_db()
+        self.child2.refresh_from_db()
+        self.assertEqual(self.child1.order, PageOrdering.ORDER_GAP)
+        self.assertEqual(self.child2.order, PageOrdering.ORDER_GAP * 2)
+        self.assertEqual(service.rebalance_page_order(self.root1.id), 0)
+
+    def test_rebalance_command_targets_legacy_gaps(self):
+        """コマンドの既定で、ORDER_GAP 導入前の10刻みの兄弟が振り直しの対象になるテスト"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('rebalance_page_order', '--dry-run', stdout=out)
+        self.assertIn('(ルート)', out.getvalue())
+        self.assertIn(f'親ページ: {self.root1.id}', out.getvalue())
+
+        out = StringIO()
+        call_command('rebalance_page_order', '--dry-run', '--min-gap', '2', stdout=out)
+        self.assertIn('振り直しが必要な兄弟ページはありません', out.getvalue())
+
+    def test_move_page_under_own_descendant(self):
+        """自身の子孫の配下への移動が拒否されるテスト"""
+        response = self.client.post(
+            reverse('pages:page_move', args=[self.root1.id]),
+            {
+                'new_parent_id': str(self.grandchild.id)
+            }
+        )
+        
+        self.assertEqual(response.status_code, 400)
+        self.root1.refresh_from_db()
+        self.assertIsNone(self.root1.parent)
 
 
 class PageSearchTest(TestCase):
@@ -346,3 +501,1577 @@ class PageExportTest(TestCase):
             title='エクスポートテストページ',
             content='<p>テストコンテンツ</p>'
         )
+
+
+class PageRepositoryTest(TestCase):
+    """PageRepositoryのテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.repository = PageRepository()
+        self.root = Page.objects.create(title='ルート', order=10)
+        self.child_b = Page.objects.create(title='子B', parent=self.root, order=20)
+        self.child_a = Page.objects.create(title='子A', parent=self.root, order=10)
+        self.grandchild = Page.objects.create(title='孫', parent=self.child_b, order=10)
+        self.other = Page.objects.create(title='別ルート', order=20)
+    
+    def test_find_with_all_descendants_single_query(self):
+        """子孫を1クエリで読み込み、兄弟をorder順に並べるテスト"""
+        with self.assertNumQueries(1):
+            entity = self.repository.find_with_all_descendants(self.root.id)
+        
+        self.assertEqual([c.title for c in entity.children], ['子A', '子B'])
+        self.assertEqual([c.title for c in entity.children[1].children], ['孫'])
+        self.assertEqual(len(entity.get_all_descendants()), 3)
+    
+    def test_find_with_all_descendants_not_found(self):
+        """存在しないページの子孫取得テスト"""
+        self.assertIsNone(self.repository.find_with_all_descendants(99999))
+    
+    def test_delete_with_descendants(self):
+        """サブツリーを一括削除し、削除IDとエンティティマップを返すテスト"""
+        deleted_ids, entities_map = self.repository.delete_with_descendants(self.root.id)
+        
+        self.assertEqual(deleted_ids[0], self.root.id)
+        self.assertEqual(
+            set(deleted_ids),
+            {self.root.id, self.child_a.id, self.child_b.id, self.grandchild.id}
+        )
+        self.assertEqual(entities_map[self.grandchild.id].parent_id, self.child_b.id)
+        self.assertEqual(list(Page.objects.values_list('id', flat=True)), [self.other.id])
+    
+    def test_delete_with_descendants_not_found(self):
+        """存在しないページの一括削除テスト"""
+        self.assertEqual(self.repository.delete_with_descendants(99999), ([], {}))
+        self.assertEqual(Page.objects.count(), 5)
+    
+    def test_find_all_tree_nodes_skips_content(self):
+        """ツリー用取得でcontentカラムを読み込まないテスト"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as ctx:
+            nodes = self.repository.find_all_tree_nodes()
+        
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('"content"', ctx.captured_queries[0]['sql'])
+        self.assertEqual(len(nodes), 5)
+        self.assertTrue(all(node.content == '' for node in nodes))
+
+    def test_saving_tree_node_keeps_content(self):
+        """contentを読み込んでいないツリー用のエンティティを保存してもcontentが消えないテスト"""
+        Page.objects.filter(id=self.child_a.id).update(content='<p>本文</p>')
+        node = next(n for n in self.repository.find_all_tree_nodes() if n.id == self.child_a.id)
+        node.title = '子A（改）'
+
+        self.repository.save(node)
+        page = Page.objects.get(id=self.child_a.id)
+        self.assertEqual((page.title, page.content), ('子A（改）', '<p>本文</p>'))
+        self.assertEqual(self.repository.find_by_id(self.child_a.id).content, '<p>本文</p>')
+
+    def test_subtree_entities_share_identity_map(self):
+        """子孫の読み込みがアイデンティティマップの実体を返し、clearで変更検出用の値も破棄されるテスト"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        entity = self.repository.find_with_all_descendants(self.root.id)
+        child_b = entity.children[1]
+        with self.assertNumQueries(0):
+            self.assertIs(self.repository.find_by_id(self.child_b.id), child_b)
+
+        child_b.icon = '📁'
+        with CaptureQueriesContext(connection) as ctx:
+            self.repository.save(child_b)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"content"', updates[0])
+
+        self.repository.clear()
+        self.assertEqual(self.repository._snapshots, {})
+
+    def test_path_and_depth_maintained_on_create_and_move(self):
+        """作成・移動時に祖先パスと深さが維持されるテスト"""
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f'/{self.root.id}/{self.child_b.id}/{self.grandchild.id}/')
+        self.assertEqual(self.grandchild.depth, 2)
+        
+        # 子Bを別ルートの下へ移動すると、孫のパスも追従する
+        self.child_b.parent = self.other
+        self.child_b.save()
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f'/{self.other.id}/{self.child_b.id}/{self.grandchild.id}/')
+        self.assertEqual(self.grandchild.depth, 2)
+    
+    def test_find_ancestors(self):
+        """祖先をルートから順に取得するテスト"""
+        ancestors = self.repository.find_ancestors(self.grandchild.id)
+        self.assertEqual([a.id for a in ancestors], [self.root.id, self.child_b.id])
+        
+        with_self = self.repository.find_ancestors(self.grandchild.id, include_self=True)
+        self.assertEqual(with_self[-1].id, self.grandchild.id)
+    
+    def test_is_in_subtree(self):
+        """サブツリー所属判定のテスト"""
+        self.assertTrue(self.repository.is_in_subtree(self.grandchild.id, self.root.id))
+        self.assertTrue(self.repository.is_in_subtree(self.root.id, self.root.id))
+        self.assertFalse(self.repository.is_in_subtree(self.other.id, self.root.id))
+
+    
+    def test_identity_map_reuses_loaded_entities(self):
+        """同じリポジトリでの再取得がDBにアクセスしないテスト"""
+        entity = self.repository.find_by_id(self.child_a.id)
+        with self.assertNumQueries(0):
+            self.assertIs(self.repository.find_by_id(self.child_a.id), entity)
+        with self.assertNumQueries(1):
+            entities = self.repository.find_by_ids([self.child_a.id, self.child_b.id])
+        self.assertEqual({e.id for e in entities}, {self.child_a.id, self.child_b.id})
+    
+    def test_register_dirty_and_flush(self):
+        """変更済みエンティティが Unit of Work の終わりにまとめて書き込まれるテスト"""
+        from .infrastructure.unit_of_work import unit_of_work
+        
+        with unit_of_work():
+            entity_a = self.repository.find_by_id(self.child_a.id)
+            entity_b = self.repository.find_by_id(self.child_b.id)
+            entity_a.content = '<p>A</p>'
+            entity_b.content = '<p>B</p>'
+            self.repository.register_dirty(entity_a)
+            self.repository.register_dirty(entity_b)
+            
+            self.assertEqual(Page.objects.get(id=self.child_a.id).content, '')
+            self.assertIs(self.repository.find_by_id(self.child_a.id), entity_a)
+        
+        self.assertEqual(Page.objects.get(id=self.child_a.id).content, '<p>A</p>')
+        self.assertEqual(Page.objects.get(id=self.child_b.id).content, '<p>B</p>')
+        self.assertEqual(self.repository.flush(), [])
+    
+    def test_register_dirty_outside_unit_of_work_saves_immediately(self):
+        """Unit of Work の範囲外で登録した変更がその場で書き込まれるテスト"""
+        entity = self.repository.find_by_id(self.child_a.id)
+        entity.content = '<p>A</p>'
+        self.repository.register_dirty(entity)
+        
+        self.assertEqual(Page.objects.get(id=self.child_a.id).content, '<p>A</p>')
+        self.assertEqual(self.repository.flush(), [])
+    
+    def test_unit_of_work_discards_changes_on_error(self):
+        """例外で抜けた Unit of Work では変更を書き込まないテスト"""
+        from .infrastructure.unit_of_work import unit_of_work
+        
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                entity = self.repository.find_by_id(self.child_a.id)
+                entity.content = '<p>A</p>'
+                self.repository.register_dirty(entity)
+                raise RuntimeError
+        
+        self.assertEqual(Page.objects.get(id=self.child_a.id).content, '')
+    
+    def test_save_updates_only_changed_fields(self):
+        """変更したカラムだけをSELECTなしでUPDATEするテスト"""
+        Page.objects.filter(id=self.child_a.id).update(content='<p>本文</p>')
+        entity = self.repository.find_by_id(self.child_a.id)
+        entity.icon = '📁'
+        
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            self.repository.save(entity)
+        
+        statements = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse(any(sql.startswith('SELECT') for sql in statements))
+        updates = [sql for sql in statements if sql.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"icon"', updates[0])
+        self.assertNotIn('"content"', updates[0])
+        
+        page = Page.objects.get(id=self.child_a.id)
+        self.assertEqual(page.icon, '📁')
+        self.assertEqual(page.content, '<p>本文</p>')
+    
+    def test_save_without_changes_skips_database(self):
+        """変更のない保存ではDBにアクセスしないテスト"""
+        entity = self.repository.find_by_id(self.child_a.id)
+        with self.assertNumQueries(0):
+            self.repository.save(entity)
+            self.repository.bulk_update([entity])
+    
+    def test_save_parent_change_rebuilds_path(self):
+        """親の変更を保存すると祖先パスも更新されるテスト"""
+        entity = self.repository.find_by_id(self.child_b.id)
+        entity.parent_id = self.other.id
+        self.repository.save(entity)
+        
+        grandchild = Page.objects.get(id=self.grandchild.id)
+        self.assertEqual(
+            grandchild.path,
+            f'/{self.other.id}/{self.child_b.id}/{self.grandchild.id}/'
+        )
+
+
+class TempMediaRootMixin:
+    """MEDIA_ROOTを一時ディレクトリに差し替えるテスト用ミックスイン"""
+    
+    def use_temp_media_root(self, **extra_settings):
+        """MEDIA_ROOT（と追加の設定）を上書きし、uploads/ を作成する"""
+        import tempfile
+        from pathlib import Path
+        from django.test import override_settings
+        
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=temp_dir.name, **extra_settings)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.uploads_dir = Path(temp_dir.name) / 'uploads'
+        self.uploads_dir.mkdir()
+
+
+class PageFolderManifestTest(TempMediaRootMixin, TestCase):
+    """ページフォルダの対応表（PageFolder）のテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root()
+        self.root = Page.objects.create(title='ルート', order=10)
+        self.child = Page.objects.create(title='子', parent=self.root, order=10)
+        
+        self.root_folder = self.uploads_dir / f'10_page_{self.root.id}_ルート'
+        self.child_folder = self.root_folder / f'10_page_{self.child.id}_子'
+        self.child_folder.mkdir(parents=True)
+        
+        self.repository = PageRepository()
+        self.media_service = MediaService(self.repository)
+    
+    def test_lookup_uses_manifest_without_scanning(self):
+        """対応表に登録済みのフォルダはディレクトリを走査せずに見つかるテスト"""
+        from pathlib import Path
+        from unittest import mock
+        
+        self.media_service._record_page_folder(self.root.id, self.root_folder)
+        self.media_service._record_page_folder(self.child.id, self.child_folder)
+        entity = self.repository.find_by_id(self.child.id)
+        
+        with mock.patch.object(Path, 'iterdir', side_effect=AssertionError('iterdir called')):
+            folder = self.media_service._find_existing_page_folder(entity)
+        self.assertEqual(folder, self.child_folder)
+    
+    def test_scan_fallback_repairs_manifest(self):
+        """対応表にない場合は走査で見つけて対応表を修復するテスト"""
+        entity = self.repository.find_by_id(self.child.id)
+        
+        self.assertEqual(self.media_service._find_existing_page_folder(entity), self.child_folder)
+        self.assertEqual(
+            PageFolder.objects.get(page_id=self.child.id).relative_path,
+            f'10_page_{self.root.id}_ルート/10_page_{self.child.id}_子'
+        )
+    
+    def test_folder_move_updates_descendants(self):
+        """フォルダのリネームで配下のページの登録も更新されるテスト"""
+        self.media_service._record_page_folder(self.root.id, self.root_folder)
+        self.media_service._record_page_folder(self.child.id, self.child_folder)
+        
+        renamed = self.uploads_dir / f'20_page_{self.root.id}_ルート'
+        self.media_service._record_folder_moved(self.root_folder, renamed)
+        
+        self.assertEqual(
+            PageFolder.objects.get(page_id=self.child.id).relative_path,
+            f'20_page_{self.root.id}_ルート/10_page_{self.child.id}_子'
+        )
+    
+    def test_stale_entry_is_ignored(self):
+        """タイトル変更前のフォルダを指す登録は使われないテスト"""
+        self.media_service._record_page_folder(self.child.id, self.child_folder)
+        Page.objects.filter(id=self.child.id).update(title='新しい子')
+        entity = PageRepository().find_by_id(self.child.id)
+        
+        self.assertIsNone(self.media_service._find_existing_page_folder(entity))
+    
+    def test_migration_backfills_existing_folders(self):
+        """マイグレーションで既存のフォルダが対応表に登録されるテスト"""
+        from importlib import import_module
+        from django.apps import apps
+
+        migration = import_module('pages.migrations.0013_backfill_page_folders')
+        orphan = Page.objects.create(title='フォルダなし', order=20)
+        (self.uploads_dir / f'10_page_{orphan.id}_古いタイトル').mkdir()
+
+        migration.backfill_page_folders(apps, None)
+
+        self.assertEqual(dict(PageFolder.objects.values_list('page_id', 'relative_path')), {
+            self.root.id: f'10_page_{self.root.id}_ルート',
+            self.child.id: f'10_page_{self.root.id}_ルート/10_page_{self.child.id}_子',
+        })
+        # 登録済みの行はそのまま（2回目は何も追加しない）
+        migration.backfill_page_folders(apps, None)
+        self.assertEqual(PageFolder.objects.count(), 2)
+
+    def test_delete_removes_manifest_entries(self):
+        """ページ削除で対応表の行も削除されるテスト"""
+        self.media_service._record_page_folder(self.root.id, self.root_folder)
+        self.media_service._record_page_folder(self.child.id, self.child_folder)
+        
+        self.repository.delete_with_descendants(self.root.id)
+        self.assertFalse(PageFolder.objects.exists())
+
+    def test_delete_page_finds_folder_without_scanning(self):
+        """ページ削除時もフォルダを（削除前に読み込んだ）対応表から見つけ、走査しないテスト"""
+        from pathlib import Path
+        from unittest import mock
+        from .application.page_service.page_delete_service import PageDeleteService
+
+        self.media_service._record_page_folder(self.root.id, self.root_folder)
+        self.media_service._record_page_folder(self.child.id, self.child_folder)
+
+        with mock.patch.object(Path, 'iterdir', side_effect=AssertionError('iterdir called')), \
+                mock.patch.object(Path, 'rglob', side_effect=AssertionError('rglob called')):
+            self.assertTrue(PageDeleteService(self.repository, self.media_service).delete_page(self.root.id))
+        self.assertFalse(self.root_folder.exists())
+
+    def _track_iterdir(self):
+        """Path.iterdir で一覧を取得したフォルダを記録する"""
+        from pathlib import Path
+        from unittest import mock
+
+        listed = []
+        original_iterdir = Path.iterdir
+
+        def tracking_iterdir(path):
+            listed.append(path)
+            return original_iterdir(path)
+
+        patcher = mock.patch.object(Path, 'iterdir', tracking_iterdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return listed
+
+    def test_move_to_new_parent_uses_manifest(self):
+        """親の変更時に移動前のフォルダを対応表から特定し、古い親フォルダを走査しないテスト"""
+        from .application.page_service.page_folder_service import PageFolderService
+
+        other = Page.objects.create(title='別', order=20)
+        other_folder = self.uploads_dir / f'20_page_{other.id}_別'
+        other_folder.mkdir()
+        self.media_service._record_page_folder(self.root.id, self.root_folder)
+        self.media_service._record_page_folder(self.child.id, self.child_folder)
+        self.media_service._record_page_folder(other.id, other_folder)
+        (self.child_folder / 'a.png').write_bytes(b'png')
+        Page.objects.filter(id=self.child.id).update(parent=other)
+        entity = PageRepository().find_by_id(self.child.id)
+
+        listed = self._track_iterdir()
+        PageFolderService(self.repository, self.media_service).move_folder_to_new_parent(entity, self.root.id)
+
+        self.assertNotIn(self.root_folder, listed)
+        self.assertNotIn(self.uploads_dir, listed)
+        self.assertTrue((other_folder / f'10_page_{self.child.id}_子' / 'a.png').exists())
+        self.assertEqual(
+            PageFolder.objects.get(page_id=self.child.id).relative_path,
+            f'20_page_{other.id}_別/10_page_{self.child.id}_子'
+        )
+
+    def test_orphan_cleanup_scans_only_on_manifest_miss(self):
+        """子ページのフォルダがすべて対応表にあれば親フォルダを一覧せず、登録がない場合だけ走査するテスト"""
+        from .application.page_service.page_folder_service import PageFolderService
+
+        folder_service = PageFolderService(self.repository, self.media_service)
+        orphan = self.root_folder / '30_page_999999_削除済み'
+        orphan.mkdir()
+        listed = self._track_iterdir()
+
+        self.media_service._record_page_folder(self.child.id, self.child_folder)
+        folder_service.cleanup_orphaned_folders_in_parent(self.root.id)
+        self.assertNotIn(self.root_folder, listed)
+
+        PageFolder.objects.filter(page_id=self.child.id).delete()
+        folder_service.cleanup_orphaned_folders_in_parent(self.root.id)
+        self.assertIn(self.root_folder, listed)
+        self.assertFalse(orphan.exists())
+        self.assertTrue(self.child_folder.exists())
+
+
+class PageIdLayoutTest(TempMediaRootMixin, TestCase):
+    """ページIDで固定したメディアフォルダ配置（PAGE_MEDIA_LAYOUT='id'）のテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root(PAGE_MEDIA_LAYOUT='id', HTML_EXPORT_MODE='sync')
+        self.client = Client(enforce_csrf_checks=False)
+    
+    def _create_page(self, title, parent_id=''):
+        response = self.client.post(
+            reverse('pages:page_create'),
+            {'title': title, 'content': '<p>本文</p>', 'parent_id': parent_id},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 200)
+        return Page.objects.get(title=title)
+    
+    def test_folder_is_keyed_by_page_id(self):
+        """フォルダがページIDで作成され、タイトル変更でも変わらないテスト"""
+        root = self._create_page('ルート')
+        child = self._create_page('子', parent_id=str(root.id))
+        child_folder = self.uploads_dir / 'pages' / str(child.id)
+        self.assertTrue((child_folder / 'index.html').exists())
+        
+        response = self.client.post(
+            reverse('pages:page_update', args=[child.id]),
+            {'title': '新しい子', 'content': '<p>本文</p>'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('新しい子', (child_folder / 'index.html').read_text(encoding='utf-8'))
+        self.assertEqual(sorted(p.name for p in (self.uploads_dir / 'pages').iterdir()), sorted([str(root.id), str(child.id)]))
+    
+    def test_reorder_does_not_rewrite_content(self):
+        """並び替えでフォルダもコンテンツのURLも変わらないテスト"""
+        first = self._create_page('1番目')
+        second = self._create_page('2番目')
+        media_url = f'/media/uploads/pages/{second.id}/image.png'
+        Page.objects.filter(id=second.id).update(content=f'<p><img src="{media_url}"></p>')
+        
+        response = self.client.post(
+            reverse('pages:page_reorder', args=[second.id]),
+            {'target_page_id': str(first.id), 'position': 'before'}
+        )
+        self.assertEqual(response.status_code, 200)
+        
+        second.refresh_from_db()
+        self.assertIn(media_url, second.content)
+        self.assertTrue((self.uploads_dir / 'pages' / str(second.id)).is_dir())
+    
+    def test_export_media_tree(self):
+        """IDレイアウトのフォルダを階層構造で書き出すテスト"""
+        import tempfile
+        from pathlib import Path
+        from django.core.management import call_command
+        
+        root = self._create_page('ルート')
+        child = self._create_page('子', parent_id=str(root.id))
+        (self.uploads_dir / 'pages' / str(child.id) / 'image.png').write_bytes(b'png')
+        
+        with tempfile.TemporaryDirectory() as destination:
+            call_command('export_media_tree', destination, stdout=StringIO())
+            root.refresh_from_db()
+            child.refresh_from_db()
+            child_folder = Path(destination) / f'{root.order}_page_{root.id}_ルート' / f'{child.order}_page_{child.id}_子'
+            self.assertEqual((child_folder / 'image.png').read_bytes(), b'png')
+            self.assertTrue((child_folder / '子.html').exists())
+
+
+class MediaBlobDedupTest(TempMediaRootMixin, TestCase):
+    """内容アドレス方式のメディア保存（MEDIA_DEDUP）のテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root(
+            PAGE_MEDIA_LAYOUT='id', HTML_EXPORT_MODE='sync', MEDIA_DEDUP=True, MEDIA_DEDUP_GRACE_SECONDS=0
+        )
+        self.client = Client(enforce_csrf_checks=False)
+    
+    def _upload(self, data, name='shot.png'):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        
+        response = self.client.post(
+            reverse('pages:upload_image'),
+            {'image': SimpleUploadedFile(name, data, content_type='image/png'), 'page_id': 'temp'}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['url']
+    
+    def _create_page(self, title, content):
+        response = self.client.post(
+            reverse('pages:page_create'),
+            {'title': title, 'content': content, 'parent_id': ''},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 200)
+        return Page.objects.get(title=title)
+    
+    def test_same_content_stored_once(self):
+        """同じ内容のアップロードが1つの blob にまとまるテスト"""
+        first = self._upload(b'screenshot', 'a.png')
+        second = self._upload(b'screenshot', 'b.PNG')
+        other = self._upload(b'other', 'a.png')
+        
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith('/media/uploads/blobs/'))
+        self.assertEqual(len(list((self.uploads_dir / 'blobs').glob('*/*'))), 2)
+    
+    def test_blob_freed_with_last_reference(self):
+        """最後に参照していたページが外れた・削除された時点で blob が削除されるテスト"""
+        url = self._upload(b'screenshot')
+        blob_path = self.uploads_dir.parent / url[len('/media/'):]
+        first = self._create_page('1枚目', f'<img src="{url}">')
+        second = self._create_page('2枚目', f'<img src="{url}">')
+        
+        # 1つ目のページから外しても、2つ目のページが参照している間は残る
+        response = self.client.post(
+            reverse('pages:page_update', args=[first.id]),
+            {'title': '1枚目', 'content': '<p>画像なし</p>'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(blob_path.is_file())
+        
+        self.client.post(reverse('pages:page_delete', args=[second.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertFalse(blob_path.exists())
+    
+    def test_gc_respects_grace_period(self):
+        """参照されないまま猶予期間を過ぎた blob だけを削除するテスト"""
+        from django.core.management import call_command
+        from django.test import override_settings
+        
+        url = self._upload(b'unsaved')
+        blob_path = self.uploads_dir.parent / url[len('/media/'):]
+        
+        with override_settings(MEDIA_DEDUP_GRACE_SECONDS=3600):
+            call_command('gc_media_blobs', stdout=StringIO())
+        self.assertTrue(blob_path.is_file())
+        
+        out = StringIO()
+        call_command('gc_media_blobs', stdout=out)
+        self.assertFalse(blob_path.exists())
+        self.assertIn('1件', out.getvalue())
+
+
+class ChunkedUploadTest(TempMediaRootMixin, TestCase):
+    """分割・再開可能なアップロードのテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        import json
+        
+        self.use_temp_media_root(HTML_EXPORT_MODE='sync')
+        self.client = Client(enforce_csrf_checks=False)
+        response = self.client.post(
+            reverse('pages:upload_session_create'),
+            json.dumps({'kind': 'video', 'page_id': 'temp', 'filename': 'clip.mp4', 'size': 10, 'content_type': 'video/mp4'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.upload_url = response['Location']
+        self.upload_id = response.json()['upload_id']
+    
+    def _put(self, data, offset):
+        return self.client.put(self.upload_url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+    
+    def test_resume_and_assemble(self):
+        """切断されたチャンクの続きから再開し、最後のチャンクで組み立てるテスト"""
+        import io
+        from .application.page_service.chunked_upload_service import ChunkedUploadService
+        
+        # 4バイトのチャンクの途中（2バイト）で切断された場合も、受信した分だけ位置が進む
+        upload_service = ChunkedUploadService()
+        session = upload_service.append(upload_service.find(self.upload_id), 0, io.BytesIO(b'01'), 4)
+        self.assertEqual(session.offset, 2)
+        
+        response = self._put(b'0123', 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 2)
+        
+        self.assertEqual(self._put(b'2345', 2).json()['offset'], 6)
+        data = self._put(b'6789', 6).json()
+        self.assertTrue(data['url'].endswith('.mp4'))
+        self.assertIn('/media/uploads/temp_uploads/', data['url'])
+        
+        saved = self.uploads_dir / 'temp_uploads' / data['url'].split('/')[-1]
+        self.assertEqual(saved.read_bytes(), b'0123456789')
+        self.assertEqual(list((self.uploads_dir / 'temp_uploads').glob('*.part')), [])
+        # 最後の応答を受け取れなかった場合も、状態の問い合わせでURLを得られる
+        self.assertEqual(self.client.get(self.upload_url).json()['url'], data['url'])
+
+    def test_attachment_keeps_original_name(self):
+        """ZIP・Sketch も分割アップロードで送れ、元のファイル名で保存されるテスト"""
+        import json
+
+        for kind, filename in (('zip', 'assets.zip'), ('sketch', 'design.sketch')):
+            response = self.client.post(
+                reverse('pages:upload_session_create'),
+                json.dumps({'kind': kind, 'page_id': 'temp', 'filename': filename, 'size': 4, 'content_type': ''}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            data = self.client.put(
+                response['Location'], b'data', content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0'
+            ).json()
+            self.assertEqual(data['filename'], filename)
+            self.assertTrue(data['url'].endswith(f'/media/uploads/temp_uploads/{filename}'))
+            self.assertEqual((self.uploads_dir / 'temp_uploads' / filename).read_bytes(), b'data')
+
+    def test_disconnect_keeps_original_error(self):
+        """本文の読み込み中に切断された場合、元の例外を投げ、受信した分だけ位置を進めるテスト"""
+        import io
+        from .application.page_service.chunked_upload_service import ChunkedUploadService
+        
+        class DisconnectingStream(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell() >= 3:
+                    raise ConnectionResetError('切断')
+                return super().read(min(size, 3))
+        
+        upload_service = ChunkedUploadService()
+        with self.assertRaises(ConnectionResetError):
+            upload_service.append(upload_service.find(self.upload_id), 0, DisconnectingStream(b'012345'), 6)
+        self.assertEqual(upload_service.find(self.upload_id).offset, 3)
+
+    def test_chunk_put_is_not_buffered_by_middleware(self):
+        """チャンクのPUTがミドルウェアで request.body に読み込まれず、ビューにストリームで渡るテスト"""
+        from unittest import mock
+        from django.http import HttpRequest
+
+        with mock.patch.object(HttpRequest, 'body', new_callable=mock.PropertyMock, return_value=b'') as body:
+            response = self._put(b'0123', 0)
+        body.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offset'], 4)
+
+    def test_part_file_lifecycle(self):
+        """アップロード中の一時ファイルは一時フォルダの掃除で残り、期限切れで削除されるテスト"""
+        import json
+        from django.core.management import call_command
+        from django.test import override_settings
+        
+        part_path = self.uploads_dir / 'temp_uploads' / f'.{self.upload_id}.part'
+        self._put(b'0123', 0)
+        
+        response = self.client.post(
+            reverse('pages:cleanup_temp_images'), json.dumps({'content': ''}), content_type='application/json'
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(part_path.read_bytes(), b'0123')
+        
+        with override_settings(UPLOAD_SESSION_EXPIRY_HOURS=0):
+            call_command('cleanup_temp_files', stdout=StringIO())
+        self.assertFalse(part_path.exists())
+        self.assertEqual(self.client.get(self.upload_url).status_code, 404)
+
+
+class StagedUploadTest(TempMediaRootMixin, TestCase):
+    """MEDIA_ROOT 配下の受け取り用フォルダ（MediaStagingUploadHandler）のテスト"""
+
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root(HTML_EXPORT_MODE='sync')
+        self.client = Client(enforce_csrf_checks=False)
+        self.staging_dir = self.uploads_dir / '.staging'
+
+    def _upload(self, data, name='shot.png'):
+        """アップロードし、(URL, 受け取り用フォルダに書き込まれたファイルの inode) を返す"""
+        import os
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .infrastructure.upload_handlers import MediaStagingUploadHandler
+
+        staged_inodes = []
+        file_complete = MediaStagingUploadHandler.file_complete
+
+        def record_inode(handler, file_size):
+            staged_inodes.append(os.stat(handler.file.temporary_file_path()).st_ino)
+            return file_complete(handler, file_size)
+
+        with mock.patch.object(MediaStagingUploadHandler, 'file_complete', record_inode):
+            response = self.client.post(
+                reverse('pages:upload_image'),
+                {'image': SimpleUploadedFile(name, data, content_type='image/png'), 'page_id': 'temp'}
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['url'], staged_inodes[0]
+
+    def test_saved_by_rename(self):
+        """受け取ったファイルがコピーされず、そのまま保存先に移動されるテスト"""
+        url, staged_inode = self._upload(b'screenshot')
+        saved = self.uploads_dir.parent / url[len('/media/'):]
+
+        self.assertIn('/media/uploads/temp_uploads/', url)
+        self.assertEqual(saved.read_bytes(), b'screenshot')
+        self.assertEqual(saved.stat().st_ino, staged_inode)
+        self.assertEqual(list(self.staging_dir.iterdir()), [])
+
+    def test_handler_installed_only_on_upload_views(self):
+        """受け取り用フォルダのハンドラーはアップロードビューだけで使い、CSRF の検証も残るテスト"""
+        from django.conf import settings
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        self.assertNotIn(
+            'pages.infrastructure.upload_handlers.MediaStagingUploadHandler', settings.FILE_UPLOAD_HANDLERS
+        )
+        response = Client(enforce_csrf_checks=True).post(
+            reverse('pages:upload_image'),
+            {'image': SimpleUploadedFile('shot.png', b'png', content_type='image/png'), 'page_id': 'temp'}
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_blob_uses_staged_digest(self):
+        """MEDIA_DEDUP では受け取り時のハッシュで blob に移動し、中断された受け取りは期限で削除されるテスト"""
+        import hashlib
+        import os
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        with override_settings(MEDIA_DEDUP=True):
+            url, staged_inode = self._upload(b'screenshot')
+        blob_path = self.uploads_dir.parent / url[len('/media/'):]
+        self.assertEqual(blob_path.name, hashlib.sha256(b'screenshot').hexdigest() + '.png')
+        self.assertEqual(blob_path.stat().st_ino, staged_inode)
+
+        stale = self.staging_dir / '.upload-interrupted.upload.png'
+        stale.write_bytes(b'partial')
+        os.utime(stale, (0, 0))
+        with override_settings(UPLOAD_SESSION_EXPIRY_HOURS=1):
+            call_command('cleanup_temp_files', stdout=StringIO())
+        self.assertFalse(stale.exists())
+
+
+class UploadNameAllocatorTest(TempMediaRootMixin, TestCase):
+    """元のファイル名で保存するアップロードのファイル名確保（UploadNameAllocator）のテスト"""
+
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root(HTML_EXPORT_MODE='sync')
+        self.client = Client(enforce_csrf_checks=False)
+
+    def _upload_excel(self, data):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        response = self.client.post(
+            reverse('pages:upload_excel'),
+            {'excel': SimpleUploadedFile('報告.xlsx', data, content_type='application/vnd.ms-excel'), 'page_id': 'temp'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['filename'], '報告.xlsx')
+        return response.json()['url'].split('/')[-1]
+
+    def test_numbered_after_highest_existing(self):
+        """同じ名前は番号付きで保存し、番号は使われている最大値の次から振るテスト"""
+        import urllib.parse
+
+        names = [urllib.parse.unquote(self._upload_excel(data)) for data in (b'1', b'2')]
+        self.assertEqual(names, ['報告.xlsx', '報告_1.xlsx'])
+
+        (self.uploads_dir / 'temp_uploads' / '報告_7.xlsx').write_bytes(b'old')
+        self.assertEqual(urllib.parse.unquote(self._upload_excel(b'3')), '報告_8.xlsx')
+        self.assertEqual((self.uploads_dir / 'temp_uploads' / '報告_8.xlsx').read_bytes(), b'3')
+
+    def test_concurrent_reservations_are_unique(self):
+        """同じファイル名を同時に確保しても、すべて異なる名前になるテスト"""
+        from concurrent.futures import ThreadPoolExecutor
+        from .application.page_service.upload_name_allocator import UploadNameAllocator
+
+        folder = self.uploads_dir / 'temp_uploads'
+        allocator = UploadNameAllocator()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            paths = list(executor.map(lambda _: allocator.reserve(folder, 'a.zip'), range(32)))
+
+        self.assertEqual(len(set(paths)), 32)
+        self.assertEqual(len(list(folder.iterdir())), 32)
+
+
+class TempUploadRegistryTest(TempMediaRootMixin, TestCase):
+    """一時アップロードの登録（TempUpload）による一時フォルダの掃除のテスト"""
+
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root(HTML_EXPORT_MODE='sync')
+        self.client = Client(enforce_csrf_checks=False)
+
+    def _upload(self, client, data):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        response = client.post(
+            reverse('pages:upload_image'),
+            {'image': SimpleUploadedFile('shot.png', data, content_type='image/png'), 'page_id': 'temp'}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['url']
+
+    def _path(self, url):
+        return self.uploads_dir.parent / url[len('/media/'):]
+
+    def test_cleanup_only_own_unused_uploads(self):
+        """モーダルを閉じたときは、同じセッションからの使われていないアップロードだけを削除するテスト"""
+        import json
+        from .models import TempUpload
+
+        used = self._upload(self.client, b'used')
+        unused = self._upload(self.client, b'unused')
+        other_client = Client(enforce_csrf_checks=False)
+        others = self._upload(other_client, b'others')
+        self.assertEqual(TempUpload.objects.count(), 3)
+
+        response = self.client.post(
+            reverse('pages:cleanup_temp_images'),
+            json.dumps({'content': f'<p><img src="{used}"></p>'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.json()['deleted_count'], 1)
+        self.assertTrue(self._path(used).is_file())
+        self.assertFalse(self._path(unused).exists())
+        self.assertTrue(self._path(others).is_file())
+        self.assertEqual(TempUpload.objects.count(), 2)
+
+    def test_registry_follows_page_creation(self):
+        """ページに移動したファイルは登録から外れ、残った登録は cleanup_temp_files で削除されるテスト"""
+        from django.core.management import call_command
+        from .models import TempUpload
+
+        used = self._upload(self.client, b'used')
+        abandoned = self._upload(self.client, b'abandoned')
+        response = self.client.post(
+            reverse('pages:page_create'),
+            {'title': '新規', 'content': f'<p><img src="{used}"></p>', 'parent_id': ''},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self._path(used).exists())
+        self.assertEqual(list(TempUpload.objects.values_list('media_path', flat=True)), [abandoned[len('/media/'):]])
+
+        call_command('cleanup_temp_files', '--all', stdout=StringIO())
+        self.assertFalse(self._path(abandoned).exists())
+        self.assertFalse(TempUpload.objects.exists())
+
+
+class MediaServingTest(TempMediaRootMixin, TestCase):
+    """/media/uploads/ の配信ビュー（serve_media）のテスト"""
+
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root()
+        self.client = Client()
+        (self.uploads_dir / 'page').mkdir()
+        (self.uploads_dir / 'page' / 'clip.mp4').write_bytes(b'0123456789')
+        self.url = '/media/uploads/page/clip.mp4'
+
+    def test_conditional_get(self):
+        """ETag・Last-Modified を返し、If-None-Match に 304 で応答するテスト"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # 受け取り中の一時ファイル・フォルダの外は配信しない
+        (self.uploads_dir / '.staging').mkdir()
+        (self.uploads_dir / '.staging' / '.upload-x.upload.mp4').write_bytes(b'partial')
+        self.assertEqual(self.client.get('/media/uploads/.staging/.upload-x.upload.mp4').status_code, 404)
+        self.assertEqual(self.client.get('/media/uploads/../db.sqlite3').status_code, 404)
+
+    def test_byte_ranges(self):
+        """Range に 206 で応答し、範囲外は 416、If-Range が一致しなければ全体を返すテスト"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        # 空のファイルには末尾からの範囲も満たせない
+        (self.uploads_dir / 'page' / 'empty.mp4').write_bytes(b'')
+        response = self.client.get('/media/uploads/page/empty.mp4', HTTP_RANGE='bytes=-3')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_blob_cache_and_sendfile(self):
+        """blob は長期間キャッシュさせ、MEDIA_SENDFILE では送信を前段のサーバーに任せるテスト"""
+        from django.test import override_settings
+
+        digest = 'ab' + '0' * 62
+        (self.uploads_dir / 'blobs' / 'ab').mkdir(parents=True)
+        (self.uploads_dir / 'blobs' / 'ab' / f'{digest}.png').write_bytes(b'png')
+
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(f'/media/uploads/blobs/ab/{digest}.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{digest}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/uploads/blobs/ab/{digest}.png')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, b'')
+
+
+class PageMediaIndexTest(TestCase):
+    """メディア参照表（PageMedia）のテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.repository = PageRepository()
+        self.root = self.repository.save(PageEntity(
+            id=None, title='ルート', parent_id=None,
+            content='<p><img src="/media/uploads/root/a.png"></p>',
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.child = self.repository.save(PageEntity(
+            id=None, title='子', parent_id=self.root.id,
+            content='<video src="http://localhost:8000/media/uploads/child/b%20c.mp4"></video>',
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+    
+    def test_extract_paths(self):
+        """参照の抽出でURLを正規化し、種別を判定するテスト"""
+        content = (
+            '<img src="/media/uploads/x/a.png?v=1">'
+            '<a href="https://example.com/media/uploads/x/doc.pdf">doc</a>'
+            '<a href="/other/page">link</a>'
+        )
+        self.assertEqual(
+            MediaReferenceExtractor.extract_paths(content),
+            {'uploads/x/a.png': 'image', 'uploads/x/doc.pdf': 'file'}
+        )
+    
+    def test_references_registered_on_save(self):
+        """保存時に参照が登録されるテスト"""
+        self.assertEqual(
+            set(PageMedia.objects.values_list('page_id', 'path', 'kind')),
+            {
+                (self.root.id, 'uploads/root/a.png', 'image'),
+                (self.child.id, 'uploads/child/b c.mp4', 'video'),
+            }
+        )
+    
+    def test_references_diffed_on_content_change(self):
+        """コンテンツの変更で差分だけが反映されるテスト"""
+        entity = self.repository.find_by_id(self.root.id)
+        entity.content = '<img src="/media/uploads/root/new.png"><img src="/media/uploads/child/b%20c.mp4">'
+        self.repository.save(entity)
+        
+        self.assertEqual(
+            set(PageMedia.objects.filter(page_id=self.root.id).values_list('path', flat=True)),
+            {'uploads/root/new.png', 'uploads/child/b c.mp4'}
+        )
+        self.assertEqual(
+            sorted(self.repository.find_page_ids_referencing_media('uploads/child/b c.mp4')),
+            sorted([self.root.id, self.child.id])
+        )
+    
+    def test_find_media_paths(self):
+        """プレフィックス・サブツリー単位の参照検索のテスト"""
+        self.assertEqual(
+            self.repository.find_media_paths_with_prefix('uploads/child/'),
+            {'uploads/child/b c.mp4'}
+        )
+        self.assertEqual(
+            self.repository.find_media_paths_in_subtree(self.root.id),
+            {'uploads/root/a.png', 'uploads/child/b c.mp4'}
+        )
+        self.assertEqual(
+            self.repository.find_media_paths_in_subtree(self.child.id),
+            {'uploads/child/b c.mp4'}
+        )
+    
+    def test_references_deleted_with_pages(self):
+        """ページ削除で参照も削除されるテスト"""
+        self.repository.delete_with_descendants(self.root.id)
+        self.assertFalse(PageMedia.objects.exists())
+
+
+class ContentScannerTest(TempMediaRootMixin, TestCase):
+    """コンテンツのURL属性の1回走査（ContentScanner）のテスト"""
+    
+    def test_scan_attributes(self):
+        """引用符・文字参照・絶対URL・iframe・コメントの扱いと位置のテスト"""
+        from .domain.page_aggregate import ContentScanner
+        
+        content = (
+            "<p><img alt='x' src='/media/uploads/a.png'></p>\n"
+            '<IMG SRC=/media/uploads/b.png>'
+            '<iframe class="ql-video" src="http://localhost:8000/media/uploads/c.mp4?t=1"></iframe>'
+            '<a href="/media/uploads/d.pdf?x=1&amp;y=2">d</a>'
+            '<!-- <img src="/media/uploads/commented.png"> -->'
+            '<a href="/media/other.txt">o</a>'
+        )
+        references = ContentScanner.scan(content).references
+        self.assertEqual(
+            [(r.tag, r.url, r.media_url, r.kind) for r in references],
+            [
+                ('img', '/media/uploads/a.png', '/media/uploads/a.png', 'image'),
+                ('img', '/media/uploads/b.png', '/media/uploads/b.png', 'image'),
+                ('iframe', 'http://localhost:8000/media/uploads/c.mp4?t=1', '/media/uploads/c.mp4?t=1', 'video'),
+                ('a', '/media/uploads/d.pdf?x=1&y=2', '/media/uploads/d.pdf?x=1&y=2', 'file'),
+                ('a', '/media/other.txt', '/media/other.txt', None),
+            ]
+        )
+        self.assertEqual(
+            [content[r.start:r.end] for r in references[:2]],
+            ['/media/uploads/a.png', '/media/uploads/b.png']
+        )
+        
+        rewritten = ContentScanner.scan(content).rewrite(
+            content,
+            lambda r: r.with_media_url(r.media_url.replace('/uploads/', '/uploads/new/')) if r.kind else None
+        )
+        self.assertIn("src='/media/uploads/new/a.png'", rewritten)
+        self.assertIn('src="http://localhost:8000/media/uploads/new/c.mp4?t=1"', rewritten)
+        self.assertIn('href="/media/uploads/new/d.pdf?x=1&amp;y=2"', rewritten)
+        self.assertIn('<!-- <img src="/media/uploads/commented.png"> -->', rewritten)
+
+    def test_migration_extractor_matches_runtime(self):
+        """メディア参照表のデータマイグレーションが実行時と同じ規則で参照を抽出するテスト"""
+        from importlib import import_module
+
+        migration = import_module('pages.migrations.0007_page_media_references')
+        content = (
+            '<iframe class="ql-video" src="http://localhost:8000/media/uploads/c.mp4?t=1"></iframe>'
+            "<img alt='x' src='/media/uploads/a%20b.png'><IMG SRC=/media/uploads/b.png>"
+            '<a href="/media/uploads/a&amp;b.pdf">d</a><a href="/media/other.txt">o</a>'
+            '<!-- <img src="/media/uploads/commented.png"> -->'
+        )
+        self.assertEqual(migration.extract_media_paths(content), MediaReferenceExtractor.extract_paths(content))
+        self.assertEqual(migration.extract_media_paths(content)['uploads/c.mp4'], 'video')
+
+    def test_scan_cache_is_bounded_and_keyed_by_hash(self):
+        """走査結果のキャッシュが件数で制限され、コンテンツ自体を保持しないテスト"""
+        from .domain.page_aggregate import ContentScanner
+
+        content = '<img src="/media/uploads/a.png">' + 'x' * 1000
+        self.assertIs(ContentScanner.scan(content), ContentScanner.scan(content))
+        for index in range(ContentScanner.CACHE_SIZE * 2):
+            ContentScanner.scan(f'<p>{index}</p>')
+        self.assertEqual(len(ContentScanner._cache), ContentScanner.CACHE_SIZE)
+        self.assertTrue(all(len(key) == 16 for key in ContentScanner._cache))
+
+    def test_move_temp_uploads(self):
+        """一時アップロードの移動で、同じファイルを指すすべての属性を書き換えるテスト"""
+        from .application.page_service.media_file_service import MediaFileService
+        
+        self.use_temp_media_root(PAGE_MEDIA_LAYOUT='id')
+        (self.uploads_dir / 'temp_uploads').mkdir()
+        (self.uploads_dir / 'temp_uploads' / 'a b.png').write_bytes(b'png')
+        repository = PageRepository()
+        page = repository.save(PageEntity(
+            id=None, title='ページ', content='', parent_id=None,
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        
+        content = (
+            '<img src="/media/uploads/temp_uploads/a%20b.png">'
+            '<a href="http://localhost:8000/media/uploads/temp_uploads/a%20b.png?dl=1">a</a>'
+        )
+        updated = MediaFileService(repository).move_temp_images_to_page_folder(page.id, content, page)
+        
+        self.assertEqual(
+            updated,
+            f'<img src="/media/uploads/pages/{page.id}/a%20b.png">'
+            f'<a href="http://localhost:8000/media/uploads/pages/{page.id}/a%20b.png?dl=1">a</a>'
+        )
+        self.assertTrue((self.uploads_dir / 'pages' / str(page.id) / 'a b.png').is_file())
+
+
+class PageUrlRewriteTest(TempMediaRootMixin, TestCase):
+    """フォルダ変更後のコンテンツURL書き換えのテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root()
+        repository = PageRepository()
+        self.root = repository.save(PageEntity(
+            id=None, title='ルート', content='', parent_id=None, order=10,
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.child = repository.save(PageEntity(
+            id=None, title='子', content='', parent_id=self.root.id, order=10,
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.old_url = f'/media/uploads/5_page_{self.root.id}_ルート/5_page_{self.child.id}_子/a.png'
+        self.referrer = repository.save(PageEntity(
+            id=None, title='参照元', parent_id=None, order=20,
+            content=f'<img src="{self.old_url}"><a href="/media/uploads/page_{self.root.id}/doc.pdf">doc</a>',
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.unrelated = repository.save(PageEntity(
+            id=None, title='無関係', parent_id=None, order=30,
+            content='<img src="/media/uploads/30_page_0_x/b.png">',
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        (self.uploads_dir / f'10_page_{self.root.id}_ルート' / f'10_page_{self.child.id}_子').mkdir(parents=True)
+    
+    def test_rewriter_uses_deepest_folder(self):
+        """1つのパターンで旧形式・現形式を書き換え、最も深いフォルダを基準にするテスト"""
+        from .application.page_service.content_url_rewriter import ContentUrlRewriter
+        
+        rewriter = ContentUrlRewriter({self.root.id: 'R', self.child.id: 'R/C'})
+        content = (
+            f'<img src="{self.old_url}">'
+            f'<a href="/media/uploads/page_{self.root.id}/doc.pdf">doc</a>'
+            f'<img src="/media/uploads/1_page_{self.root.id}1_x/keep.png">'
+        )
+        self.assertEqual(
+            rewriter.rewrite(content),
+            '<img src="/media/uploads/R/C/a.png">'
+            '<a href="/media/uploads/R/doc.pdf">doc</a>'
+            f'<img src="/media/uploads/1_page_{self.root.id}1_x/keep.png">'
+        )
+    
+    def test_rewriter_does_not_span_urls(self):
+        """プレフィックスが複数のURLにまたがって一致しないテスト"""
+        from .application.page_service.content_url_rewriter import ContentUrlRewriter
+        
+        content = f'<img src="/media/uploads/other/x.png"><img src="/media/uploads/1_page_{self.child.id}_子/y.png">'
+        self.assertEqual(
+            ContentUrlRewriter({self.child.id: 'C'}).rewrite(content),
+            '<img src="/media/uploads/other/x.png"><img src="/media/uploads/C/y.png">'
+        )
+    
+    def test_update_touches_only_referencing_pages(self):
+        """参照しているページだけを読み込み、1回の一括更新で書き込むテスト"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .application.page_service.page_url_service import PageUrlService
+        from .infrastructure.unit_of_work import unit_of_work
+        
+        repository = PageRepository()
+        url_service = PageUrlService(repository, MediaService(repository))
+        with CaptureQueriesContext(connection) as queries:
+            with unit_of_work():
+                url_service.update_all_pages_content_urls({self.root.id, self.child.id})
+        
+        self.assertNotIn(self.unrelated.id, repository._identity_map)
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "pages_page"')]
+        self.assertEqual(len(updates), 1)
+        
+        root_folder = f'10_page_{self.root.id}_ルート'
+        self.assertEqual(
+            Page.objects.get(id=self.referrer.id).content,
+            f'<img src="/media/uploads/{root_folder}/10_page_{self.child.id}_子/a.png">'
+            f'<a href="/media/uploads/{root_folder}/doc.pdf">doc</a>'
+        )
+
+    def test_referencing_pages_found_by_folder_page_id(self):
+        """子孫のフォルダへの参照を LIKE の全件走査なしで見つけるテスト"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.assertEqual(
+            PageMedia.objects.get(page_id=self.referrer.id, path__endswith='a.png').folder_page_id,
+            self.child.id
+        )
+        with CaptureQueriesContext(connection) as queries:
+            page_ids = PageRepository().find_page_ids_referencing_page_folders({self.root.id})
+
+        self.assertEqual(set(page_ids), {self.referrer.id})
+        self.assertFalse(any('LIKE' in q['sql'] for q in queries.captured_queries))
+
+
+class HtmlExportQueueTest(TempMediaRootMixin, TestCase):
+    """HTML書き出しの待ち行列のテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root(HTML_EXPORT_MODE='queue', HTML_EXPORT_IN_PROCESS_WORKER=False)
+        self.service = PageApplicationService(PageRepository())
+        self.page = self.service.create_page(CreatePageDTO(title='キュー', content='<p>最初</p>'))
+        order = Page.objects.get(id=self.page.id).order
+        self.html_file = self.uploads_dir / f'{order}_page_{self.page.id}_キュー' / 'キュー.html'
+    
+    def _update(self, content):
+        self.service.update_page(UpdatePageDTO(page_id=self.page.id, title='キュー', content=content))
+    
+    def test_requests_are_coalesced(self):
+        """保存時は登録だけを行い、同じページへの要求が1件にまとまるテスト"""
+        from .application.page_service.html_export_queue import HtmlExportQueue
+        
+        self._update('<p>2回目</p>')
+        self._update('<p>3回目</p>')
+        self.assertFalse(self.html_file.exists())
+        self.assertEqual(HtmlExportTask.objects.filter(page_id=self.page.id).count(), 1)
+        
+        self.assertEqual(HtmlExportQueue().process_pending(), 1)
+        self.assertIn('3回目', self.html_file.read_text(encoding='utf-8'))
+        self.assertFalse(HtmlExportTask.objects.exists())
+    
+    def test_request_during_processing_is_kept(self):
+        """処理中に新しい要求があった場合は、完了にせず残すテスト"""
+        from .infrastructure.repositories import HtmlExportQueueRepository
+        
+        queue_repository = HtmlExportQueueRepository()
+        [(page_id, requested_at, _)] = queue_repository.claim_due(10, 300)
+        self.assertEqual(queue_repository.claim_due(10, 300), [])
+        
+        queue_repository.enqueue(page_id)
+        queue_repository.complete(page_id, requested_at)
+        self.assertEqual(len(queue_repository.claim_due(10, 300)), 1)
+    
+    def test_back_pressure_exports_synchronously(self):
+        """未処理の要求が上限に達している場合はその場で書き出すテスト"""
+        from django.test import override_settings
+        
+        with override_settings(HTML_EXPORT_QUEUE_MAX_PENDING=1):
+            self._update('<p>同期</p>')
+        self.assertIn('同期', self.html_file.read_text(encoding='utf-8'))
+    
+    def test_failed_export_is_retried(self):
+        """失敗した要求が間隔をあけて再試行され、上限で止まるテスト"""
+        import shutil
+        from django.test import override_settings
+        from .application.page_service.html_export_queue import HtmlExportQueue
+        
+        shutil.rmtree(self.html_file.parent)
+        PageFolder.objects.all().delete()
+        
+        with override_settings(HTML_EXPORT_MAX_ATTEMPTS=2):
+            queue = HtmlExportQueue()
+            self.assertEqual(queue.process_pending(), 1)
+            task = HtmlExportTask.objects.get(page_id=self.page.id)
+            self.assertEqual(task.attempts, 1)
+            self.assertFalse(task.failed)
+            # 再試行の時刻までは処理されない
+            self.assertEqual(queue.process_pending(), 0)
+            
+            HtmlExportTask.objects.update(next_attempt_at=task.requested_at)
+            queue.process_pending()
+            task.refresh_from_db()
+            self.assertTrue(task.failed)
+            
+            self.html_file.parent.mkdir()
+            self.assertEqual(queue.queue_repository.retry_failed(), 1)
+            queue.process_pending()
+        self.assertTrue(self.html_file.exists())
+        self.assertFalse(HtmlExportTask.objects.exists())
+    
+    def test_deleted_page_request_is_dropped(self):
+        """削除済みのページの要求は書き出さずに破棄するテスト"""
+        from .application.page_service.html_export_queue import HtmlExportQueue
+        
+        Page.objects.filter(id=self.page.id).delete()
+        self.assertEqual(HtmlExportQueue().process_pending(), 1)
+        self.assertFalse(HtmlExportTask.objects.exists())
+        self.assertFalse(self.html_file.exists())
+
+    def test_in_process_worker_yields_to_running_command(self):
+        """'auto' では常駐ワーカーが動いている間だけ、サーバープロセス内のワーカーを使わないテスト"""
+        import os
+        import time
+        from django.test import override_settings
+        from .application.page_service.html_export_queue import HtmlExportQueue
+
+        heartbeat = self.uploads_dir.parent / 'heartbeat'
+        with override_settings(HTML_EXPORT_IN_PROCESS_WORKER='auto', HTML_EXPORT_WORKER_HEARTBEAT_FILE=str(heartbeat)):
+            self.assertTrue(HtmlExportQueue.use_in_process_worker())
+
+            HtmlExportQueue.touch_heartbeat(1)
+            self.assertFalse(HtmlExportQueue.use_in_process_worker())
+            with self.captureOnCommitCallbacks() as callbacks:
+                self._update('<p>常駐</p>')
+            self.assertEqual(callbacks, [])
+
+            # 止まったまま残ったファイルは無視する
+            stale = time.time() - HtmlExportQueue.POLL_INTERVAL * HtmlExportQueue.HEARTBEAT_MISSES - 1
+            os.utime(heartbeat, (stale, stale))
+            self.assertTrue(HtmlExportQueue.use_in_process_worker())
+
+            HtmlExportQueue.clear_heartbeat()
+            self.assertFalse(heartbeat.exists())
+
+        with override_settings(HTML_EXPORT_IN_PROCESS_WORKER=False):
+            self.assertFalse(HtmlExportQueue.use_in_process_worker())
+
+
+class HtmlFileWriteTest(TempMediaRootMixin, TestCase):
+    """HTMLファイルの書き込み（内容が同じなら省略・一時ファイルからの置き換え）のテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root(HTML_EXPORT_MODE='sync')
+        self.service = PageApplicationService(PageRepository())
+        self.page = self.service.create_page(CreatePageDTO(title='書き込み', content='<p>最初</p>'))
+        order = Page.objects.get(id=self.page.id).order
+        self.html_file = self.uploads_dir / f'{order}_page_{self.page.id}_書き込み' / '書き込み.html'
+    
+    def _write(self):
+        from unittest import mock
+        from .application.page_service.html_generator import HtmlGenerator
+        
+        entity = PageRepository().find_by_id(self.page.id)
+        with mock.patch('os.replace', wraps=os.replace) as replace:
+            HtmlGenerator()._write_html_file(entity, self.html_file)
+        return replace.call_count
+    
+    def test_unchanged_html_is_not_rewritten(self):
+        """内容が同じ場合は書き込まないテスト"""
+        self.assertTrue(self.html_file.exists())
+        self.assertEqual(
+            ExportedHtml.objects.get().path,
+            self.html_file.relative_to(self.uploads_dir.parent).as_posix()
+        )
+        self.assertEqual(self._write(), 0)
+    
+    def test_changed_or_missing_html_is_written(self):
+        """内容が変わった場合・ファイルが消えた場合は書き込み、一時ファイルを残さないテスト"""
+        Page.objects.filter(id=self.page.id).update(content='<p>変更</p>')
+        self.assertEqual(self._write(), 1)
+        self.assertIn('変更', self.html_file.read_text(encoding='utf-8'))
+        
+        self.html_file.unlink()
+        self.assertEqual(self._write(), 1)
+        self.assertEqual([p.name for p in self.html_file.parent.iterdir()], [self.html_file.name])
+
+
+class ImageDataUriCacheTest(TempMediaRootMixin, TestCase):
+    """画像の data URI キャッシュのテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root()
+        self.image = self.uploads_dir / 'a.png'
+        self.image.write_bytes(b'first')
+        self.page = PageEntity(
+            id=1, title='画像', content='<img src="/media/uploads/a.png">', parent_id=None,
+            created_at=datetime.now(), updated_at=datetime.now()
+        )
+    
+    def test_encoding_is_cached_until_file_changes(self):
+        """同じ画像はキャッシュを使い、ファイルが変わるとエンコードし直すテスト"""
+        from .application.page_service.html_generator import HtmlGenerator
+        from .application.page_service.image_data_uri_cache import ImageDataUriCache
+        
+        cache = ImageDataUriCache(max_bytes=1024)
+        generator = HtmlGenerator(image_cache=cache)
+        generator.generate_html_content(self.page)
+        html = generator.generate_html_content(self.page)
+        self.assertIn('data:image/png;base64,Zmlyc3Q=', html)
+        self.assertEqual((cache.stats()['misses'], cache.stats()['hits']), (1, 1))
+        
+        self.image.write_bytes(b'second!')
+        self.assertIn('data:image/png;base64,c2Vjb25kIQ==', generator.generate_html_content(self.page))
+        self.assertEqual(cache.stats()['misses'], 2)
+    
+    def test_eviction_and_spill(self):
+        """上限を超えると古いものから追い出し、退避したエントリをメモリに戻すテスト"""
+        from .application.page_service.image_data_uri_cache import ImageDataUriCache
+        
+        cache = ImageDataUriCache(max_bytes=10, spill_dir=str(self.uploads_dir.parent / 'spill'), max_spill_bytes=100)
+        cache.get_or_create(('a', 1, 1), lambda: 'a' * 6)
+        cache.get_or_create(('b', 1, 1), lambda: 'b' * 6)
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions'], stats['spilled_entries']), (1, 1, 1))
+        
+        self.assertEqual(cache.get_or_create(('a', 1, 1), lambda: 'x'), 'a' * 6)
+        self.assertEqual(cache.stats()['spill_hits'], 1)
+
+
+class PageStreamingExportTest(TempMediaRootMixin, TestCase):
+    """HTMLエクスポートのストリーミングのテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root()
+        (self.uploads_dir / 'big.jpg').write_bytes(bytes(range(256)) * 5000)
+        self.page = Page.objects.create(
+            title='ストリーミング',
+            content='<p>前</p><img class="a" src="/media/uploads/big.jpg"><img src="/media/uploads/none.png"><p>後</p>'
+        )
+        self.client = Client(enforce_csrf_checks=False)
+    
+    def test_stream_matches_generated_document(self):
+        """少しずつ生成したHTMLが、まとめて生成したHTMLと一致するテスト"""
+        from unittest import mock
+        from .application.page_service.html_generator import HtmlGenerator
+        from .application.page_service.image_data_uri_cache import ImageDataUriCache
+        
+        entity = PageRepository().find_by_id(self.page.id)
+        generator = HtmlGenerator(image_cache=ImageDataUriCache(max_bytes=0))
+        with mock.patch.object(HtmlGenerator, 'STREAM_CHUNK_SIZE', 3 * 1000):
+            chunks = list(generator.iter_html_content(entity))
+        
+        self.assertGreater(len(chunks), 400)
+        self.assertEqual(''.join(chunks), generator.generate_html_content(entity))
+    
+    def test_export_view_streams(self):
+        """エクスポートのビューがストリーミングで返すテスト"""
+        response = self.client.get(reverse('pages:export_page_html', args=[self.page.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('src="data:image/jpeg;base64,', body)
+        
+        response = self.client.get(reverse('pages:export_page_html', args=[99999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class PageArchiveTest(TempMediaRootMixin, TestCase):
+    """サブツリーのZIPエクスポートのテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root()
+        (self.uploads_dir / 'shared.png').write_bytes(b'png-data')
+        (self.uploads_dir / 'big.mp4').write_bytes(b'v' * 5000)
+        repository = PageRepository()
+        self.root = repository.save(PageEntity(
+            id=None, title='セクション', content='<img src="/media/uploads/shared.png">', parent_id=None,
+            order=10, created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.child = repository.save(PageEntity(
+            id=None, title='子', parent_id=self.root.id, order=10,
+            content='<img src="/media/uploads/shared.png"><video src="/media/uploads/big.mp4"></video>',
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.other = repository.save(PageEntity(
+            id=None, title='別', content='<img src="/media/uploads/other.png">', parent_id=None,
+            order=20, created_at=datetime.now(), updated_at=datetime.now()
+        ))
+    
+    def _read_zip(self, data):
+        import io
+        import zipfile
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        return archive
+    
+    def test_subtree_zip_contents(self):
+        """ページごとのHTMLと、参照メディアが1回だけ含まれるテスト"""
+        from unittest import mock
+        from .application.page_service.page_archive import PageArchiveService
+        
+        service = PageArchiveService(PageRepository())
+        with mock.patch.object(PageArchiveService, 'READ_AHEAD_MAX_BYTES', 1000), \
+                mock.patch.object(PageArchiveService, 'CHUNK_SIZE', 1000):
+            title, chunks = service.stream_subtree_zip(self.root.id)
+            chunks = list(chunks)
+        self.assertEqual(title, 'セクション')
+        self.assertGreater(len(chunks), 5)
+        
+        archive = self._read_zip(b''.join(chunks))
+        root_dir = f'10_page_{self.root.id}_セクション'
+        child_html = f'{root_dir}/10_page_{self.child.id}_子/子.html'
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted([f'{root_dir}/セクション.html', child_html, 'media/uploads/big.mp4', 'media/uploads/shared.png'])
+        )
+        self.assertEqual(archive.read('media/uploads/big.mp4'), b'v' * 5000)
+        self.assertIn('src="../../media/uploads/shared.png"', archive.read(child_html).decode('utf-8'))
+    
+    def test_zip_view_and_command(self):
+        """エンドポイントとコマンドでZIPを書き出すテスト"""
+        from django.core.management import call_command
+        
+        client = Client(enforce_csrf_checks=False)
+        response = client.get(reverse('pages:export_page_zip', args=[self.child.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = self._read_zip(b''.join(response.streaming_content))
+        self.assertEqual(len(archive.namelist()), 3)
+        self.assertEqual(client.get(reverse('pages:export_page_zip', args=[99999])).status_code, 404)
+        
+        output = self.uploads_dir.parent / 'out' / 'section.zip'
+        call_command('export_page_zip', self.root.id, str(output), stdout=StringIO())
+        self.assertEqual(len(self._read_zip(output.read_bytes()).namelist()), 4)
+
+
+class StaticSiteBuildTest(TempMediaRootMixin, TestCase):
+    """静的サイトの差分ビルドのテスト"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.use_temp_media_root()
+        (self.uploads_dir / 'a.png').write_bytes(b'png')
+        self.repository = PageRepository()
+        self.root = self.repository.save(PageEntity(
+            id=None, title='ルート', content='<p>root</p>', parent_id=None, order=10,
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.child = self.repository.save(PageEntity(
+            id=None, title='子', content='<img src="/media/uploads/a.png">', parent_id=self.root.id, order=10,
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        self.other = self.repository.save(PageEntity(
+            id=None, title='別', content='<p>other</p>', parent_id=None, order=20,
+            created_at=datetime.now(), updated_at=datetime.now()
+        ))
+        import tempfile
+        from pathlib import Path
+        
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output = Path(output_dir.name) / 'site'
+    
+    def _build(self, **options):
+        from .application.page_service.static_site_builder import StaticSiteBuilder
+        return StaticSiteBuilder(PageRepository()).build(self.output, **options)
+    
+    def test_full_then_incremental_build(self):
+        """初回はすべて、2回目は変更のあったページとその子孫だけを書き直すテスト"""
+        result = self._build(workers=2)
+        self.assertEqual((result['rendered'], result['media_copied']), (3, 1))
+        child_html = self.output / f'10_page_{self.root.id}_ルート' / f'10_page_{self.child.id}_子' / '子.html'
+        self.assertIn('src="../../media/uploads/a.png"', child_html.read_text(encoding='utf-8'))
+        self.assertEqual((self.output / 'media' / 'uploads' / 'a.png').read_bytes(), b'png')
+        self.assertIn('子</a>', (self.output / 'index.html').read_text(encoding='utf-8'))
+        
+        self.assertEqual(self._build()['rendered'], 0)
+        
+        # 親のタイトル変更で、親と子（出力パスが変わる）だけを書き直し、古い出力を削除する
+        Page.objects.filter(id=self.root.id).update(title='新ルート')
+        result = self._build()
+        self.assertEqual((result['rendered'], result['removed']), (2, 2))
+        self.assertFalse((self.output / f'10_page_{self.root.id}_ルート').exists())
+        self.assertTrue((self.output / f'10_page_{self.root.id}_新ルート' / f'10_page_{self.child.id}_子' / '子.html').exists())
+    
+    def test_media_change_and_removal(self):
+        """参照メディアの更新でページを書き直し、参照されなくなったメディアを削除するテスト"""
+        self._build()
+        os.utime(self.uploads_dir / 'a.png', ns=(0, 0))
+        self.assertEqual(self._build()['rendered'], 1)
+        
+        entity = self.repository.find_by_id(self.child.id)
+        entity.content = '<p>画像なし</p>'
+        self.repository.save(entity)
+        result = self._build()
+        self.assertEqual(result['media_removed'], 1)
+        self.assertFalse((self.output / 'media' / 'uploads' / 'a.png').exists())
+    
+    def test_command(self):
+        """コマンドでビルドするテスト"""
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command('build_static_site', str(self.output), '--workers', '1', stdout=out)
+        self.assertIn('書き直し 3件', out.getvalue())
+
+
+class PageIndexTest(TestCase):
+    """一覧クエリが索引を使うことのテスト（EXPLAIN QUERY PLAN）"""
+    
+    def setUp(self):
+        """各テストの前に実行される初期化処理"""
+        self.root = Page.objects.create(title='ルート', order=10)
+        Page.objects.create(title='子', parent=self.root, order=10)
+    
+    def assertUsesIndex(self, queryset, index_name):
+        """テーブルの全件走査と一時B-treeによるソートが発生しないことを検証する"""
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_children_query_uses_index(self):
+        """子ページ一覧の索引利用テスト"""
+        queryset = Page.objects.filter(parent_id=self.root.id).order_by('order', 'created_at')
+        self.assertUsesIndex(queryset, 'page_parent_order_idx')
+    
+    def test_root_pages_query_uses_index(self):
+        """ルートページ一覧（parent_id IS NULL）の索引利用テスト"""
+        queryset = Page.objects.filter(parent=None).order_by('order', 'created_at')
+        self.assertUsesIndex(queryset, 'page_parent_order_idx')
+    
+    def test_all_pages_query_uses_index(self):
+        """全ページ一覧（既定の並び順）の索引利用テスト"""
+        self.assertUsesIndex(Page.objects.all(), 'page_order_idx')
+    
+    def test_recent_pages_query_uses_index(self):
+        """更新日時順一覧の索引利用テスト"""
+        self.assertUsesIndex(Page.objects.order_by('-updated_at'), 'page_updated_at_idx')
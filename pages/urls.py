@@ -12,6 +12,7 @@ urlpatterns = [
     path('page/<int:page_id>/delete/', views.page_delete, name='page_delete'),
     path('page/<int:page_id>/move/', views.page_move, name='page_move'),
     path('page/<int:page_id>/export/html/', views.export_page_html, name='export_page_html'),
+    path('page/<int:page_id>/export/zip/', views.export_page_zip, name='export_page_zip'),
     path('page/<int:page_id>/icon/', views.page_update_icon, name='page_update_icon'),
     path('page/<int:page_id>/reorder/', views.page_reorder, name='page_reorder'),
     path('api/page/<int:page_id>/', views.api_page_detail, name='api_page_detail'),
@@ -21,5 +22,8 @@ urlpatterns = [
     path('api/upload-zip/', views.upload_zip, name='upload_zip'),
     path('api/upload-sketch/', views.upload_sketch, name='upload_sketch'),
     path('api/upload-ico/', views.upload_ico, name='upload_ico'),
+    path('api/uploads/', views.upload_session_create, name='upload_session_create'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_session_detail, name='upload_session_detail'),
     path('api/cleanup-temp-images/', views.cleanup_temp_images, name='cleanup_temp_images'),
+    path('media/uploads/<path:path>', views.serve_media, name='serve_media'),
 ]
\ No newline at end of file
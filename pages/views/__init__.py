@@ -7,7 +7,7 @@ from .page_views import index, page_create, page_update, page_delete
 from .page_operations import page_move, page_update_icon, page_reorder
 
 # エクスポート
-from .export_views import export_page_html
+from .export_views import export_page_html, export_page_zip
 
 # API
 from .api_views import api_page_detail
@@ -20,9 +20,14 @@ from .upload_views import (
     upload_zip,
     upload_sketch,
     upload_ico,
+    upload_session_create,
+    upload_session_detail,
     cleanup_temp_images,
 )
 
+# メディア配信
+from .media_views import serve_media
+
 __all__ = [
     # ページCRUD
     'index',
@@ -35,6 +40,7 @@ __all__ = [
     'page_reorder',
     # エクスポート
     'export_page_html',
+    'export_page_zip',
     # API
     'api_page_detail',
     # ファイルアップロード
@@ -44,5 +50,9 @@ __all__ = [
     'upload_zip',
     'upload_sketch',
     'upload_ico',
+    'upload_session_create',
+    'upload_session_detail',
     'cleanup_temp_images',
+    # メディア配信
+    'serve_media',
 ]
@@ -1,30 +1,55 @@
 """エクスポート関連ビュー"""
 
 import re
-from django.http import HttpResponse, Http404
+from django.http import StreamingHttpResponse, Http404
 
 from .utils import _get_service
 
 
 def export_page_html(request, page_id):
-    """ページを埋め込み画像付きの単一 HTML としてエクスポート"""
+    """ページを埋め込み画像付きの単一 HTML としてエクスポート
+    
+    画像をファイルから少しずつ base64 にしながら送信するため、
+    画像の多いページでもメモリ上にドキュメント全体を持たない。
+    """
     service = _get_service()
-    html_content = service.export_page_as_html(page_id)
+    result = service.stream_page_as_html(page_id)
     
-    if html_content is None:
+    if result is None:
         raise Http404('ページが見つかりません')
     
     # ダウンロード用のファイル名にページタイトルを使用
-    page = service.get_page_detail(page_id)
-    filename = f'{page.title}.html' if page else f'page_{page_id}.html'
+    title, html_chunks = result
+    filename = f'{title}.html'
     
     # ファイル名をサニタイズ
     filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
     
-    response = HttpResponse(
-        html_content,
+    response = StreamingHttpResponse(
+        html_chunks,
         content_type='text/html; charset=utf-8'
     )
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
-    return response
\ No newline at end of file
+    return response
+
+
+def export_page_zip(request, page_id):
+    """ページとその子孫を ZIP としてエクスポート
+    
+    ページごとのHTMLと、参照しているメディアファイル（1回だけ格納）を含む。
+    ZIPは書き込みながら送信するため、アーカイブ全体をメモリや一時ファイルに持たない。
+    """
+    service = _get_service()
+    result = service.stream_page_subtree_zip(page_id)
+    
+    if result is None:
+        raise Http404('ページが見つかりません')
+    
+    title, zip_chunks = result
+    filename = re.sub(r'[<>:"/\\|?*]', '_', f'{title}.zip')
+    
+    response = StreamingHttpResponse(zip_chunks, content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    
+    return response
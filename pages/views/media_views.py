@@ -0,0 +1,166 @@
+"""アップロードされたメディアの配信ビュー"""
+
+import mimetypes
+import os
+import re
+import urllib.parse
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_http_methods
+
+from pages.application.page_service.media_blob_store import MediaBlobStore
+
+# 内容が変わらない blob（ハッシュがファイル名）のキャッシュ期間
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+def _make_etag(file_path: Path, stat: os.stat_result, is_blob: bool) -> str:
+    """強い ETag（blob は内容のハッシュ、それ以外は inode・サイズ・更新日時から作る）"""
+    if is_blob:
+        return f'"{file_path.stem}"'
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _parse_range(header: str, size: int):
+    """Range ヘッダー（単一の bytes 範囲）を (開始, 終了) に変換する
+
+    ヘッダーを解釈できない・複数の範囲の場合は None（ファイル全体を返す）、
+    範囲がファイルの外にある場合（空のファイルではすべての範囲）は ValueError。
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if size == 0:
+        raise ValueError('空のファイルです')
+    if not first:
+        # bytes=-500: 末尾の500バイト
+        length = int(last)
+        if length == 0:
+            raise ValueError('範囲が空です')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError('範囲がファイルの外です')
+    return start, end
+
+
+def _if_range_matches(request, etag: str, last_modified: int) -> bool:
+    """If-Range がない、または現在のファイルと一致するか（一致しなければ範囲を無視して全体を返す）"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _guess_content_type(file_path: Path) -> str:
+    """拡張子から Content-Type を推測する"""
+    return mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+
+
+def _iter_range(file_path: Path, start: int, length: int):
+    """ファイルの start から length バイトを少しずつ読む"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _sendfile_response(file_path: Path, relative_path: str) -> HttpResponse:
+    """ファイルの送信を前段のサーバー（nginx の X-Accel-Redirect / Apache の X-Sendfile）に任せる応答
+
+    Range への応答も前段のサーバーが行う。
+    """
+    response = HttpResponse(content_type=_guess_content_type(file_path))
+    if getattr(settings, 'MEDIA_SENDFILE', '') == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + urllib.parse.quote(relative_path)
+    else:
+        response['X-Sendfile'] = str(file_path)
+    return response
+
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """/media/uploads/ のファイルを配信する
+
+    - Range（単一の bytes 範囲）に 206 で応答する（動画のシークで最初から読み直さない）
+    - ETag・Last-Modified を付け、If-None-Match・If-Modified-Since には 304 で応答する
+    - blob（MEDIA_DEDUP）は内容が変わらないため1年、それ以外は MEDIA_CACHE_MAX_AGE の間キャッシュさせる
+    - MEDIA_SENDFILE を指定すると、ファイルの送信を前段のサーバーに任せる
+    """
+    uploads_dir = Path(settings.MEDIA_ROOT) / 'uploads'
+    # 受け取り中・分割アップロード中の一時ファイル（.staging/・.part）は配信しない
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404('ファイルが見つかりません')
+    try:
+        file_path = Path(safe_join(uploads_dir, path))
+        stat = file_path.stat()
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('ファイルが見つかりません')
+    if not file_path.is_file():
+        raise Http404('ファイルが見つかりません')
+
+    relative_path = f'uploads/{path}'
+    is_blob = MediaBlobStore().is_blob_path(relative_path)
+    etag = _make_etag(file_path, stat, is_blob)
+    last_modified = int(stat.st_mtime)
+
+    def with_validators(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        if is_blob:
+            patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_CACHE_MAX_AGE', 24 * 60 * 60))
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return with_validators(not_modified)
+
+    if getattr(settings, 'MEDIA_SENDFILE', ''):
+        return with_validators(_sendfile_response(file_path, relative_path))
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return with_validators(response)
+
+    if byte_range is None:
+        return with_validators(FileResponse(open(file_path, 'rb')))
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _iter_range(file_path, start, length),
+        status=206,
+        content_type=_guess_content_type(file_path),
+    )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return with_validators(response)
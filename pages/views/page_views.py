@@ -13,7 +13,8 @@ from .utils import _get_service
 def index(request):
     """インデックスページ：ページツリーを表示"""
     service = _get_service()
-    tree_data = service.get_page_tree()
+    # サイドバーはid/title/icon/childrenのみ使用するため、contentは読み込まない
+    tree_data = service.get_page_tree(include_content=False)
     return render(request, 'pages/index.html', tree_data)
 
 
@@ -1,14 +1,30 @@
 """ファイルアップロード関連ビュー"""
 
+import logging
 import os
 import re
 import uuid
+from functools import wraps
+from pathlib import Path
 from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.decorators.http import require_http_methods
-from django.core.files.storage import default_storage
 from django.conf import settings
-from pages.infrastructure.repositories import PageRepository
+from pages.domain.page_aggregate import ContentScanner, MediaReferenceExtractor
+from pages.domain.temp_upload import TempUploadEntity
+from pages.infrastructure.repositories import PageRepository, TempUploadRepository
+from pages.infrastructure.upload_handlers import MediaStagingUploadHandler
 from pages.application.page_service.media_service import MediaService
+from pages.application.page_service.media_blob_store import MediaBlobStore
+from pages.application.page_service.upload_name_allocator import UploadNameAllocator
+from pages.application.page_service.chunked_upload_service import (
+    ChunkedUploadService,
+    UploadOffsetMismatch,
+    UploadSessionGone,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def _get_page_folder_path(page_id: int) -> str:
@@ -19,6 +35,133 @@ def _get_page_folder_path(page_id: int) -> str:
     return str(folder_path).replace('\\', '/')
 
 
+# 新規作成モーダル（page_id='temp'）からのアップロードの保存先（uploads/ からのパス）
+TEMP_UPLOAD_FOLDER = 'temp_uploads'
+
+# アップロードの種類ごとの制限（allowed_types: MIMEタイプ, allowed_extensions: 拡張子, max_size: 上限バイト数,
+# use_original_name: 元のファイル名で保存するか（False ならUUIDのファイル名））
+UPLOAD_RULES = {
+    'image': {
+        'allowed_types': ['image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/svg+xml'],
+        'allowed_extensions': ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg'],
+        'max_size': 5 * 1024 * 1024,  # 5MB
+        'use_original_name': False,
+    },
+    'video': {
+        'allowed_types': ['video/mp4', 'video/webm', 'video/ogg', 'video/quicktime'],
+        'allowed_extensions': ['.mp4', '.webm', '.ogg', '.mov'],
+        'max_size': 250 * 1024 * 1024,  # 250MB
+        'use_original_name': False,
+    },
+    'excel': {
+        'allowed_types': [
+            'application/vnd.ms-excel',
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            'application/vnd.ms-excel.sheet.macroEnabled.12',
+        ],
+        'allowed_extensions': ['.xls', '.xlsx', '.xlsm'],
+        'max_size': 50 * 1024 * 1024,  # 50MB
+        'use_original_name': True,
+    },
+    'zip': {
+        'allowed_types': ['application/zip', 'application/x-zip-compressed', 'application/x-zip'],
+        'allowed_extensions': ['.zip'],
+        'max_size': 100 * 1024 * 1024,  # 100MB
+        'use_original_name': True,
+    },
+    'sketch': {
+        'allowed_types': [],
+        'allowed_extensions': ['.sketch'],
+        'max_size': 100 * 1024 * 1024,  # 100MB
+        'use_original_name': True,
+    },
+    'ico': {
+        'allowed_types': [],
+        'allowed_extensions': ['.ico'],
+        'max_size': 10 * 1024 * 1024,  # 10MB
+        'use_original_name': True,
+    },
+}
+
+
+def _resolve_upload_folder(page_id: str):
+    """page_id（'temp' またはページID）から (uploads/ からのフォルダパス, ページID) を求める（無効なら ValueError）"""
+    # 新規作成モーダルの場合は一時フォルダを使用
+    if page_id == 'temp':
+        return TEMP_UPLOAD_FOLDER, None
+    try:
+        page_id_int = int(page_id)
+    except ValueError:
+        raise ValueError('無効なページIDです')
+    # ページの階層構造フォルダパスを取得
+    return _get_page_folder_path(page_id_int), page_id_int
+
+
+def _validate_file(name: str, content_type: str, size: int, allowed_types: list, allowed_extensions: list, max_size: int):
+    """ファイル種別とサイズを検証し、エラーメッセージを返す（問題なければ None）"""
+    file_extension = os.path.splitext(name)[1].lower()
+    if content_type not in allowed_types and file_extension not in allowed_extensions:
+        return '許可されていないファイル形式です'
+    if size > max_size:
+        size_mb = max_size / (1024 * 1024)
+        return f'ファイルサイズは{size_mb}MB以下にしてください'
+    return None
+
+
+def _generate_filename(name: str, use_original_name: bool) -> str:
+    """保存するファイル名を生成する（重複した場合の番号付けは保存時に UploadNameAllocator が行う）"""
+    file_extension = os.path.splitext(name)[1].lower()
+    if use_original_name:
+        # 元のファイル名を取得し、危険な文字をサニタイズ
+        name_without_ext, ext = os.path.splitext(name)
+        safe_name = re.sub(r'[<>:"/\\|?*]', '_', name_without_ext)
+        return safe_name + (ext or file_extension)
+    
+    # UUIDベースのファイル名
+    ext = os.path.splitext(name)[1] or file_extension
+    return f"{uuid.uuid4()}{ext}"
+
+
+def _build_file_url(request, file_key: str, saved_path: str) -> str:
+    """保存したファイル（MEDIA_ROOT からの相対パス）のURL"""
+    if file_key == 'image':
+        # 画像は相対パス（階層構造のパス、または blob のパス）
+        return '/media/' + saved_path.replace('\\', '/')
+    # その他は絶対URL
+    return request.build_absolute_uri(settings.MEDIA_URL + saved_path)
+
+
+def _register_temp_upload(request, saved_path: str, kind: str, original_name: str, size: int) -> None:
+    """一時フォルダ（temp_uploads/）に保存したファイルを登録する（モーダルを閉じたときの掃除に使う）"""
+    if not saved_path.startswith(f'uploads/{TEMP_UPLOAD_FOLDER}/'):
+        return
+    if request.session.session_key is None:
+        request.session.save()
+        # 応答でセッションのクッキーを送る
+        request.session.modified = True
+    TempUploadRepository().register(TempUploadEntity(
+        media_path=saved_path,
+        kind=kind,
+        original_name=original_name,
+        size=size,
+        uploader=request.session.session_key,
+    ))
+
+
+def stage_uploads(view_func):
+    """アップロードされたファイルを MEDIA_ROOT/uploads/.staging に直接受け取るビューにする
+    
+    アップロードハンドラーは本文を読み込む前に差し替える必要があるため、CSRF の検証
+    （request.POST を読み込む）はハンドラーを追加した後に行う。
+    """
+    @csrf_exempt
+    @wraps(view_func)
+    def wrapped(request, *args, **kwargs):
+        request.upload_handlers.insert(0, MediaStagingUploadHandler(request))
+        return csrf_protect(view_func)(request, *args, **kwargs)
+    return wrapped
+
+
 def _validate_and_save_file(
     request,
     file_key: str,
@@ -35,69 +178,32 @@ def _validate_and_save_file(
     if not page_id:
         return JsonResponse({'error': 'ページIDが必要です'}, status=400)
     
-    # 新規作成モーダルの場合は一時フォルダを使用
-    is_temp = (page_id == 'temp')
-    
-    if is_temp:
-        # 一時フォルダに保存
-        folder_path = 'temp_uploads'
-    else:
-        try:
-            page_id_int = int(page_id)
-        except ValueError:
-            return JsonResponse({'error': '無効なページIDです'}, status=400)
-        
-        # ページの階層構造フォルダパスを取得
-        folder_path = _get_page_folder_path(page_id_int)
+    try:
+        folder_path, _ = _resolve_upload_folder(page_id)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
     file = request.FILES[file_key]
     
-    # ファイル種別の検証
-    file_extension = os.path.splitext(file.name)[1].lower()
-    
-    if file.content_type not in allowed_types and file_extension not in allowed_extensions:
-        return JsonResponse({'error': '許可されていないファイル形式です'}, status=400)
-    
-    # ファイルサイズの検証
-    if file.size > max_size:
-        size_mb = max_size / (1024 * 1024)
-        return JsonResponse({'error': f'ファイルサイズは{size_mb}MB以下にしてください'}, status=400)
-    
-    # ファイル名を生成
-    if use_original_name:
-        # 元のファイル名を取得し、危険な文字をサニタイズ
-        original_filename = file.name
-        name_without_ext, ext = os.path.splitext(original_filename)
-        safe_name = re.sub(r'[<>:"/\\|?*]', '_', name_without_ext)
-        safe_filename = safe_name + (ext or file_extension)
-        
-        # 同じファイル名が既に存在する場合、重複を避けるために番号を追加
-        filepath = os.path.join('uploads', folder_path, safe_filename)
-        counter = 1
-        while default_storage.exists(filepath):
-            safe_filename = f"{safe_name}_{counter}{ext or file_extension}"
-            filepath = os.path.join('uploads', folder_path, safe_filename)
-            counter += 1
-    else:
-        # UUIDベースのファイル名
-        ext = os.path.splitext(file.name)[1] or file_extension
-        filename = f"{uuid.uuid4()}{ext}"
-        filepath = os.path.join('uploads', folder_path, filename)
+    # ファイル種別・サイズの検証
+    error = _validate_file(file.name, file.content_type, file.size, allowed_types, allowed_extensions, max_size)
+    if error:
+        return JsonResponse({'error': error}, status=400)
     
     # 保存
-    saved_path = default_storage.save(filepath, file)
-    
-    # URL を返却
-    if file_key == 'image':
-        # 画像は相対パス（階層構造のパスを使用）
-        file_url = f'/media/uploads/{folder_path}/{os.path.basename(saved_path)}'
+    blob_store = MediaBlobStore()
+    if blob_store.enabled:
+        # 内容アドレス方式：同じ内容のファイルは1つの blob にまとめる（ページフォルダ・一時フォルダには置かない）
+        saved_path = blob_store.save(file, os.path.splitext(file.name)[1])
     else:
-        # その他は絶対URL
-        file_url = request.build_absolute_uri(settings.MEDIA_URL + saved_path)
+        # 同じ名前のファイルがあれば番号を付けた名前を原子的に確保して保存する
+        filename = _generate_filename(file.name, use_original_name)
+        saved_path = UploadNameAllocator().save(file, f'uploads/{folder_path}', filename)
+        _register_temp_upload(request, saved_path, file_key, file.name, file.size)
     
     result = {
         'success': True,
-        'url': file_url
+        'url': _build_file_url(request, file_key, saved_path)
     }
     
     if use_original_name:
@@ -107,242 +213,194 @@ def _validate_and_save_file(
 
 
 @require_http_methods(["POST"])
+@stage_uploads
 def upload_image(request):
     """リッチテキストエディタ用：画像アップロード"""
-    return _validate_and_save_file(
-        request,
-        file_key='image',
-        allowed_types=['image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/svg+xml'],
-        allowed_extensions=['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg'],
-        max_size=5 * 1024 * 1024,  # 5MB
-        use_original_name=False
-    )
+    return _validate_and_save_file(request, file_key='image', **UPLOAD_RULES['image'])
 
 
 @require_http_methods(["POST"])
+@stage_uploads
 def upload_video(request):
     """リッチテキストエディタ用：動画アップロード"""
-    return _validate_and_save_file(
-        request,
-        file_key='video',
-        allowed_types=['video/mp4', 'video/webm', 'video/ogg', 'video/quicktime'],
-        allowed_extensions=['.mp4', '.webm', '.ogg', '.mov'],
-        max_size=250 * 1024 * 1024,  # 250MB
-        use_original_name=False
-    )
+    return _validate_and_save_file(request, file_key='video', **UPLOAD_RULES['video'])
 
 
 @require_http_methods(["POST"])
+@stage_uploads
 def upload_excel(request):
     """リッチテキストエディタ用：エクセルファイルアップロード"""
-    return _validate_and_save_file(
-        request,
-        file_key='excel',
-        allowed_types=[
-            'application/vnd.ms-excel',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'application/vnd.ms-excel.sheet.macroEnabled.12',
-        ],
-        allowed_extensions=['.xls', '.xlsx', '.xlsm'],
-        max_size=50 * 1024 * 1024,  # 50MB
-        use_original_name=True
-    )
+    return _validate_and_save_file(request, file_key='excel', **UPLOAD_RULES['excel'])
 
 
 @require_http_methods(["POST"])
+@stage_uploads
 def upload_zip(request):
     """リッチテキストエディタ用：ZIPファイルアップロード"""
-    return _validate_and_save_file(
-        request,
-        file_key='zip',
-        allowed_types=['application/zip', 'application/x-zip-compressed', 'application/x-zip'],
-        allowed_extensions=['.zip'],
-        max_size=100 * 1024 * 1024,  # 100MB
-        use_original_name=True
-    )
+    return _validate_and_save_file(request, file_key='zip', **UPLOAD_RULES['zip'])
 
 
 @require_http_methods(["POST"])
+@stage_uploads
 def upload_sketch(request):
     """リッチテキストエディタ用：Sketchファイルアップロード"""
-    return _validate_and_save_file(
-        request,
-        file_key='sketch',
-        allowed_types=[],
-        allowed_extensions=['.sketch'],
-        max_size=100 * 1024 * 1024,  # 100MB
-        use_original_name=True
-    )
+    return _validate_and_save_file(request, file_key='sketch', **UPLOAD_RULES['sketch'])
 
 
 @require_http_methods(["POST"])
+@stage_uploads
 def upload_ico(request):
     """リッチテキストエディタ用：ICOファイルアップロード"""
-    return _validate_and_save_file(
-        request,
-        file_key='ico',
-        allowed_types=[],
-        allowed_extensions=['.ico'],
-        max_size=10 * 1024 * 1024,  # 10MB
-        use_original_name=True
+    return _validate_and_save_file(request, file_key='ico', **UPLOAD_RULES['ico'])
+
+
+def _upload_session_response(request, session, status=200):
+    """分割アップロードのセッションの状態（完了していれば保存したファイルのURLを含む）"""
+    result = {
+        'success': True,
+        'upload_id': session.upload_id,
+        'offset': session.offset,
+        'size': session.size,
+    }
+    if session.is_complete:
+        result['url'] = _build_file_url(request, session.kind, session.completed_path)
+        if UPLOAD_RULES[session.kind]['use_original_name']:
+            result['filename'] = session.original_name
+    return JsonResponse(result, status=status)
+
+
+@require_http_methods(["POST"])
+def upload_session_create(request):
+    """分割アップロードを開始する
+    
+    リクエスト（JSON）: kind（image/video/excel/zip/sketch/ico）, page_id（'temp' またはページID）,
+    filename, size, content_type
+    続けて PUT /api/uploads/<upload_id>/ でチャンクを送る（Upload-Offset ヘッダーに開始位置を指定）。
+    """
+    import json
+    
+    try:
+        body = json.loads(request.body)
+        kind = body.get('kind')
+        name = os.path.basename(str(body.get('filename') or ''))
+        size = int(body.get('size'))
+        content_type = str(body.get('content_type') or '')
+    except (ValueError, TypeError):
+        return JsonResponse({'error': '無効なリクエストです'}, status=400)
+    
+    if kind not in UPLOAD_RULES:
+        return JsonResponse({'error': '無効なアップロードの種類です'}, status=400)
+    if not name or size <= 0:
+        return JsonResponse({'error': 'ファイル名とサイズが必要です'}, status=400)
+    page_id = str(body.get('page_id') or '')
+    if not page_id:
+        return JsonResponse({'error': 'ページIDが必要です'}, status=400)
+    
+    rule = UPLOAD_RULES[kind]
+    error = _validate_file(name, content_type, size, rule['allowed_types'], rule['allowed_extensions'], rule['max_size'])
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
+    try:
+        _, page_id_int = _resolve_upload_folder(page_id)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    upload_service = ChunkedUploadService()
+    session = upload_service.create(
+        kind, page_id_int, _generate_filename(name, rule['use_original_name']), name, size
     )
+    response = _upload_session_response(request, session, status=201)
+    response['Location'] = reverse('pages:upload_session_detail', args=[session.upload_id])
+    response['Upload-Chunk-Size'] = str(upload_service.chunk_size)
+    return response
+
+
+@require_http_methods(["GET", "PUT", "DELETE"])
+def upload_session_detail(request, upload_id):
+    """分割アップロードの状態の取得（GET）・チャンクの送信（PUT）・中止（DELETE）
+    
+    PUT の本文はチャンクのバイト列そのもので、Upload-Offset ヘッダー（または ?offset=）に開始位置を指定する。
+    開始位置がサーバーの受信済みの位置と異なる場合は 409 と受信済みの位置を返すので、そこから送り直す。
+    """
+    upload_service = ChunkedUploadService()
+    session = upload_service.find(str(upload_id))
+    if session is None:
+        return JsonResponse({'error': 'アップロードが見つかりません'}, status=404)
+    
+    if request.method == 'GET':
+        return _upload_session_response(request, session)
+    
+    if request.method == 'DELETE':
+        upload_service.abort(session)
+        return JsonResponse({'success': True})
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.GET.get('offset', '')))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset と Content-Length が必要です'}, status=400)
+    
+    try:
+        # 本文は読みながらそのまま一時ファイルに書き込む（request.body に溜めない）
+        session = upload_service.append(session, offset, request, length)
+    except UploadOffsetMismatch as e:
+        return JsonResponse({'error': str(e), 'offset': e.offset}, status=409)
+    except UploadSessionGone as e:
+        return JsonResponse({'error': str(e)}, status=410)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if session.is_complete:
+        _register_temp_upload(request, session.completed_path, session.kind, session.original_name, session.size)
+    return _upload_session_response(request, session)
 
 
 @require_http_methods(["POST"])
 def cleanup_temp_images(request):
-    """一時フォルダの未使用メディアファイルを全て削除する（temp_uploadsとpage_tempの両方に対応）"""
+    """新規作成モーダルを閉じたときに、このセッションから一時フォルダにアップロードされた未使用のファイルを削除する
+    
+    削除の対象は一時アップロードの登録（TempUpload）から検索する（フォルダは一覧しない）。
+    リクエスト（JSON）の content で使われているファイルと、保存済みのいずれかのページから
+    参照されているファイルは削除しない。登録のない古いファイルは cleanup_temp_files で削除する。
+    """
     import json
-    from django.core.files.storage import default_storage
-    import re
-    import os
-    import urllib.parse
     
     try:
-        # リクエストボディからJSONを取得
         body = json.loads(request.body)
         content_html = body.get('content', '')
-        
-        print(f"DEBUG: Content HTML length: {len(content_html)}")
-        print(f"DEBUG: Content HTML (first 500 chars): {content_html[:500]}")
-        
-        # 使用されているメディアファイル名を抽出
-        # 画像と動画の両方に対応（src属性またはhref属性）
-        used_files = set()
-        used_files_lower = set()  # 大文字小文字を区別しない比較用
-        
-        # パターン: /media/uploads/temp_uploads/ または /media/uploads/page_temp/ で始まるURL
-        patterns = [
-            r'/media/uploads/temp_uploads/([^"\'>\s?#]+)',  # temp_uploadsフォルダ
-            r'/media/uploads/page_temp/([^"\'>\s?#]+)',     # page_tempフォルダ
-        ]
-        
-        for pattern in patterns:
-            for match in re.finditer(pattern, content_html):
-                filename = match.group(1)
-                # URLデコード（必要に応じて）
-                try:
-                    filename = urllib.parse.unquote(filename)
-                    # パスセパレータが含まれている場合は最後のファイル名のみを取得
-                    if '/' in filename:
-                        filename = filename.split('/')[-1]
-                    if '\\' in filename:
-                        filename = filename.split('\\')[-1]
-                except:
-                    pass
-                if filename:
-                    used_files.add(filename)
-                    # 大文字小文字を区別しない比較用にも追加
-                    used_files_lower.add(filename.lower())
-        
-        print(f"DEBUG: Found {len(used_files)} used files: {list(used_files)[:10]}")  # 最初の10個を表示
-        
-        deleted_count = 0
-        
-        # 削除対象フォルダのリスト
-        temp_folders = [
-            ('temp_uploads', 'uploads/temp_uploads'),
-            ('page_temp', 'uploads/page_temp')
-        ]
-        
-        for folder_name, folder_path in temp_folders:
-            try:
-                temp_dir = default_storage.path(folder_path)
-            except Exception:
-                # default_storage.pathが使えない場合、直接パスを構築
-                temp_dir = os.path.join(settings.MEDIA_ROOT, folder_path)
-            
-            print(f"DEBUG: Checking folder: {temp_dir}")
-            
-            if not os.path.exists(temp_dir):
-                print(f"DEBUG: Folder does not exist: {temp_dir}")
-                continue
-                
-            if not os.path.isdir(temp_dir):
-                print(f"DEBUG: Not a directory: {temp_dir}")
-                continue
-            
-            files_in_folder = os.listdir(temp_dir)
-            print(f"DEBUG: Found {len(files_in_folder)} items in {folder_name}")
-            
-            for filename in files_in_folder:
-                file_path = os.path.join(temp_dir, filename)
-                
-                # ディレクトリはスキップ
-                if os.path.isdir(file_path):
-                    print(f"DEBUG: Skipping directory: {filename}")
-                    continue
-                
-                # .htmlファイルはスキップ（ページファイル）
-                if filename.endswith('.html'):
-                    print(f"DEBUG: Skipping HTML file: {filename}")
-                    continue
-                
-                # ファイル名が使用されていないかチェック
-                should_delete = True
-                
-                # コンテンツが空の場合は、すべてのファイルを削除対象とする
-                if not content_html or not content_html.strip():
-                    should_delete = True
-                    print(f"DEBUG: Content is empty, marking for deletion: {filename}")
-                else:
-                    # 使用されているファイル名のセットと比較（大文字小文字を考慮）
-                    if filename in used_files:
-                        should_delete = False
-                        print(f"DEBUG: File {filename} is in used_files (exact match)")
-                    # 大文字小文字を区別しない比較
-                    elif filename.lower() in used_files_lower:
-                        should_delete = False
-                        print(f"DEBUG: File {filename} is in used_files_lower (case-insensitive match)")
-                    else:
-                        # URLエンコードされたバージョンもチェック
-                        encoded_filename = urllib.parse.quote(filename, safe='')
-                        if encoded_filename in used_files:
-                            should_delete = False
-                            print(f"DEBUG: File {filename} matches encoded version in used_files")
-                        elif encoded_filename.lower() in used_files_lower:
-                            should_delete = False
-                            print(f"DEBUG: File {filename} matches encoded version in used_files_lower")
-                        else:
-                            # URLデコードされたバージョンと比較（使用ファイルリスト内で）
-                            matched = False
-                            for used_file in used_files:
-                                try:
-                                    decoded_used = urllib.parse.unquote(used_file)
-                                    # 大文字小文字を区別しない比較
-                                    if filename.lower() == decoded_used.lower() or filename.lower() == used_file.lower():
-                                        should_delete = False
-                                        matched = True
-                                        print(f"DEBUG: File {filename} matches used_file {used_file} after decode")
-                                        break
-                                except:
-                                    pass
-                            if not matched:
-                                print(f"DEBUG: File {filename} not matched, will be deleted")
-                
-                # 使用されていないファイルを削除
-                if should_delete:
-                    try:
-                        os.remove(file_path)
-                        deleted_count += 1
-                        print(f"✓ Deleted: {file_path} (filename: {filename})")
-                    except Exception as e:
-                        print(f"✗ Warning: Failed to delete {file_path}: {e}")
-                else:
-                    print(f"  Kept: {filename}")
-        
-        # デバッグ情報
-        print(f"DEBUG SUMMARY: Used files count: {len(used_files)}, Deleted files count: {deleted_count}")
-        
-        return JsonResponse({
-            'success': True,
-            'deleted_count': deleted_count
-        })
-            
-    except Exception as e:
-        import traceback
-        print(f"✗ Error in cleanup_temp_images: {e}")
-        print(traceback.format_exc())
-        return JsonResponse({
-            'success': False,
-            'error': str(e)
-        }, status=400)
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': '無効なリクエストです'}, status=400)
+    
+    uploader = request.session.session_key
+    registry = TempUploadRepository()
+    uploads = registry.find_by_uploader(uploader) if uploader else []
+    if not uploads:
+        return JsonResponse({'success': True, 'deleted_count': 0})
+    
+    # モーダルのコンテンツで使われているファイル（src/href）
+    used_paths = {
+        MediaReferenceExtractor.to_media_path(reference.media_url)
+        for reference in ContentScanner.scan(content_html).temp_upload_references()
+    }
+    # 保存済みのいずれかのページから参照されているファイル（メディア参照表の索引検索）
+    used_paths |= PageRepository().find_media_paths_with_prefix(f'uploads/{TEMP_UPLOAD_FOLDER}/')
+    
+    media_root = Path(settings.MEDIA_ROOT)
+    deleted_paths = []
+    for upload in uploads:
+        if upload.media_path in used_paths:
+            continue
+        try:
+            (media_root / upload.media_path).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("Failed to delete temp upload %s: %s", upload.media_path, e)
+            continue
+        deleted_paths.append(upload.media_path)
+    registry.delete(deleted_paths)
+    
+    logger.debug("Deleted %d unused temp uploads", len(deleted_paths))
+    return JsonResponse({
+        'success': True,
+        'deleted_count': len(deleted_paths)
+    })